@@ -64,6 +64,10 @@ async def get_analytics(
         for row in r.scalars().all()
     ]
 
+    # Only report cache counters if the store is already loaded (don't load models here)
+    from backend.api.endpoints import rag
+    caches = rag._vector_store.cache_stats() if rag._vector_store is not None else None
+
     return {
         "queries_today": queries_today,
         "total_queries": total_queries,
@@ -71,4 +75,5 @@ async def get_analytics(
         "failed_queries": failed,
         "top_questions": top_questions,
         "recent_logs": recent,
+        "embedding_caches": caches,
     }
\ No newline at end of file
@@ -1,14 +1,14 @@
 import os
-import json
-import shutil
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from backend.core.config import settings
 from backend.core.limiter import limiter
 from backend.security.auth import get_current_admin_user
+from backend.engine.vector_store import generation_lock
 from ingestion.ingest import ingest_data_directory
 from ingestion.loaders.pdf import PDFLoader
 from ingestion.loaders.docx import DOCXLoader
@@ -18,6 +18,8 @@ from ingestion.chunker import SemanticChunker
 router = APIRouter()
 
 DATA_DIR = os.path.join(settings.BASE_DIR, "data")
+# Uploads are parsed here, then moved into DATA_DIR under the generation lock
+STAGING_DIR = os.path.join(DATA_DIR, ".uploads")
 ALLOWED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 ALLOWED_CONTENT_TYPES = {
     "application/pdf",
@@ -26,7 +28,6 @@ ALLOWED_CONTENT_TYPES = {
 }
 LOADER_MAP = {".pdf": PDFLoader, ".docx": DOCXLoader, ".txt": TXTLoader}
 
-
 def _safe_filename(filename: str) -> str:
     """Strip path components and return just the base filename."""
     return Path(filename).name
@@ -67,19 +68,11 @@ class FileInfo(BaseModel):
 
 
 def _count_chunks_by_source() -> dict:
-    """Read vector store metadata.json and count chunks per source filename."""
-    meta_path = os.path.join(settings.VECTOR_STORE_PATH, "metadata.json")
-    if not os.path.exists(meta_path):
-        return {}
+    """Count chunks per source filename from the metadata store's source column."""
+    from backend.api.endpoints.rag import get_vector_store
     try:
-        with open(meta_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-        counts: dict = {}
-        for item in metadata:
-            src = item.get("source", "")
-            if src:
-                counts[src] = counts.get(src, 0) + 1
-        return counts
+        vs = get_vector_store()
+        return vs.metadata.count_by_source(live=~vs.deleted)
     except Exception:
         return {}
 
@@ -117,27 +110,24 @@ async def upload_file(
     _validate_upload(file.filename, file.content_type, len(content))
 
     safe_name = _safe_filename(file.filename)
-    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(STAGING_DIR, safe_name)
     file_path = os.path.join(DATA_DIR, safe_name)
 
-    with open(file_path, "wb") as f:
+    with open(staged_path, "wb") as f:
         f.write(content)
 
     ext = Path(safe_name).suffix.lower()
     try:
-        loader = LOADER_MAP[ext](file_path)
+        loader = LOADER_MAP[ext](staged_path)
         raw_docs = loader.load()
 
         chunker = SemanticChunker()
         chunked_docs = chunker.chunk(raw_docs)
 
-        if chunked_docs:
-            from backend.api.endpoints.rag import get_vector_store, get_retriever
-            vs = get_vector_store()
-            texts = [d["content"] for d in chunked_docs]
-            metadatas = [{**d["metadata"], "content": d["content"]} for d in chunked_docs]
-            vs.add_documents(texts, metadatas)
-            get_retriever()._rebuild_bm25()
+        texts = [d["content"] for d in chunked_docs]
+        metadatas = [{**d["metadata"], "content": d["content"]} for d in chunked_docs]
+        await run_in_threadpool(_publish_upload, staged_path, file_path, texts, metadatas)
 
         return {
             "message": "File uploaded and ingested successfully",
@@ -148,8 +138,9 @@ async def upload_file(
         raise
     except Exception as e:
         # File was saved but ingestion failed — remove it to avoid orphaned files
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        for path in (staged_path, file_path):
+            if os.path.exists(path):
+                os.remove(path)
         raise HTTPException(
             status_code=500,
             detail=f"Ingestion failed: {str(e)}. File has been removed.",
@@ -162,17 +153,57 @@ async def delete_file(filename: str, current_user: dict = Depends(get_current_ad
     file_path = os.path.join(DATA_DIR, safe_name)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
-    os.remove(file_path)
-    return {"message": f"File '{safe_name}' deleted. Rebuild the index to purge its vectors."}
+    removed = await run_in_threadpool(_delete_source, file_path, safe_name)
+    return {"message": f"File '{safe_name}' deleted.", "chunks_removed": removed}
+
+
+# Index writers (upload / delete / rebuild) run under generation_lock(), shared
+# by every worker process, so a write can't land in a generation that a rebuild
+# is about to replace. Queries never take it: they read whichever generation was
+# published when they started.
+
+def _publish_upload(staged_path: str, file_path: str, texts: List[str], metadatas: List[dict]):
+    """Move a parsed upload into DATA_DIR and index its chunks in the live generation."""
+    from backend.api.endpoints.rag import get_published_retriever
+    with generation_lock():
+        os.replace(staged_path, file_path)
+        if texts:
+            get_published_retriever().vector_store.add_documents(texts, metadatas)
+
+
+def _delete_source(file_path: str, safe_name: str) -> int:
+    """Remove a file from DATA_DIR and tombstone its chunks in the live generation."""
+    from backend.api.endpoints.rag import get_published_retriever
+    with generation_lock():
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return get_published_retriever().vector_store.delete_by_source(safe_name)
+
+
+def _build_generation():
+    """Ingest DATA_DIR into a fresh store generation and return its retriever (not yet published)."""
+    from backend.engine.retriever import HybridRetriever
+    from backend.engine.vector_store import VectorStore, next_store_path
+
+    path = next_store_path()
+    store = ingest_data_directory(DATA_DIR, store_path=path) or VectorStore(path)
+    store.save()  # publish a fully merged checkpoint, not a delta log
+    return HybridRetriever(store)
+
+
+def _rebuild():
+    """Build the next generation and publish it without letting a write slip in between."""
+    from backend.api.endpoints.rag import swap_retriever
+    from backend.engine.vector_store import publish_store_path
+    with generation_lock():
+        retriever = _build_generation()
+        publish_store_path(retriever.vector_store.path)
+        swap_retriever(retriever)
 
 
 @router.post("/rebuild")
 async def rebuild_index(current_user: dict = Depends(get_current_admin_user)):
-    if os.path.exists(settings.VECTOR_STORE_PATH):
-        shutil.rmtree(settings.VECTOR_STORE_PATH)
-        os.makedirs(settings.VECTOR_STORE_PATH)
-    ingest_data_directory(DATA_DIR)
-    # Reload the in-process singletons so queries immediately reflect the new index
-    from backend.api.endpoints.rag import get_retriever
-    get_retriever().reload()
+    # Blue/green: build the next generation off the event loop while queries keep
+    # using the live one, then publish it with an atomic pointer swap
+    await run_in_threadpool(_rebuild)
     return {"message": "Index rebuilt successfully"}
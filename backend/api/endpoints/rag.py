@@ -1,14 +1,16 @@
 import math
+import os
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from fastapi import APIRouter, HTTPException, Depends, Request
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import get_db
 from backend.core.limiter import limiter
 from backend.engine.retriever import HybridRetriever
-from backend.engine.vector_store import VectorStore
+from backend.engine.vector_store import VectorStore, active_store_path
 from backend.engine.llm import get_llm, LLMError
 from backend.engine.query_expander import QueryExpander
 from backend.engine.reranker import Reranker
@@ -29,22 +31,82 @@ _vector_store = None
 _retriever = None
 _reranker = None
 _expander = None
+# The startup preload and the first requests may race to build the store
+_init_lock = threading.RLock()
 
 
 def get_vector_store():
     global _vector_store
     if _vector_store is None:
-        _vector_store = VectorStore()
+        with _init_lock:
+            if _vector_store is None:
+                _vector_store = VectorStore()
     return _vector_store
 
 
 def get_retriever():
     global _retriever
     if _retriever is None:
-        _retriever = HybridRetriever(get_vector_store())
+        with _init_lock:
+            if _retriever is None:
+                _retriever = HybridRetriever(get_vector_store())
+    _check_for_updates(_retriever)
     return _retriever
 
 
+_refresh_thread: Optional[threading.Thread] = None
+
+
+def _check_for_updates(retriever: HybridRetriever):
+    """
+    Per-request version check (two stat calls). When another worker process has
+    published a new store generation or committed writes to the current one,
+    catch up in the background; this request is served from the current state.
+    """
+    global _refresh_thread
+    if _refresh_thread is not None and _refresh_thread.is_alive():
+        return
+    if os.path.normpath(active_store_path()) != os.path.normpath(retriever.vector_store.path):
+        target = _load_published_generation
+    elif retriever.vector_store.is_stale():
+        target = retriever.refresh
+    else:
+        return
+    _refresh_thread = threading.Thread(target=target, name="index-refresh", daemon=True)
+    _refresh_thread.start()
+
+
+def _load_published_generation() -> HybridRetriever:
+    path = active_store_path()
+    retriever = HybridRetriever(VectorStore(path))
+    with _init_lock:
+        swap_retriever(retriever)
+    return retriever
+
+
+def get_published_retriever() -> HybridRetriever:
+    """
+    Retriever over the published store generation, loading it in the calling
+    thread if another worker has published a rebuild since. Index writers call
+    this under generation_lock() so their writes land in the live generation.
+    """
+    retriever = get_retriever()
+    if os.path.normpath(active_store_path()) != os.path.normpath(retriever.vector_store.path):
+        retriever = _load_published_generation()
+    return retriever
+
+
+def swap_retriever(retriever: HybridRetriever):
+    """
+    Publish a fully built store + retriever. Requests that already resolved the
+    old pair keep using it until they finish; new requests get the new one.
+    """
+    global _vector_store, _retriever
+    _vector_store, _retriever = retriever.vector_store, retriever
+    if _reranker is not None:
+        _reranker.clear_cache()  # chunk ids are per store generation
+
+
 def get_reranker():
     global _reranker
     if _reranker is None:
@@ -59,11 +121,29 @@ def get_expander():
     return _expander
 
 
+class QueryFilters(BaseModel):
+    """Restrict retrieval to matching chunks; fields are ANDed, list entries ORed."""
+    source: Optional[List[str]] = None
+    type: Optional[List[str]] = None
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+
 class QueryRequest(BaseModel):
     query: str
-    top_k: int = 5
-    alpha: float = 0.5
+    top_k: int = Field(5, ge=1, le=50)
+    # Vector-leg weight and fusion method; None uses HYBRID_ALPHA / HYBRID_FUSION
+    alpha: Optional[float] = Field(None, ge=0.0, le=1.0)
+    fusion: Optional[Literal["rrf", "minmax", "zscore", "dbsf"]] = None
+    # MMR diversification before reranking; None uses MMR_ENABLED
+    use_mmr: Optional[bool] = None
+    # Small-to-big context for the LLM; None uses CONTEXT_EXPANSION
+    context_expansion: Optional[Literal["off", "window", "parent"]] = None
     use_query_expansion: bool = True
+    # ANN recall/latency knobs — only used by HNSW (ef_search) / IVF (nprobe) indexes
+    ef_search: Optional[int] = Field(None, ge=1, le=4096)
+    nprobe: Optional[int] = Field(None, ge=1, le=4096)
+    filters: Optional[QueryFilters] = None
 
 
 def _compute_confidence(
@@ -136,23 +216,30 @@ async def query_rag(
             except LLMError:
                 pass  # LLM unreachable — proceed with original query only
 
-        # 2. Hybrid retrieval — multi-query with dedup
-        all_docs_map: Dict[Any, Dict] = {}
+        # 2. Hybrid retrieval — all variations in one batched pass, with dedup
+        all_docs_map: Dict[int, Dict] = {}
         k_per_query = 5 if body.use_query_expansion else 10
-        for q in queries_to_run:
-            for d in retriever.search(q, k=k_per_query, alpha=body.alpha):
-                doc_id = d.get("id", hash(d.get("content", "")))
-                if doc_id not in all_docs_map:
-                    all_docs_map[doc_id] = d
-
-        # 3. Rerank → top 3
-        ranked_docs = reranker.rerank(clean_query, list(all_docs_map.values()), top_k=3)
-
-        # 4. Build context
+        filters = body.filters.model_dump(exclude_none=True) if body.filters else None
+        leg_timings: Dict[str, Any] = {}
+        for docs in retriever.search_many(queries_to_run, k=k_per_query, alpha=body.alpha,
+                                          ef_search=body.ef_search, nprobe=body.nprobe,
+                                          filters=filters, timings=leg_timings, fusion=body.fusion):
+            for d in docs:
+                if d["chunk_id"] not in all_docs_map:
+                    all_docs_map[d["chunk_id"]] = d
+
+        # 3. Diversify (MMR) and rerank → top 3
+        candidates = list(all_docs_map.values())
+        if settings.MMR_ENABLED if body.use_mmr is None else body.use_mmr:
+            candidates = retriever.diversify(clean_query, candidates)
+        ranked_docs = reranker.rerank(clean_query, candidates, top_k=3)
+
+        # 4. Build context — each hit widened to its neighbours / section (small-to-big)
+        context_text = retriever.expand_context(ranked_docs, mode=body.context_expansion)
         context = (
             "\n\n".join(
-                f"Source ({d.get('id', 'unknown')}): {d.get('content', '')}"
-                for d in ranked_docs
+                f"Source ({d.get('id', 'unknown')}): {text}"
+                for d, text in zip(ranked_docs, context_text)
             )
             if ranked_docs
             else "No relevant documents found."
@@ -169,7 +256,6 @@ async def query_rag(
             raise HTTPException(status_code=503, detail=str(e))
 
         # 6. Hallucination check
-        context_text = [d.get("content", "") for d in ranked_docs]
         is_grounded, score, _ = HallucinationDetector().check_grounding(answer, context_text)
         warning = (
             f"Confidence Low: Answer may not be fully grounded in context (Score: {score:.2f})"
@@ -198,7 +284,14 @@ async def query_rag(
                 "hallucination_score": score,
                 "blocked": False,
                 "reranked_count": len(ranked_docs),
+                "rerank_candidates": len(candidates),
+                "retrieved_candidates": len(all_docs_map),
+                "context_chars": sum(len(t) for t in context_text),
                 "expansion_strategies": len(queries_to_run),
+                "distinct_queries": leg_timings.get("distinct_queries", len(queries_to_run)),
+                "vector_search_ms": leg_timings.get("vector_ms"),
+                "keyword_search_ms": leg_timings.get("keyword_ms"),
+                "search_leg_timeouts": len(leg_timings.get("timed_out", [])),
             },
         )
 
@@ -19,6 +19,9 @@ class Settings(BaseSettings):
     # Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     VECTOR_STORE_PATH: str = os.path.join(BASE_DIR, "vector_store")
+    # Chunk embeddings keyed by model + text hash; kept outside VECTOR_STORE_PATH
+    # so /ingest/rebuild can reuse them instead of re-embedding unchanged chunks.
+    EMBEDDING_CACHE_PATH: str = os.path.join(BASE_DIR, "embedding_cache")
     DATABASE_URL: str = "sqlite+aiosqlite:///./users.db"
     
     # LLM Settings
@@ -38,8 +41,96 @@ class Settings(BaseSettings):
     # Retrieval Settings
     EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
     RERANKER_MODEL_NAME: str = "cross-encoder/ms-marco-TinyBERT-L-2-v2"
+    RERANK_CACHE_SIZE: int = 4096  # cached (query, chunk_id) scores; 0 disables
     TOP_K_RETRIEVAL: int = 5
-    
+    # The vector and keyword legs of hybrid search run concurrently on a shared
+    # pool of HYBRID_SEARCH_WORKERS threads. A leg still running after
+    # HYBRID_LEG_TIMEOUT_MS is dropped and fusion uses the other (0 = wait).
+    HYBRID_SEARCH_WORKERS: int = 8
+    HYBRID_LEG_TIMEOUT_MS: int = 0
+    # How the two legs are combined: rrf (rank-based) | minmax | zscore (normalized
+    # scores, convex combination) | dbsf (distribution-based score fusion).
+    # HYBRID_ALPHA weights the vector leg (1 = semantic only, 0 = BM25 only); fit
+    # both per corpus with backend/scripts/fit_fusion.py
+    HYBRID_FUSION: str = "rrf"
+    HYBRID_ALPHA: float = 0.5
+    HYBRID_RRF_C: int = 60
+    # Maximal Marginal Relevance before reranking: keep MMR_TOP_N candidates,
+    # weighing relevance (MMR_LAMBDA) against similarity to those already kept,
+    # so overlapping chunks don't all reach the cross-encoder (requests may override)
+    MMR_ENABLED: bool = False
+    MMR_TOP_N: int = 8
+    MMR_LAMBDA: float = 0.7
+    # Small-to-big: search matches the small chunks, the LLM gets each hit widened
+    # to "window" (CONTEXT_WINDOW neighbours per side) or "parent" (its section:
+    # PDF page / DOCX section / text file), at most CONTEXT_MAX_CHARS; "off" = as-is
+    CONTEXT_EXPANSION: str = "off"  # opt-in: widening changes what the LLM is grounded on
+    CONTEXT_WINDOW: int = 1
+    CONTEXT_MAX_CHARS: int = 2000
+    # Expanded query variations whose analyzed term sets overlap this much
+    # (Jaccard) with an earlier variation are not searched separately (> 1 = keep all)
+    QUERY_VARIATION_JACCARD: float = 0.8
+    EMBEDDING_DIM: int = 384  # all-MiniLM-L6-v2
+    # 'torch' (sentence-transformers) or 'onnx' (ONNX Runtime, exported once to
+    # EMBEDDING_ONNX_DIR; int8 dynamic quantization unless disabled)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_QUANTIZE: bool = True
+    EMBEDDING_ONNX_DIR: str = os.path.join(BASE_DIR, "onnx_models")
+    EMBEDDING_CACHE_ENABLED: bool = True
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048   # LRU entries; 0 disables
+    QUERY_EMBEDDING_CACHE_TTL_S: int = 3600  # 0 = no expiry
+
+    # Vector index — 'auto' stays exact (flat) on small corpora and switches to
+    # VECTOR_INDEX_AUTO_TYPE once the chunk count crosses the threshold.
+    VECTOR_INDEX_TYPE: str = "auto"          # auto | flat | hnsw | ivf
+    VECTOR_INDEX_AUTO_TYPE: str = "hnsw"     # hnsw | ivf
+    VECTOR_INDEX_AUTO_THRESHOLD: int = 20_000
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    IVF_NLIST: int = 0                        # 0 = ~4*sqrt(N)
+    IVF_NPROBE: int = 16
+    # Vector compression inside the index — none | fp16 | sq8 | pq | binary.
+    # Quantized indexes over-fetch VECTOR_RESCORE_FACTOR x k candidates and
+    # re-score them exactly from the float32 vector log. 'binary' keeps one sign
+    # bit per dimension (32x smaller) in a flat Hamming scan and re-scores the
+    # VECTOR_BINARY_CANDIDATES nearest codes.
+    VECTOR_QUANTIZATION: str = "none"
+    PQ_M: int = 48                            # PQ bytes/vector; must divide EMBEDDING_DIM
+    VECTOR_RESCORE_FACTOR: int = 4
+    VECTOR_BINARY_CANDIDATES: int = 200
+    # Uploads append to a delta log; a background merge checkpoints the main
+    # index once the delta holds this many rows.
+    VECTOR_DELTA_MERGE_ROWS: int = 5_000
+    # Deleted chunks are tombstoned; the merge rebuilds the index without them
+    # once they make up this fraction of it.
+    VECTOR_COMPACT_RATIO: float = 0.2
+    # Partition the index by source file into this many shards, searched in
+    # parallel threads. Changing it re-partitions the store on next load.
+    VECTOR_SHARDS: int = 1
+    # Collapse duplicate chunks at insert time: exact matches by content hash,
+    # near ones by embedding cosine >= DEDUP_NEAR_THRESHOLD (> 1 = exact only).
+    # Duplicates keep their metadata but share the original chunk's vector.
+    DEDUP_ENABLED: bool = False  # opt-in: collapsing changes which chunks come back
+    DEDUP_NEAR_THRESHOLD: float = 0.98
+    # Keyword (BM25) tokenization, applied to chunks and queries alike:
+    # standard = Unicode folding, casefolding, split on punctuation, English
+    # stopwords (BM25_STOPWORDS) and optional BM25_STEMMER minimal | snowball
+    # (snowball needs nltk); whitespace = plain split(" "). Changing any of
+    # these re-tokenizes the store on next load.
+    BM25_ANALYZER: str = "standard"
+    BM25_STOPWORDS: bool = True
+    BM25_STEMMER: str = "minimal"
+    # Keyword index backend: memory = BM25 postings held in RAM (persisted in the
+    # store); sqlite = SQLite FTS5 table on disk ranked by its bm25(), with
+    # resident memory bounded by a KEYWORD_SQLITE_CACHE_MB page cache.
+    KEYWORD_BACKEND: str = "memory"
+    KEYWORD_SQLITE_CACHE_MB: int = 16
+    # Memory-map index checkpoints instead of reading them into RAM on startup
+    VECTOR_INDEX_MMAP: bool = True
+    # Load the models and index in the background at startup rather than on the first query
+    PRELOAD_ON_STARTUP: bool = True
+
     # Rate limits (requests/minute). Auth endpoints use per-IP fallback so a
     # higher ceiling prevents shared-NAT environments from being locked out.
     RATE_LIMIT_AUTH_PER_MIN: int = 20
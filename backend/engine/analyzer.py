@@ -0,0 +1,91 @@
+"""
+Text analysis for keyword (BM25) retrieval.
+
+The same Analyzer tokenizes chunks at index time and queries at search time,
+so "PostgreSQL," in a document and "postgresql" in a question become the
+same term. The pipeline:
+
+  1. Unicode NFKD folding with combining marks dropped ("café" -> "cafe")
+  2. casefolding
+  3. splitting on anything that is not a letter or digit (punctuation,
+     newlines), after dropping English possessives ("Postgres's" -> "postgres")
+  4. stopword removal (Lucene's English list)
+  5. optional stemming: "minimal" (plural stripping, built in) or
+     "snowball" (nltk's English Snowball stemmer)
+
+BM25_ANALYZER=whitespace keeps the old split(" ") behaviour. The persisted
+keyword index records the analyzer's signature and re-tokenizes the store
+when it changes.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from backend.core.config import settings
+
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be but by for if in into is it no not of on or such
+that the their then there these they this to was will with
+""".split())
+
+_WORD = re.compile(r"[^\W_]+")
+_POSSESSIVE = re.compile(r"['\u2019]s\b")
+
+
+def minimal_stem(word: str) -> str:
+    """Harman's S-stemmer: strips English plural endings only, so it rarely conflates unrelated words."""
+    if len(word) > 3 and word.endswith("ies") and not word.endswith(("eies", "aies")):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("es") and not word.endswith(("aes", "ees", "oes")):
+        return word[:-1]
+    if len(word) > 2 and word.endswith("s") and not word.endswith(("us", "ss")):
+        return word[:-1]
+    return word
+
+
+def _snowball_stemmer() -> Callable[[str], str]:
+    try:
+        from nltk.stem.snowball import SnowballStemmer
+    except ImportError as e:
+        raise ImportError("BM25_STEMMER=snowball requires nltk (pip install nltk)") from e
+    return lru_cache(maxsize=100_000)(SnowballStemmer("english").stem)
+
+
+class Analyzer:
+    def __init__(self, mode: str = "standard", stopwords: bool = True, stemmer: str = ""):
+        if mode not in ("standard", "whitespace"):
+            raise ValueError(f"Unknown BM25_ANALYZER '{mode}' (expected standard or whitespace)")
+        if stemmer not in ("", "minimal", "snowball"):
+            raise ValueError(f"Unknown BM25_STEMMER '{stemmer}' (expected minimal, snowball or empty)")
+        self.mode = mode
+        self.stopwords = ENGLISH_STOPWORDS if stopwords and mode == "standard" else frozenset()
+        self.stemmer = stemmer if mode == "standard" else ""
+        self._stem: Optional[Callable[[str], str]] = (
+            lru_cache(maxsize=100_000)(minimal_stem) if self.stemmer == "minimal"
+            else _snowball_stemmer() if self.stemmer == "snowball"
+            else None
+        )
+
+    @property
+    def signature(self) -> str:
+        """Identifies the token stream; an index built with another signature must be rebuilt."""
+        if self.mode == "whitespace":
+            return "whitespace"
+        return f"standard;stopwords={'english' if self.stopwords else 'none'};stemmer={self.stemmer or 'none'}"
+
+    def __call__(self, text: str) -> List[str]:
+        if self.mode == "whitespace":
+            return text.split(" ")
+        if not text.isascii():
+            text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        text = _POSSESSIVE.sub("", text.casefold())
+        tokens = [t for t in _WORD.findall(text) if t not in self.stopwords]
+        if self._stem is not None:
+            tokens = [self._stem(t) for t in tokens]
+        return tokens
+
+
+@lru_cache(maxsize=None)
+def get_analyzer() -> Analyzer:
+    return Analyzer(settings.BM25_ANALYZER, settings.BM25_STOPWORDS, settings.BM25_STEMMER)
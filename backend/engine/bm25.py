@@ -0,0 +1,413 @@
+"""
+BM25 keyword scoring over the vector store's rows.
+
+KeywordIndex scores like rank_bm25.BM25Okapi (same ATIRE idf with the epsilon
+floor, same k1/b defaults) but keeps term-major postings:
+
+  indptr[t]:indptr[t+1]   postings of term t
+  rows                    int32 row ids, ascending within a term
+  tf                      int32 term frequencies
+
+Scoring a query is then a sparse vector-matrix product: one numpy scatter-add
+per distinct query term over that term's postings, instead of a Python pass
+over every document. Top-k selection uses argpartition. The postings hold raw
+term frequencies, so document frequencies and lengths can change without
+re-tokenizing the corpus. Documents are int32 term-id postings against a
+vocabulary, produced by the configured Analyzer.
+"""
+import os
+import json
+import logging
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.engine.analyzer import Analyzer, get_analyzer
+
+logger = logging.getLogger("rag_bm25")
+
+
+def bm25_idf(df: np.ndarray, n_docs: int, epsilon: float) -> np.ndarray:
+    """
+    BM25Okapi idf over the terms present (df > 0): log((N - df + 0.5) / (df + 0.5)),
+    negatives floored to epsilon * the mean idf. Absent terms get 0.
+    """
+    idf = np.zeros(len(df), dtype=np.float32)
+    present = df > 0
+    if present.any():
+        raw = np.log(n_docs - df[present] + 0.5) - np.log(df[present] + 0.5)
+        raw[raw < 0] = epsilon * raw.mean()
+        idf[present] = raw
+    return idf
+
+
+def _select_top_k(scores: np.ndarray, k: int,
+                  allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Best-first rows/scores of the k highest non-zero scores inside `allowed` (argpartition, no full sort)."""
+    if allowed is not None:
+        n = min(len(allowed), len(scores))
+        scores[:n][~allowed[:n]] = 0
+        scores[n:] = 0
+    matched = np.flatnonzero(scores)  # tiny corpora can floor every idf below zero
+    if len(matched) > k:
+        matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+    order = np.argsort(-scores[matched], kind="stable")
+    return matched[order], scores[matched[order]]
+
+
+# ── incremental, persisted index over the vector store's rows ───────────────
+
+POSTING_DTYPE = np.dtype([("term", "<i4"), ("tf", "<i4")])
+DOC_DTYPE = np.dtype([("postings", "<i4"), ("length", "<i4")])  # distinct terms, tokens
+
+
+class _Segment(NamedTuple):
+    """Term-major postings of a row range: rows[indptr[t]:indptr[t+1]] contain term t."""
+    indptr: np.ndarray
+    rows: np.ndarray
+    tf: np.ndarray
+
+
+_EMPTY_SEGMENT = _Segment(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+
+
+def _invert(terms: np.ndarray, rows: np.ndarray, tf: np.ndarray) -> _Segment:
+    if not len(terms):
+        return _EMPTY_SEGMENT
+    order = np.argsort(terms, kind="stable")  # keeps rows ascending inside each list
+    indptr = np.zeros(int(terms.max()) + 2, dtype=np.int64)
+    np.cumsum(np.bincount(terms), out=indptr[1:])
+    return _Segment(indptr, rows[order].astype(np.int32), tf[order].astype(np.int32))
+
+
+class _KeywordState(NamedTuple):
+    base: _Segment          # checkpointed rows [0, base_rows), memory-mapped
+    delta: _Segment         # rows appended since, rebuilt on every append
+    base_rows: int
+    doc_len: np.ndarray     # float32 tokens per row
+    df: np.ndarray          # live documents per term
+    idf: np.ndarray
+    n_docs: int             # live indexed rows
+    total_len: float        # tokens over live indexed rows
+
+
+class KeywordIndex:
+    """
+    BM25 over the vector store's rows, updated incrementally and persisted in
+    the store directory beside the vector index:
+
+      bm25.analyzer              signature of the Analyzer that produced the terms
+      bm25.terms                 vocabulary, one JSON string per line (line = term id)
+      bm25.post                  forward postings (term, tf) of every row, row after row
+      bm25.docs                  per row: posting count and token length (row aligned)
+      bm25-<gen>.{indptr,rows,tf,live}.npy
+                                 term-major checkpoint of rows [0, checkpoint), written by merges
+
+    Appends cost O(new rows) plus re-inverting the delta (bounded by the merge
+    threshold); removals subtract the removed rows' terms from the document
+    frequencies. Collection statistics (df, document count, total length) only
+    cover live indexed rows; deleted rows keep their postings until the next
+    checkpoint and are masked by the caller. Readers pin `state`, which writers
+    replace rather than mutate.
+    """
+
+    def __init__(self, directory: str, analyzer: Optional[Analyzer] = None,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.directory = directory
+        self.analyzer = analyzer or get_analyzer()
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocab: Dict[str, int] = {}
+        self.base_name = ""
+        self._terms_size = 0                          # bytes of bm25.terms read into vocab
+        self._offsets = np.zeros(1, dtype=np.int64)   # first posting of each row, plus the end
+        self.state = _KeywordState(_EMPTY_SEGMENT, _EMPTY_SEGMENT, 0, np.zeros(0, dtype=np.float32),
+                                   np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), 0, 0.0)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def n_docs(self) -> int:
+        return self.state.n_docs
+
+    @property
+    def base_rows(self) -> int:
+        return self.state.base_rows
+
+    # ── persistence ──────────────────────────────────────────────────────────
+
+    def _sync_terms(self, repair: bool = False):
+        """Read vocabulary lines appended since the last call (by this or another process)."""
+        path = self._path("bm25.terms")
+        if not os.path.exists(path) or os.path.getsize(path) <= self._terms_size:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._terms_size)
+            tail = f.read()
+        complete = tail.rfind(b"\n") + 1
+        for line in tail[:complete].splitlines():
+            self.vocab.setdefault(json.loads(line), len(self.vocab))
+        self._terms_size += complete
+        if repair and complete < len(tail):
+            os.truncate(path, self._terms_size)  # torn line from a crashed writer
+
+    def _stored_signature(self) -> Optional[str]:
+        path = self._path("bm25.analyzer")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        # Logs written before the analyzer was configurable were split on spaces
+        return "whitespace" if os.path.exists(self._path("bm25.docs")) else None
+
+    def _reset(self):
+        """Drop the logs so they are re-tokenized with the current analyzer."""
+        for name in ("bm25.terms", "bm25.post", "bm25.docs", "bm25.analyzer"):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self.vocab, self._terms_size = {}, 0
+
+    def _docs(self, count: int) -> np.ndarray:
+        path = self._path("bm25.docs")
+        n = os.path.getsize(path) // DOC_DTYPE.itemsize if os.path.exists(path) else 0
+        if not min(n, count):
+            return np.zeros(0, dtype=DOC_DTYPE)
+        return np.memmap(path, dtype=DOC_DTYPE, mode="r", shape=(min(n, count),))
+
+    def _postings(self) -> np.ndarray:
+        path = self._path("bm25.post")
+        n = os.path.getsize(path) // POSTING_DTYPE.itemsize if os.path.exists(path) else 0
+        if not n:
+            return np.zeros(0, dtype=POSTING_DTYPE)
+        return np.memmap(path, dtype=POSTING_DTYPE, mode="r", shape=(n,))
+
+    def _row_postings(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Forward postings of `rows`, plus the row each posting belongs to."""
+        starts, ends = self._offsets[rows], self._offsets[np.asarray(rows) + 1]
+        lens = ends - starts
+        if not lens.sum():
+            return np.zeros(0, dtype=POSTING_DTYPE), np.zeros(0, dtype=np.int64)
+        idx = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens) + np.repeat(starts, lens)
+        return np.asarray(self._postings()[idx]), np.repeat(np.asarray(rows, dtype=np.int64), lens)
+
+    def _range_segment(self, start: int, stop: int) -> _Segment:
+        postings, rows = self._row_postings(np.arange(start, stop))
+        return _invert(postings["term"], rows, postings["tf"])
+
+    def _read_base(self, name: str, rows: int) -> Tuple[_Segment, np.ndarray]:
+        arrays = [np.load(self._path(f"{name}.{part}.npy"), mmap_mode="r") for part in ("indptr", "rows", "tf", "live")]
+        live = np.unpackbits(np.asarray(arrays[3]), count=rows, bitorder="little").astype(bool)
+        return _Segment(*arrays[:3]), live
+
+    def load(self, count: int, indexed: np.ndarray, base_name: Optional[str], base_rows: int,
+             content: Optional[Callable[[int], str]] = None):
+        """
+        Load the first `count` rows. `indexed` marks the live, non-duplicate rows.
+        Rows missing from the logs (a store written before the keyword index
+        was persisted) are tokenized from `content(row)`; without `content`
+        (read-only refresh) they are treated as empty. With `content`, logs
+        written by a different analyzer are rebuilt from scratch.
+        """
+        stored = self._stored_signature()
+        if stored is not None and stored != self.analyzer.signature:
+            if content is not None:
+                logger.info(f"Keyword analyzer changed ({stored} -> {self.analyzer.signature}); re-tokenizing {count} chunks")
+                self._reset()
+                base_name = None
+            else:
+                logger.warning(f"Keyword index was built with analyzer '{stored}', "
+                               f"this process uses '{self.analyzer.signature}'")
+        self._sync_terms(repair=content is not None)
+        docs = self._docs(count)
+        if len(docs) < count and content is not None:
+            self._offsets = np.concatenate([[0], np.cumsum(docs["postings"], dtype=np.int64)])
+            missing = np.arange(len(docs), count)
+            self._write_rows([content(int(i)) if indexed[i] else "" for i in missing])
+            docs = self._docs(count)
+        postings = np.zeros(count, dtype=np.int64)
+        doc_len = np.zeros(count, dtype=np.float32)
+        postings[:len(docs)] = docs["postings"]
+        doc_len[:len(docs)] = docs["length"]
+        self._offsets = np.concatenate([[0], np.cumsum(postings)])
+
+        if base_name and os.path.exists(self._path(f"{base_name}.indptr.npy")):
+            base, base_live = self._read_base(base_name, base_rows)
+            df = np.diff(base.indptr).astype(np.int64)
+            # Rows deleted after the checkpoint was written no longer count
+            gone, _ = self._row_postings(np.flatnonzero(base_live & ~indexed[:base_rows]))
+        else:
+            base, base_rows, base_name = _EMPTY_SEGMENT, 0, ""
+            df = np.zeros(0, dtype=np.int64)
+            gone = np.zeros(0, dtype=POSTING_DTYPE)
+        added, _ = self._row_postings(base_rows + np.flatnonzero(indexed[base_rows:count]))
+        n_terms = len(self.vocab)
+        df = np.pad(df, (0, n_terms - len(df)))
+        df += np.bincount(added["term"], minlength=n_terms)[:n_terms]
+        df -= np.bincount(gone["term"], minlength=n_terms)[:n_terms]
+
+        live = indexed[:count]
+        self.base_name = base_name
+        self._publish(base, self._range_segment(base_rows, count), base_rows, doc_len, df,
+                      int(live.sum()), float(doc_len[live].sum()))
+
+    def _publish(self, base: _Segment, delta: _Segment, base_rows: int, doc_len: np.ndarray,
+                 df: np.ndarray, n_docs: int, total_len: float):
+        self.state = _KeywordState(base, delta, base_rows, doc_len, df,
+                                   bm25_idf(df, n_docs, self.epsilon), n_docs, total_len)
+
+    def _write_rows(self, texts: List[str]) -> np.ndarray:
+        """Tokenize and append rows to the logs (terms before the postings that use them)."""
+        new_terms: List[str] = []
+        postings: List[Tuple[int, int]] = []
+        docs = np.zeros(len(texts), dtype=DOC_DTYPE)
+        for i, text in enumerate(texts):
+            tokens = self.analyzer(text) if text else []
+            counts = Counter(tokens)
+            for term, tf in counts.items():
+                t = self.vocab.get(term)
+                if t is None:
+                    t = self.vocab[term] = len(self.vocab)
+                    new_terms.append(term)
+                postings.append((t, tf))
+            docs[i] = (len(counts), len(tokens))
+        records = np.array(postings, dtype=POSTING_DTYPE)
+        if not os.path.exists(self._path("bm25.analyzer")):
+            with open(self._path("bm25.analyzer"), "w", encoding="utf-8") as f:
+                f.write(self.analyzer.signature)
+        data = "".join(json.dumps(term, ensure_ascii=False) + "\n" for term in new_terms).encode("utf-8")
+        for name, payload in (("bm25.terms", data), ("bm25.post", records.tobytes()), ("bm25.docs", docs.tobytes())):
+            with open(self._path(name), "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+        self._terms_size += len(data)
+        self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(docs["postings"], dtype=np.int64)])
+        return docs
+
+    def truncate(self, count: int):
+        """Drop log rows >= count (a torn append); the vocabulary may keep unused terms."""
+        docs_path = self._path("bm25.docs")
+        if not os.path.exists(docs_path) or os.path.getsize(docs_path) <= count * DOC_DTYPE.itemsize:
+            return
+        kept = int(np.asarray(self._docs(count)["postings"], dtype=np.int64).sum())
+        os.truncate(docs_path, count * DOC_DTYPE.itemsize)
+        post_path = self._path("bm25.post")
+        if os.path.exists(post_path) and os.path.getsize(post_path) > kept * POSTING_DTYPE.itemsize:
+            os.truncate(post_path, kept * POSTING_DTYPE.itemsize)
+        self._offsets = self._offsets[:count + 1]
+
+    # ── updates ──────────────────────────────────────────────────────────────
+
+    def append(self, texts: List[str], indexed: np.ndarray):
+        """Add rows (one per text, in row order); rows not `indexed` (duplicates) get no postings."""
+        self._sync_terms(repair=True)  # ids must continue after terms other processes appended
+        state = self.state
+        start = len(state.doc_len)
+        docs = self._write_rows([text if keep else "" for text, keep in zip(texts, indexed)])
+        new, _ = self._row_postings(np.arange(start, start + len(texts)))
+        n_terms = len(self.vocab)
+        df = np.pad(state.df, (0, n_terms - len(state.df))) + np.bincount(new["term"], minlength=n_terms)
+        doc_len = np.concatenate([state.doc_len, docs["length"].astype(np.float32)])
+        self._publish(state.base, self._range_segment(state.base_rows, len(doc_len)), state.base_rows,
+                      doc_len, df, state.n_docs + int(np.count_nonzero(indexed)),
+                      state.total_len + float(docs["length"].sum()))
+
+    def remove(self, rows: np.ndarray):
+        """Take live indexed rows out of the collection statistics (their postings are masked by the caller)."""
+        if not len(rows):
+            return
+        state = self.state
+        gone, _ = self._row_postings(np.asarray(rows, dtype=np.int64))
+        df = state.df - np.bincount(gone["term"], minlength=len(state.df))[:len(state.df)]
+        self._publish(state.base, state.delta, state.base_rows, state.doc_len, df,
+                      state.n_docs - len(rows), state.total_len - float(state.doc_len[rows].sum()))
+
+    def write_base(self, generation: int, upto: int, indexed: np.ndarray) -> str:
+        """Write a term-major checkpoint of the live rows in [0, upto); returns its name for set_base."""
+        name = f"bm25-{generation:06d}"
+        live = np.flatnonzero(indexed[:upto])
+        postings, rows = self._row_postings(live)
+        segment = _invert(postings["term"], rows, postings["tf"])
+        parts = dict(zip(("indptr", "rows", "tf"), segment))
+        parts["live"] = np.packbits(indexed[:upto], bitorder="little")
+        for part, array in parts.items():
+            tmp = self._path(f"{name}.{part}.tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, self._path(f"{name}.{part}.npy"))
+        return name
+
+    def set_base(self, name: str, upto: int):
+        """Serve rows [0, upto) from a checkpoint written by write_base; the delta shrinks to the rest."""
+        state = self.state
+        base, _ = self._read_base(name, upto)
+        self.base_name = name
+        self.state = state._replace(base=base, base_rows=upto,
+                                    delta=self._range_segment(upto, len(state.doc_len)))
+
+    # ── search ───────────────────────────────────────────────────────────────
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        return self.get_scores_many([query])[0]
+
+    def get_scores_many(self, queries: List[List[str]]) -> np.ndarray:
+        """
+        BM25 scores of every row for several queries: the (query x term) count
+        matrix times the (term x row) weight matrix. Each distinct term's
+        postings are decoded and weighted once, whichever queries share it.
+        """
+        state = self.state
+        scores = np.zeros((len(queries), len(state.doc_len)), dtype=np.float32)
+        if not state.n_docs:
+            return scores
+        avgdl = state.total_len / state.n_docs
+        counts: Dict[int, np.ndarray] = {}  # term id -> count in each query
+        for q, query in enumerate(queries):
+            for term, count in Counter(query).items():
+                t = self.vocab.get(term)
+                if t is None or t >= len(state.idf) or not state.df[t]:
+                    continue
+                counts.setdefault(t, np.zeros(len(queries), dtype=np.float32))[q] = count
+        for t, column in counts.items():
+            for segment in (state.base, state.delta):
+                if t + 1 >= len(segment.indptr) or segment.indptr[t] == segment.indptr[t + 1]:
+                    continue
+                lo, hi = segment.indptr[t], segment.indptr[t + 1]
+                rows = np.asarray(segment.rows[lo:hi])
+                tf = np.asarray(segment.tf[lo:hi], dtype=np.float32)
+                norm = self.k1 * (1 - self.b + self.b * state.doc_len[rows] / avgdl)
+                weight = state.idf[t] * tf * (self.k1 + 1) / (tf + norm)
+                if len(queries) == 1:
+                    scores[0, rows] += column[0] * weight
+                else:
+                    scores[:, rows] += column[:, None] * weight[None, :]
+        return scores
+
+    def top_k(self, query: List[str], k: int,
+              allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows and scores of the k best-scoring rows that contain at least one
+        query term, best first. `allowed` optionally masks rows (a filter) and
+        must exclude deleted rows.
+        """
+        return self.top_k_many([query], k, allowed)[0]
+
+    def top_k_many(self, queries: List[List[str]], k: int,
+                   allowed: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """top_k for several queries, scored together by get_scores_many."""
+        if k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        return [_select_top_k(scores, k, allowed) for scores in self.get_scores_many(queries)]
+
+
+def open_keyword_index(directory: str):
+    """The keyword index selected by KEYWORD_BACKEND: memory (KeywordIndex) or sqlite (FTS5)."""
+    backend = settings.KEYWORD_BACKEND
+    if backend == "sqlite":
+        from backend.engine.fts_index import FtsKeywordIndex
+        return FtsKeywordIndex(directory)
+    if backend != "memory":
+        raise ValueError(f"Unknown KEYWORD_BACKEND '{backend}' (expected memory or sqlite)")
+    return KeywordIndex(directory)
@@ -0,0 +1,103 @@
+"""
+Stable integer ids for chunks and the documents they came from.
+
+  ids.rec   one ID_DTYPE record per row (row aligned with the other logs)
+
+A chunk id is the row the chunk was first stored at. It never changes: a
+duplicate re-added under a new row after its canonical chunk was deleted
+keeps its id. A document id is assigned per ingested document (each source in
+an add_documents call), so re-uploading a file gives its chunks a new one.
+Results, fusion, deletes and caches key on these ints instead of chunk text.
+"""
+import os
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+ID_DTYPE = np.dtype([
+    ("chunk", "<i8"),  # stable chunk id
+    ("doc", "<i4"),    # document id, shared by the chunks of one ingested document
+])
+
+
+class ChunkIds:
+    """Row-aligned id log; arrays are replaced, never mutated, so readers can pin them."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records = np.zeros(0, dtype=ID_DTYPE)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def chunk(self) -> np.ndarray:
+        return self.records["chunk"]
+
+    @property
+    def doc(self) -> np.ndarray:
+        return self.records["doc"]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def load(self, count: int, sources: Optional[np.ndarray] = None):
+        """
+        Read the records of the first `count` rows (the caller truncates torn
+        tails). Rows of a store written before ids existed are backfilled with
+        chunk id = row and the source code as document id (-1 without a
+        source); without `sources` (read-only refresh) they are only padded
+        in memory.
+        """
+        path = self._path("ids.rec")
+        records = np.fromfile(path, dtype=ID_DTYPE)[:count] if os.path.exists(path) else np.zeros(0, dtype=ID_DTYPE)
+        if len(records) < count:
+            missing = np.zeros(count - len(records), dtype=ID_DTYPE)
+            missing["chunk"] = np.arange(len(records), count)
+            missing["doc"] = sources[len(records):count] if sources is not None else -1
+            if sources is not None:
+                self.records = records
+                self.append(missing)
+                return
+            records = np.concatenate([records, missing])
+        self.records = records
+
+    def assign(self, start: int, metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """Ids for new chunks stored from row `start`: fresh chunk ids, one new document id per source."""
+        records = np.zeros(len(metadatas), dtype=ID_DTYPE)
+        records["chunk"] = start + np.arange(len(metadatas))
+        next_doc = int(self.doc.max()) + 1 if len(self.records) else 0
+        docs: Dict[Any, int] = {}
+        for i, meta in enumerate(metadatas):
+            records["doc"][i] = docs.setdefault(meta.get("source"), next_doc + len(docs))
+        return records
+
+    def append(self, records: np.ndarray):
+        with open(self._path("ids.rec"), "ab") as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.records = np.concatenate([self.records, records])
+
+    def rows_of(self, chunk_ids: np.ndarray, live: np.ndarray) -> np.ndarray:
+        """Live rows holding any of `chunk_ids`."""
+        n = min(len(self.records), len(live))
+        return np.flatnonzero(np.isin(self.chunk[:n], chunk_ids) & live[:n])
+
+    def live_rows(self, chunk_ids: np.ndarray, live: np.ndarray) -> np.ndarray:
+        """
+        The live row holding each chunk id, or -1. O(1) per id while a chunk
+        still sits at the row it was first stored at; only ids re-stored
+        under a new row (promoted duplicates) fall back to a scan.
+        """
+        chunk = self.chunk
+        n = min(len(chunk), len(live))
+        rows = np.asarray(chunk_ids, dtype=np.int64).copy()
+        home = (rows >= 0) & (rows < n)
+        home[home] = (chunk[rows[home]] == rows[home]) & live[rows[home]]
+        moved = ~home & (rows >= 0)
+        rows[~home & (rows < 0)] = -1
+        if moved.any():
+            found = self.rows_of(rows[moved], live)
+            where = dict(zip(chunk[found].tolist(), found.tolist()))
+            rows[moved] = [where.get(c, -1) for c in rows[moved].tolist()]
+        return rows
@@ -0,0 +1,82 @@
+"""
+Adjacency between chunks, for small-to-big retrieval.
+
+  links.rec   one LINK_DTYPE record per row (row aligned with the other logs)
+
+Each chunk records the chunk ids of its predecessor and successor in its
+document and of the first chunk of its parent section (the unit the chunker
+split: a PDF page, a DOCX section, a whole text file). Search matches the
+small chunks; the context builder follows these links to return the
+surrounding window or the whole section without re-querying. Ids are
+assigned at ingest and never change, so a promoted duplicate keeps its links.
+"""
+import os
+import numpy as np
+from typing import Optional
+
+LINK_DTYPE = np.dtype([
+    ("prev", "<i8"),    # chunk id of the previous chunk in the document, -1 = first
+    ("next", "<i8"),    # chunk id of the next chunk in the document, -1 = last
+    ("parent", "<i8"),  # chunk id of the first chunk of the section
+])
+
+
+def link_batch(chunk: np.ndarray, doc: np.ndarray, section: np.ndarray) -> np.ndarray:
+    """
+    Links for chunks stored in document order: consecutive chunks of the same
+    document are neighbours, and a section is a run of chunks sharing `section`.
+    """
+    records = np.full(len(chunk), -1, dtype=LINK_DTYPE)
+    if not len(chunk):
+        return records
+    same_doc = doc[1:] == doc[:-1]
+    records["prev"][1:] = np.where(same_doc, chunk[:-1], -1)
+    records["next"][:-1] = np.where(same_doc, chunk[1:], -1)
+    starts = np.flatnonzero(np.concatenate([[True], ~same_doc | (section[1:] != section[:-1])]))
+    records["parent"] = chunk[starts][np.searchsorted(starts, np.arange(len(chunk)), side="right") - 1]
+    return records
+
+
+class ChunkLinks:
+    """Row-aligned adjacency log; arrays are replaced, never mutated, so readers can pin them."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records = np.zeros(0, dtype=LINK_DTYPE)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def load(self, count: int, ids: Optional[np.ndarray] = None, pages: Optional[np.ndarray] = None,
+             persist: bool = False):
+        """
+        Read the records of the first `count` rows. Rows of a store written
+        before links existed are backfilled from row order (chunks of one
+        document were appended together, sections split by page) given the
+        rows' ID_DTYPE records and page column, and written when `persist`;
+        without them they get no links.
+        """
+        path = self._path("links.rec")
+        records = np.fromfile(path, dtype=LINK_DTYPE)[:count] if os.path.exists(path) else np.zeros(0, dtype=LINK_DTYPE)
+        if len(records) < count:
+            n = len(records)
+            if ids is not None:
+                missing = link_batch(ids["chunk"][n:count], ids["doc"][n:count], pages[n:count])
+            else:
+                missing = np.full(count - n, -1, dtype=LINK_DTYPE)
+            if persist:
+                self.records = records
+                self.append(missing)
+                return
+            records = np.concatenate([records, missing])
+        self.records = records
+
+    def append(self, records: np.ndarray):
+        with open(self._path("links.rec"), "ab") as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.records = np.concatenate([self.records, records])
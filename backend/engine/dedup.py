@@ -0,0 +1,139 @@
+"""
+Duplicate-chunk bookkeeping for the vector store.
+
+Repeated PDF headers/footers, shared snippets and generated test sentences
+produce identical or near-identical chunks. Each one still gets its own
+metadata row (so per-source listing and deletion keep working), but only the
+first copy, the canonical row, is indexed; later copies point at it:
+
+  duplicates.rec  one DUP_DTYPE record per row: 8-byte content hash and the
+                  canonical row it collapses into (-1 = indexed itself)
+
+Exact duplicates are found by content hash, near duplicates by embedding
+cosine similarity (>= DEDUP_NEAR_THRESHOLD) against the index and the batch.
+"""
+import os
+import hashlib
+import numpy as np
+from typing import Callable, Iterable, Optional
+
+from backend.engine.embedding_cache import normalize_text
+
+DUP_DTYPE = np.dtype([
+    ("hash", "<u8"),       # blake2b-64 of the normalized chunk text
+    ("canonical", "<i4"),  # row this chunk is a duplicate of, -1 = canonical
+])
+
+# Rows per block when comparing a batch against itself (block x batch float32 scores)
+_BLOCK_ROWS = 1024
+
+
+def content_hash(text: str) -> int:
+    digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def content_hashes(texts: Iterable[str]) -> np.ndarray:
+    return np.fromiter((content_hash(t) for t in texts), dtype=np.uint64)
+
+
+def batch_near_duplicates(vectors: np.ndarray, threshold: float,
+                          canonical: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Greedy within-batch collapse of normalized vectors: row i points at the
+    first earlier canonical row j with cosine >= threshold. `canonical` holds
+    matches already resolved elsewhere (batch position or -1) and is updated.
+    """
+    n = len(vectors)
+    canonical = np.full(n, -1, dtype=np.int64) if canonical is None else canonical
+    for start in range(0, n, _BLOCK_ROWS):
+        stop = min(start + _BLOCK_ROWS, n)
+        scores = vectors[start:stop] @ vectors[:stop].T
+        for i in range(start, stop):
+            if canonical[i] >= 0:
+                continue
+            earlier = np.flatnonzero((scores[i - start, :i] >= threshold) & (canonical[:i] < 0))
+            if len(earlier):
+                canonical[i] = earlier[0]
+    return canonical
+
+
+class DuplicateMap:
+    """Row-aligned hash/canonical log; arrays are replaced, never mutated, so readers can pin them."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records = np.zeros(0, dtype=DUP_DTYPE)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def canonical(self) -> np.ndarray:
+        return self.records["canonical"]
+
+    @property
+    def hashes(self) -> np.ndarray:
+        return self.records["hash"]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def load(self, count: int, content: Optional[Callable[[int], str]] = None):
+        """
+        Read the records of the first `count` rows (the caller truncates torn
+        tails). Rows missing from a store written before deduplication are
+        backfilled as canonical by hashing `content(row)`; without `content`
+        (read-only refresh) they are only padded in memory.
+        """
+        path = self._path("duplicates.rec")
+        records = np.fromfile(path, dtype=DUP_DTYPE)[:count] if os.path.exists(path) else np.zeros(0, dtype=DUP_DTYPE)
+        if len(records) < count and content is not None:
+            self.records = records
+            missing = [content(i) for i in range(len(records), count)]
+            self.append(content_hashes(missing), np.full(len(missing), -1, dtype=np.int64))
+            return
+        if len(records) < count:
+            padding = np.zeros(count - len(records), dtype=DUP_DTYPE)
+            padding["canonical"] = -1
+            records = np.concatenate([records, padding])
+        self.records = records
+
+    def append(self, hashes: np.ndarray, canonical: np.ndarray):
+        records = np.zeros(len(hashes), dtype=DUP_DTYPE)
+        records["hash"] = hashes
+        records["canonical"] = canonical
+        with open(self._path("duplicates.rec"), "ab") as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.records = np.concatenate([self.records, records])
+
+    def repoint(self, rows: np.ndarray, canonical: np.ndarray):
+        """Set the canonical row of `rows` (used when a canonical chunk is deleted)."""
+        records = self.records.copy()
+        records["canonical"][rows] = canonical
+        tmp = self._path("duplicates.rec.tmp")
+        with open(tmp, "wb") as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path("duplicates.rec"))
+        self.records = records
+
+    def exact_matches(self, hashes: np.ndarray, live: np.ndarray) -> np.ndarray:
+        """Canonical row of a live stored chunk with the same hash, per hash (-1 = none)."""
+        n = min(len(self.records), len(live))
+        rows = np.flatnonzero(live[:n])
+        if not len(rows) or not len(hashes):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        stored = self.records["hash"][rows]
+        order = np.argsort(stored, kind="stable")
+        stored, rows = stored[order], rows[order]
+        pos = np.minimum(np.searchsorted(stored, hashes), len(stored) - 1)
+        found = stored[pos] == hashes
+        match = np.where(found, rows[pos], -1).astype(np.int64)
+        # A matching alias resolves to the chunk it collapses into
+        alias = found & (self.records["canonical"][np.maximum(match, 0)] >= 0)
+        match[alias] = self.records["canonical"][match[alias]]
+        return match
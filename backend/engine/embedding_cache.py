@@ -0,0 +1,206 @@
+"""
+Embedding caches keyed by (model name, normalized text).
+
+EmbeddingCache — persistent, for chunk embeddings at ingest time.
+
+Lives outside VECTOR_STORE_PATH so it survives /ingest/rebuild: re-ingesting
+unchanged documents then costs a hash lookup per chunk instead of a forward pass.
+
+  <EMBEDDING_CACHE_PATH>/<model>/keys.bin     16-byte blake2b digest per row
+  <EMBEDDING_CACHE_PATH>/<model>/vectors.f32  float32 embedding per row, memory-mapped
+
+Both files are append-only; vectors are written before their keys, so a torn
+append is detected (and dropped) by comparing the two row counts. Appends hold
+an flock on cache.lock, so several worker processes can share one cache.
+
+QueryEmbeddingCache — bounded in-memory LRU with a TTL, for query embeddings
+(popular questions and the original query of every expansion round).
+"""
+import os
+import re
+import fcntl
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("rag_embedding_cache")
+
+_KEY_BYTES = 16
+
+
+def normalize_text(text: str) -> str:
+    """NFC + collapsed whitespace — variants that embed identically share an entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    def __init__(self, root: str, model_name: str, dim: int):
+        self.model_name = model_name
+        self.dim = dim
+        self.directory = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._n_rows = 0  # rows on disk this process has indexed (keys may repeat across processes)
+        self._vectors = np.zeros((0, dim), dtype="float32")
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        with open(self._path("cache.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._sync_with_disk()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        logger.info(f"Embedding cache for {self.model_name}: {len(self._rows)} vectors")
+
+    def _sync_with_disk(self):
+        """Index rows other processes appended and drop torn tails. Caller holds cache.lock."""
+        keys_path, vec_path = self._path("keys.bin"), self._path("vectors.f32")
+        n_keys = os.path.getsize(keys_path) // _KEY_BYTES if os.path.exists(keys_path) else 0
+        n_vecs = os.path.getsize(vec_path) // (self.dim * 4) if os.path.exists(vec_path) else 0
+        n = min(n_keys, n_vecs)
+        # Drop torn tails so both files stay row-aligned
+        if os.path.exists(keys_path) and os.path.getsize(keys_path) != n * _KEY_BYTES:
+            os.truncate(keys_path, n * _KEY_BYTES)
+        if os.path.exists(vec_path) and os.path.getsize(vec_path) != n * self.dim * 4:
+            os.truncate(vec_path, n * self.dim * 4)
+
+        if n > self._n_rows:
+            with open(keys_path, "rb") as f:
+                f.seek(self._n_rows * _KEY_BYTES)
+                keys = f.read((n - self._n_rows) * _KEY_BYTES)
+            self._remap(n)
+            for i in range(n - self._n_rows):
+                self._rows[keys[i * _KEY_BYTES:(i + 1) * _KEY_BYTES]] = self._n_rows + i
+            self._n_rows = n
+
+    def _remap(self, n: int):
+        if n:
+            self._vectors = np.memmap(self._path("vectors.f32"), dtype="float32", mode="r", shape=(n, self.dim))
+        else:
+            self._vectors = np.zeros((0, self.dim), dtype="float32")
+
+    def key(self, text: str) -> bytes:
+        data = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(data, digest_size=_KEY_BYTES).digest()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _append(self, keys: List[bytes], vectors: np.ndarray):
+        with self._lock, open(self._path("cache.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._sync_with_disk()
+                fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+                if not fresh:
+                    return
+                start = self._n_rows
+                with open(self._path("vectors.f32"), "ab") as f:
+                    f.write(np.ascontiguousarray(vectors[fresh], dtype="float32").tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._path("keys.bin"), "ab") as f:
+                    f.write(b"".join(keys[i] for i in fresh))
+                    f.flush()
+                    os.fsync(f.fileno())
+                # Remap before publishing the rows so lock-free readers never index past the map
+                self._remap(start + len(fresh))
+                for offset, i in enumerate(fresh):
+                    self._rows[keys[i]] = start + offset
+                self._n_rows = start + len(fresh)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def embed_documents(self, texts: Sequence[str],
+                        embed: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """
+        Return float32 embeddings for `texts`, calling `embed` only for texts not
+        already cached (each distinct text once) and caching its results.
+        """
+        keys = [self.key(t) for t in texts]
+        out = np.empty((len(texts), self.dim), dtype="float32")
+
+        missing: Dict[bytes, List[int]] = {}
+        rows = self._rows
+        for i, k in enumerate(keys):
+            row = rows.get(k)
+            if row is None:
+                missing.setdefault(k, []).append(i)
+            else:
+                out[i] = self._vectors[row]
+        self.hits += len(texts) - sum(len(p) for p in missing.values())
+        self.misses += len(missing)
+
+        if missing:
+            miss_keys = list(missing)
+            computed = np.asarray(embed([texts[missing[k][0]] for k in miss_keys]), dtype="float32")
+            for k, vector in zip(miss_keys, computed):
+                out[missing[k]] = vector
+            self._append(miss_keys, computed)
+        return out
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    def __init__(self, model_name: str, max_entries: int, ttl_seconds: float):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_name}\0{normalize_text(text)}"
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self._key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl_seconds <= 0 or time.monotonic() - entry[0] < self.ttl_seconds):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]  # expired
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype="float32")
+        vector.setflags(write=False)  # shared between requests
+        with self._lock:
+            self._entries[self._key(text)] = (time.monotonic(), vector)
+            self._entries.move_to_end(self._key(text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
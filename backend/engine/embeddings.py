@@ -0,0 +1,179 @@
+"""
+Embedding backends for VectorStore (settings.EMBEDDING_BACKEND):
+
+  torch : sentence-transformers on PyTorch via LangChain's HuggingFaceEmbeddings
+  onnx  : the same model exported to ONNX, optionally dynamic-int8 quantized, run
+          with ONNX Runtime — no autograd/PyTorch at query time, smaller RSS and
+          typically 2-4x faster on CPU (optional dependencies: requirements-onnx.txt)
+
+Both return mean-pooled, L2-normalized float vectors, so indexes built with one
+stay searchable with the other (check with backend/scripts/check_onnx_parity.py).
+"""
+import os
+import re
+import logging
+import threading
+from typing import List, Optional
+import numpy as np
+from backend.core.config import settings
+from backend.engine.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+logger = logging.getLogger("rag_embeddings")
+
+BACKENDS = ("torch", "onnx")
+
+
+def embedding_model_id() -> str:
+    """Model name plus backend variant — the key under which embeddings are cached."""
+    if settings.EMBEDDING_BACKEND.lower() == "onnx":
+        return f"{settings.EMBEDDING_MODEL_NAME}@onnx{'-int8' if settings.EMBEDDING_ONNX_QUANTIZE else ''}"
+    return settings.EMBEDDING_MODEL_NAME
+
+
+def load_embeddings():
+    """Create the configured embedding backend (LangChain Embeddings interface)."""
+    backend = settings.EMBEDDING_BACKEND.lower()
+    if backend == "onnx":
+        return OnnxEmbeddings(settings.EMBEDDING_MODEL_NAME, quantize=settings.EMBEDDING_ONNX_QUANTIZE)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Expected one of: {', '.join(BACKENDS)}")
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=settings.EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+# Process-wide instances: every VectorStore generation (e.g. the one a blue/green
+# rebuild is filling while the live one serves queries) shares one model and one
+# set of caches instead of loading its own.
+_shared_lock = threading.Lock()
+_shared_embeddings = None
+_shared_chunk_cache: Optional[EmbeddingCache] = None
+_shared_query_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_embeddings():
+    global _shared_embeddings
+    with _shared_lock:
+        if _shared_embeddings is None:
+            _shared_embeddings = load_embeddings()
+        return _shared_embeddings
+
+
+def get_chunk_cache() -> Optional[EmbeddingCache]:
+    """Persistent chunk-embedding cache, or None when EMBEDDING_CACHE_ENABLED is off."""
+    global _shared_chunk_cache
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_chunk_cache is None:
+            _shared_chunk_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, embedding_model_id(),
+                                                 settings.EMBEDDING_DIM)
+        return _shared_chunk_cache
+
+
+def get_query_cache() -> Optional[QueryEmbeddingCache]:
+    """In-memory query-embedding LRU, or None when QUERY_EMBEDDING_CACHE_SIZE is 0."""
+    global _shared_query_cache
+    if settings.QUERY_EMBEDDING_CACHE_SIZE <= 0:
+        return None
+    with _shared_lock:
+        if _shared_query_cache is None:
+            _shared_query_cache = QueryEmbeddingCache(embedding_model_id(), settings.QUERY_EMBEDDING_CACHE_SIZE,
+                                                      settings.QUERY_EMBEDDING_CACHE_TTL_S)
+        return _shared_query_cache
+
+
+class OnnxEmbeddings:
+    """
+    Sentence embeddings from an ONNX export of a sentence-transformers model.
+    The export (and int8 quantization) runs once and is cached under
+    EMBEDDING_ONNX_DIR; later starts only load the .onnx file and tokenizer.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = True,
+                 batch_size: int = 32, max_length: int = 256):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=onnx requires onnxruntime and transformers "
+                "(pip install -r requirements-onnx.txt)"
+            ) from e
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.model_dir = os.path.join(settings.EMBEDDING_ONNX_DIR, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+        model_path = self._ensure_exported(quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        logger.info(f"Loaded ONNX embedding model {os.path.basename(model_path)} from {self.model_dir}")
+
+    def _ensure_exported(self, quantize: bool) -> str:
+        fp32_path = os.path.join(self.model_dir, "model.onnx")
+        int8_path = os.path.join(self.model_dir, "model-int8.onnx")
+        if not os.path.exists(fp32_path):
+            self._export(fp32_path)
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            logger.info("Quantizing ONNX embedding model to int8 (dynamic)")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _export(self, path: str):
+        """Export the transformer (token embeddings only; pooling happens in numpy)."""
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        logger.info(f"Exporting {self.model_name} to ONNX at {path}")
+        os.makedirs(self.model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        tokenizer.save_pretrained(self.model_dir)
+
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+        dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[n] for n in names), path,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic, opset_version=14,
+            )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, settings.EMBEDDING_DIM), dtype="float32")
+        # Length-sorted batches keep padding (wasted compute) to a minimum
+        order = np.argsort([len(t) for t in texts])
+        chunks = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [texts[i] for i in order[start:start + self.batch_size]]
+            enc = self.tokenizer(batch, padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            feeds = {k: v.astype("int64") for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            chunks.append(pooled)
+        out = np.empty((len(texts), chunks[0].shape[1]), dtype="float32")
+        out[order] = np.concatenate(chunks)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
@@ -0,0 +1,167 @@
+"""
+Disk-backed keyword index on SQLite FTS5 (KEYWORD_BACKEND=sqlite).
+
+An alternative to the in-memory KeywordIndex with the same interface: each
+indexed chunk is one FTS5 row whose rowid is the store row, holding the
+chunk's analyzer tokens, and queries rank with FTS5's native bm25() (k1=1.2,
+b=0.75). Postings stay in SQLite pages on disk, so resident memory is the
+page cache (KEYWORD_SQLITE_CACHE_MB) rather than the whole corpus.
+
+  bm25.sqlite   FTS5 table `chunks` plus a `meta` table with the analyzer signature
+
+Deleted and duplicate rows are removed from / never inserted into the table,
+so document frequencies always cover live indexed chunks. The database is
+shared by every worker process; startup reconciles it with the store logs
+(a crash between the two leaves at most a few rows to insert or delete).
+"""
+import os
+import sqlite3
+import threading
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.engine.analyzer import Analyzer, get_analyzer
+
+logger = logging.getLogger("rag_fts_index")
+
+# Matches are streamed best-first in batches of this many rows until k pass the filter
+_FETCH_ROWS = 256
+
+
+class FtsKeywordIndex:
+    def __init__(self, directory: str, analyzer: Optional[Analyzer] = None):
+        self.directory = directory
+        self.analyzer = analyzer or get_analyzer()
+        self.base_name = ""
+        self.base_rows = 0
+        self.rows = 0      # store rows covered, indexed or not
+        self._n_docs = 0
+        self._local = threading.local()  # one connection per thread; sqlite3 objects are not shareable
+        db = self._connect()
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(body, tokenize='unicode61 remove_diacritics 0')")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.directory, "bm25.sqlite"), timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")   # readers in other processes don't block writers
+            db.execute("PRAGMA synchronous=NORMAL")  # load() repairs anything lost with the last commit
+            db.execute(f"PRAGMA cache_size={-1024 * settings.KEYWORD_SQLITE_CACHE_MB}")
+            self._local.db = db
+        return db
+
+    @property
+    def n_docs(self) -> int:
+        return self._n_docs
+
+    def _count(self) -> int:
+        return self._connect().execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    # ── persistence ──────────────────────────────────────────────────────────
+
+    def load(self, count: int, indexed: np.ndarray, base_name: Optional[str], base_rows: int,
+             content: Optional[Callable[[int], str]] = None):
+        """
+        With `content` (the writer's load), make the table hold exactly the
+        indexed rows below `count`, re-tokenizing everything if the analyzer
+        changed; otherwise (read-only refresh) just re-read the document count.
+        """
+        self.base_rows = base_rows
+        self.rows = count
+        if content is None:
+            self._n_docs = self._count()
+            return
+        db = self._connect()
+        stored = db.execute("SELECT value FROM meta WHERE key = 'analyzer'").fetchone()
+        with db:
+            if stored is not None and stored[0] != self.analyzer.signature:
+                logger.info(f"Keyword analyzer changed ({stored[0]} -> {self.analyzer.signature}); "
+                            f"re-tokenizing {count} chunks")
+                db.execute("DELETE FROM chunks")
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('analyzer', ?)", (self.analyzer.signature,))
+            db.execute("DELETE FROM chunks WHERE rowid >= ?", (count,))
+
+        wanted = np.flatnonzero(indexed[:count])
+        if self._count() != len(wanted):
+            present = np.array([r for (r,) in db.execute("SELECT rowid FROM chunks")], dtype=np.int64)
+            extra = np.setdiff1d(present, wanted)
+            missing = np.setdiff1d(wanted, present)
+            if len(extra) or len(missing):
+                logger.info(f"Reconciling keyword index: +{len(missing)} / -{len(extra)} chunks")
+            self.remove(extra)
+            self._insert(missing, [content(int(r)) for r in missing])
+        self._n_docs = self._count()
+
+    def truncate(self, count: int):
+        """Drop rows >= count (a torn append)."""
+        db = self._connect()
+        with db:
+            removed = db.execute("DELETE FROM chunks WHERE rowid >= ?", (count,)).rowcount
+        self._n_docs -= max(removed, 0)
+        self.rows = min(self.rows, count)
+
+    def write_base(self, generation: int, upto: int, indexed: np.ndarray) -> str:
+        return ""  # the table is its own checkpoint
+
+    def set_base(self, name: str, upto: int):
+        self.base_rows = upto
+
+    # ── updates ──────────────────────────────────────────────────────────────
+
+    def _insert(self, rows: np.ndarray, texts: List[str]):
+        if not len(rows):
+            return
+        db = self._connect()
+        with db:
+            db.executemany("INSERT INTO chunks(rowid, body) VALUES (?, ?)",
+                           ((int(r), " ".join(self.analyzer(t))) for r, t in zip(rows, texts)))
+        self._n_docs += len(rows)
+
+    def append(self, texts: List[str], indexed: np.ndarray):
+        """Add rows (one per text, in row order); rows not `indexed` (duplicates) are not inserted."""
+        keep = np.flatnonzero(indexed)
+        self._insert(self.rows + keep, [texts[i] for i in keep])
+        self.rows += len(texts)
+
+    def remove(self, rows: np.ndarray):
+        if not len(rows):
+            return
+        db = self._connect()
+        with db:
+            db.executemany("DELETE FROM chunks WHERE rowid = ?", ((int(r),) for r in rows))
+        self._n_docs -= len(rows)
+
+    # ── search ───────────────────────────────────────────────────────────────
+
+    def top_k(self, query: List[str], k: int,
+              allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Best-first rows/scores (-bm25(), higher is better) of up to k matching rows inside `allowed`."""
+        terms = list(dict.fromkeys(t for t in query if t))
+        if k <= 0 or not terms:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        sql = "SELECT rowid, -bm25(chunks) FROM chunks WHERE chunks MATCH ? ORDER BY bm25(chunks)"
+        if allowed is None:
+            hits = self._connect().execute(sql + " LIMIT ?", (match, k)).fetchall()
+        else:
+            hits = []
+            cursor = self._connect().execute(sql, (match,))
+            while len(hits) < k:
+                batch = cursor.fetchmany(_FETCH_ROWS)
+                if not batch:
+                    break
+                hits.extend((r, s) for r, s in batch if r < len(allowed) and allowed[r])
+            cursor.close()
+            hits = hits[:k]
+        rows = np.array([r for r, _ in hits], dtype=np.int64)
+        return rows, np.array([s for _, s in hits], dtype=np.float32)
+
+    def top_k_many(self, queries: List[List[str]], k: int,
+                   allowed: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # FTS5 ranks one MATCH expression at a time
+        return [self.top_k(query, k, allowed) for query in queries]
@@ -0,0 +1,337 @@
+"""
+FAISS index construction and tuning for VectorStore.
+
+Index types (settings.VECTOR_INDEX_TYPE):
+  flat : exact inner-product scan (IndexFlatIP) — O(N) per query
+  hnsw : graph-based ANN (IndexHNSWFlat), no training, tuned by efSearch
+  ivf  : inverted lists over k-means centroids (IndexIVFFlat), trained, tuned by nprobe
+  auto : flat until the corpus reaches VECTOR_INDEX_AUTO_THRESHOLD chunks, then
+         VECTOR_INDEX_AUTO_TYPE (brute force is both exact and fastest on small corpora)
+
+Vector storage inside any of them (settings.VECTOR_QUANTIZATION):
+  none : float32, 4*d bytes/vector
+  fp16 : half precision, 2*d bytes/vector, near-lossless
+  sq8  : 8-bit scalar quantization (trained per-dimension ranges), d bytes/vector
+  pq   : product quantization, PQ_M bytes/vector (trained codebooks)
+  binary : 1 sign bit per dimension, d/8 bytes/vector (48 for 384 dims), searched
+         by a Hamming scan (always flat). A first pass only: it shortlists
+         VECTOR_BINARY_CANDIDATES rows for exact re-scoring.
+Quantized indexes return approximate scores; VectorStore re-scores the top
+candidates exactly from vectors.f32.
+"""
+import math
+import logging
+from typing import Optional, Tuple, Union
+import faiss
+import numpy as np
+from backend.core.config import settings
+
+logger = logging.getLogger("rag_index_factory")
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "fp16", "sq8", "pq", "binary")
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+_PQ_NBITS = 8
+# k-means wants ~39 points per centroid; below that PQ codebooks are too noisy
+_PQ_MIN_TRAIN = 39 * 2 ** _PQ_NBITS
+
+
+def resolve_index_type(ntotal: int) -> str:
+    """Map the configured index type to a concrete one for a corpus of `ntotal` chunks."""
+    if settings.VECTOR_QUANTIZATION.lower() == "binary":
+        return "flat"  # Hamming scans are cheap enough to stay exhaustive
+    kind = settings.VECTOR_INDEX_TYPE.lower()
+    if kind == "auto":
+        if ntotal < settings.VECTOR_INDEX_AUTO_THRESHOLD:
+            return "flat"
+        kind = settings.VECTOR_INDEX_AUTO_TYPE.lower()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE '{kind}'. Expected one of: auto, {', '.join(INDEX_TYPES)}")
+    return kind
+
+
+def resolve_quantization(ntotal: int) -> str:
+    """Configured vector quantization, deferred to 'none' until PQ has enough training data."""
+    quant = settings.VECTOR_QUANTIZATION.lower()
+    if quant not in QUANTIZATIONS:
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION '{quant}'. Expected one of: {', '.join(QUANTIZATIONS)}")
+    if quant == "pq" and ntotal < _PQ_MIN_TRAIN:
+        return "none"
+    return quant
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """Sign-quantize float vectors to packed bits (d/8 uint8 per row)."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+class BinaryIndex:
+    """
+    Sign-bit codes in a faiss IndexBinaryIDMap, behind the part of the float
+    faiss.Index API VectorStore uses: add/search take float vectors. Search
+    scores are the angle estimate cos(pi * hamming / d), only good enough to
+    rank candidates for exact re-scoring.
+    """
+
+    def __init__(self, index: Union[int, faiss.IndexBinary]):
+        self.index = faiss.IndexBinaryIDMap(faiss.IndexBinaryFlat(index)) if isinstance(index, int) else index
+        self.is_trained = True
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def add(self, vectors: np.ndarray):
+        self.add_with_ids(vectors, np.arange(self.ntotal, self.ntotal + len(vectors), dtype="int64"))
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        self.index.add_with_ids(binarize(vectors), np.asarray(ids, dtype="int64"))
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        return self.index.remove_ids(np.asarray(ids, dtype="int64"))
+
+    def search(self, vectors: np.ndarray, k: int,
+               params: Optional[faiss.SearchParameters] = None) -> Tuple[np.ndarray, np.ndarray]:
+        D, I = self.index.search(binarize(vectors), k, params=params)
+        return np.cos(np.pi * D / self.d).astype("float32"), I
+
+
+def read_index(path: str, flags: int = 0) -> Union[faiss.Index, BinaryIndex]:
+    """faiss.read_index for float and binary index files (told apart by their 'IB' fourcc)."""
+    with open(path, "rb") as f:
+        binary = f.read(2) == b"IB"
+    if binary:
+        return BinaryIndex(faiss.read_index_binary(path, flags))
+    return faiss.read_index(path, flags)
+
+
+def write_index(index: Union[faiss.Index, BinaryIndex], path: str):
+    if isinstance(index, BinaryIndex):
+        faiss.write_index_binary(index.index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def clone_index(index: Union[faiss.Index, BinaryIndex]) -> Union[faiss.Index, BinaryIndex]:
+    if isinstance(index, BinaryIndex):
+        # clone_binary_index does not handle the id map; round-trip through bytes
+        return BinaryIndex(faiss.deserialize_index_binary(faiss.serialize_index_binary(index.index)))
+    return faiss.clone_index(index)
+
+
+def unwrap(index: faiss.Index) -> faiss.Index:
+    """Strip an IndexIDMap wrapper (VectorStore keys every index by chunk row id)."""
+    if isinstance(index, BinaryIndex):
+        return index
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def with_ids(index: faiss.Index) -> faiss.IndexIDMap:
+    """Wrap an empty index so vectors are added/returned under explicit int64 ids."""
+    if isinstance(index, BinaryIndex):
+        return index  # already id-mapped
+    return faiss.IndexIDMap(index)
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Return the index type name ('flat' / 'hnsw' / 'ivf') of a loaded index."""
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def _storage_quantization(storage: faiss.Index) -> str:
+    if isinstance(storage, BinaryIndex):
+        return "binary"
+    storage = faiss.downcast_index(storage)
+    if isinstance(storage, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(storage, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if storage.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "none"
+
+
+def index_quantization(index: faiss.Index) -> str:
+    """Return how vectors are stored in a loaded index ('none' / 'fp16' / 'sq8' / 'pq' / 'binary')."""
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return _storage_quantization(index.storage)
+    return _storage_quantization(index)
+
+
+def bytes_per_vector(quantization: str, dim: int) -> int:
+    """Approximate code size of one stored vector (excluding HNSW links / IVF ids)."""
+    return {"none": 4 * dim, "fp16": 2 * dim, "sq8": dim, "pq": settings.PQ_M, "binary": dim // 8}[quantization]
+
+
+def candidate_count(index: faiss.Index, k: int) -> int:
+    """How many candidates to fetch from `index` for a top-k; quantized ones are re-scored exactly."""
+    quant = index_quantization(index)
+    if quant == "none":
+        return k
+    if quant == "binary":
+        return max(settings.VECTOR_BINARY_CANDIDATES, k * settings.VECTOR_RESCORE_FACTOR)
+    return k * settings.VECTOR_RESCORE_FACTOR
+
+
+def describe_index(index: faiss.Index) -> dict:
+    """Memory / accuracy summary of a loaded index, for logs and the admin API."""
+    kind, quant = index_kind(index), index_quantization(index)
+    code = bytes_per_vector(quant, index.d)
+    overhead = {"hnsw": settings.HNSW_M * 2 * 4, "ivf": 8}.get(kind, 0)
+    return {
+        "type": kind,
+        "quantization": quant,
+        "vectors": int(index.ntotal),
+        "bytes_per_vector": code + overhead,
+        "compression_vs_float32": round(4 * index.d / code, 1),
+        "approx_index_mb": round(index.ntotal * (code + overhead) / 1024 / 1024, 2),
+        "exact_rescoring": quant != "none",
+    }
+
+
+def _ivf_nlist(ntotal: int) -> int:
+    """Number of IVF lists: configured value, else ~4*sqrt(N) capped so each list gets ≥39 training points."""
+    if settings.IVF_NLIST > 0:
+        nlist = settings.IVF_NLIST
+    else:
+        nlist = int(4 * math.sqrt(max(ntotal, 1)))
+    return max(1, min(nlist, ntotal // 39 or 1))
+
+
+def build_index(kind: str, dim: int, vectors: Optional[np.ndarray] = None,
+                quantization: str = "none") -> faiss.Index:
+    """
+    Create an empty index of the given type and storage. Trained variants (ivf,
+    sq8, pq) are trained on `vectors`; the vectors are NOT added — callers add
+    them afterwards.
+    """
+    metric = faiss.METRIC_INNER_PRODUCT
+    if quantization == "pq" and dim % settings.PQ_M:
+        raise ValueError(f"PQ_M={settings.PQ_M} must divide the embedding dimension {dim}")
+
+    if quantization == "binary":
+        if dim % 8:
+            raise ValueError(f"Binary quantization needs an embedding dimension divisible by 8, got {dim}")
+        return BinaryIndex(dim)
+
+    if kind == "flat":
+        if quantization == "none":
+            return faiss.IndexFlatIP(dim)
+        if quantization == "pq":
+            index = faiss.IndexPQ(dim, settings.PQ_M, _PQ_NBITS, metric)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[quantization], metric)
+
+    elif kind == "hnsw":
+        if quantization == "none":
+            index = faiss.IndexHNSWFlat(dim, settings.HNSW_M, metric)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dim, settings.PQ_M, settings.HNSW_M, _PQ_NBITS, metric)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[quantization], settings.HNSW_M, metric)
+        index.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = settings.HNSW_EF_SEARCH
+
+    elif kind == "ivf":
+        if vectors is None or len(vectors) == 0:
+            raise ValueError("IVF index requires training vectors.")
+        nlist = _ivf_nlist(len(vectors))
+        quantizer = faiss.IndexFlatIP(dim)
+        if quantization == "none":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, settings.PQ_M, _PQ_NBITS, metric)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[quantization], metric)
+        index.nprobe = min(settings.IVF_NPROBE, nlist)
+
+    else:
+        raise ValueError(f"Unknown index type '{kind}'")
+
+    if not index.is_trained:
+        if vectors is None or len(vectors) == 0:
+            raise ValueError(f"{kind}/{quantization} index requires training vectors.")
+        logger.info(f"Training {kind}/{quantization} index on {len(vectors)} vectors")
+        index.train(vectors)
+    return index
+
+
+def build_configured_index(dim: int, vectors: np.ndarray) -> faiss.IndexIDMap:
+    """Build (and train) the id-mapped index the configuration calls for at this corpus size."""
+    n = len(vectors)
+    return with_ids(build_index(resolve_index_type(n), dim, vectors, resolve_quantization(n)))
+
+
+def needs_rebuild(index: faiss.Index) -> bool:
+    """
+    True when the index type or quantization no longer matches the configuration for its size,
+    or when an IVF index was trained on a corpus much smaller than the current one
+    (its lists become too long and nprobe loses selectivity).
+    """
+    kind = index_kind(index)
+    if kind != resolve_index_type(index.ntotal):
+        return True
+    if index_quantization(index) != resolve_quantization(index.ntotal):
+        return True
+    if kind == "ivf":
+        return faiss.extract_index_ivf(unwrap(index)).nlist * 2 < _ivf_nlist(index.ntotal)
+    return False
+
+
+def extract_vectors(index: faiss.Index) -> np.ndarray:
+    """Reconstruct all stored vectors (used to migrate an index to another type)."""
+    n = index.ntotal
+    if n == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    ivf = faiss.try_extract_index_ivf(index) if index_kind(index) == "ivf" else None
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, n)
+
+
+def supports_selector(index: faiss.Index) -> bool:
+    """
+    False for indexes whose search() rejects SearchParameters altogether (a flat
+    IndexPQ); callers over-fetch from those and drop excluded ids afterwards.
+    """
+    return not isinstance(unwrap(index), faiss.IndexPQ)
+
+
+def search_params(index: faiss.Index,
+                  ef_search: Optional[int] = None,
+                  nprobe: Optional[int] = None,
+                  selector: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Per-request search parameters. Passed to index.search(params=...) instead of
+    mutating index.hnsw.efSearch / index.nprobe so concurrent requests don't race.
+    `selector` restricts results to a subset of ids (e.g. excluding tombstones);
+    it is dropped for indexes that can't take one (see supports_selector).
+    """
+    if not supports_selector(index):
+        return None
+    kind = index_kind(index)
+    if kind == "hnsw" and (ef_search or selector is not None):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(ef_search or unwrap(index).hnsw.efSearch)
+    elif kind == "ivf" and (nprobe or selector is not None):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(nprobe or faiss.extract_index_ivf(unwrap(index)).nprobe)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
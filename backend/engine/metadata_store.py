@@ -0,0 +1,259 @@
+"""
+Columnar, memory-mapped chunk metadata store.
+
+Replaces the in-RAM list of dicts (metadata.json) with append-only files so a
+chunk costs one fixed-width record in the page cache until it is returned:
+
+  chunks.rec    one RECORD_DTYPE row per chunk (offsets into the heaps + coded columns)
+  content.heap  UTF-8 chunk text, concatenated
+  extra.heap    JSON for any metadata keys beyond content/source/type/page
+  strings.json  code tables for the low-cardinality 'source' and 'type' columns
+
+Rows are addressed by position (the same row number as the vector log), and
+`store[i]` rebuilds the original metadata dict lazily.
+"""
+import os
+import json
+import mmap
+import threading
+import numpy as np
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+RECORD_DTYPE = np.dtype([
+    ("content_off", "<i8"),
+    ("content_len", "<i4"),
+    ("extra_off", "<i8"),
+    ("extra_len", "<i4"),
+    ("source", "<i4"),   # code into strings['source'], -1 = missing
+    ("type", "<i4"),     # code into strings['type'],   -1 = missing
+    ("page", "<i4"),     # -1 = missing
+])
+
+_CODED = ("source", "type")
+_COLUMNS = ("content", "source", "type", "page")
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    """Read-only mmap of a file, or None when it is empty/missing (mmap rejects size 0)."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkMetadataStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._strings: Dict[str, List[str]] = {c: [] for c in _CODED}
+        self._codes: Dict[str, Dict[str, int]] = {c: {} for c in _CODED}
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._content: Optional[mmap.mmap] = None
+        self._extra: Optional[mmap.mmap] = None
+        self._masks: Dict[Tuple[str, int], np.ndarray] = {}  # per-code row masks, reset on remap
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # ── loading ──────────────────────────────────────────────────────────────
+
+    def _load(self):
+        strings_path = self._path("strings.json")
+        if os.path.exists(strings_path):
+            with open(strings_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            for col in _CODED:
+                self._strings[col] = list(stored.get(col, []))
+                self._codes[col] = {s: i for i, s in enumerate(self._strings[col])}
+        self._remap()
+
+    def _remap(self):
+        rec_path = self._path("chunks.rec")
+        n = os.path.getsize(rec_path) // RECORD_DTYPE.itemsize if os.path.exists(rec_path) else 0
+        if n:
+            self._records = np.memmap(rec_path, dtype=RECORD_DTYPE, mode="r", shape=(n,))
+        else:
+            self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._masks = {}
+        self._content = _map(self._path("content.heap"))
+        self._extra = _map(self._path("extra.heap"))
+
+    def refresh(self):
+        """Pick up rows and code-table entries appended by another process."""
+        with self._lock:
+            self._load()
+
+    def truncate(self, count: int):
+        """Drop rows >= count (and their heap bytes) — used to discard torn appends."""
+        rec_path = self._path("chunks.rec")
+        if not os.path.exists(rec_path) or os.path.getsize(rec_path) <= count * RECORD_DTYPE.itemsize:
+            return
+        with self._lock:
+            self._remap()  # the torn rows may have been written by another process
+            if count:
+                last = self._records[count - 1]
+                content_end = int(last["content_off"] + last["content_len"])
+                extra_end = int(last["extra_off"] + last["extra_len"])
+            else:
+                content_end = extra_end = 0
+            self._records = np.zeros(0, dtype=RECORD_DTYPE)
+            self._content = self._extra = None
+            os.truncate(self._path("chunks.rec"), count * RECORD_DTYPE.itemsize)
+            for name, end in (("content.heap", content_end), ("extra.heap", extra_end)):
+                if os.path.exists(self._path(name)):
+                    os.truncate(self._path(name), end)
+            self._remap()
+
+    # ── writes ───────────────────────────────────────────────────────────────
+
+    def _code(self, column: str, value: Any) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        code = self._codes[column].get(value)
+        if code is None:
+            code = len(self._strings[column])
+            self._strings[column].append(value)
+            self._codes[column][value] = code
+        return code
+
+    def append(self, metadatas: List[Dict[str, Any]]):
+        """Append rows; the heaps are written before the records that point into them."""
+        if not metadatas:
+            return
+        with self._lock:
+            n_strings = {c: len(self._strings[c]) for c in _CODED}
+            content_off = os.path.getsize(self._path("content.heap")) if os.path.exists(self._path("content.heap")) else 0
+            extra_off = os.path.getsize(self._path("extra.heap")) if os.path.exists(self._path("extra.heap")) else 0
+
+            records = np.zeros(len(metadatas), dtype=RECORD_DTYPE)
+            content_parts: List[bytes] = []
+            extra_parts: List[bytes] = []
+            for i, meta in enumerate(metadatas):
+                content = str(meta.get("content", "")).encode("utf-8")
+                extra = {k: v for k, v in meta.items() if k not in _COLUMNS}
+                extra_bytes = json.dumps(extra).encode("utf-8") if extra else b""
+                page = meta.get("page")
+
+                records[i] = (
+                    content_off, len(content),
+                    extra_off, len(extra_bytes),
+                    self._code("source", meta.get("source")),
+                    self._code("type", meta.get("type")),
+                    page if isinstance(page, int) else -1,
+                )
+                content_parts.append(content)
+                extra_parts.append(extra_bytes)
+                content_off += len(content)
+                extra_off += len(extra_bytes)
+
+            if any(len(self._strings[c]) != n_strings[c] for c in _CODED):
+                tmp = self._path("strings.json.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._strings, f)
+                os.replace(tmp, self._path("strings.json"))
+
+            for name, parts in (("content.heap", content_parts), ("extra.heap", extra_parts),
+                                ("chunks.rec", [records.tobytes()])):
+                with open(self._path(name), "ab") as f:
+                    f.write(b"".join(parts))
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._remap()
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __bool__(self) -> bool:
+        return len(self._records) > 0
+
+    def content(self, i: int) -> str:
+        rec = self._records[i]
+        off, length = int(rec["content_off"]), int(rec["content_len"])
+        if not length:
+            return ""
+        return self._content[off:off + length].decode("utf-8")
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        rec = self._records[i]
+        meta: Dict[str, Any] = {}
+        extra_len = int(rec["extra_len"])
+        if extra_len:
+            off = int(rec["extra_off"])
+            meta.update(json.loads(self._extra[off:off + extra_len].decode("utf-8")))
+        for col in _CODED:
+            code = int(rec[col])
+            if code >= 0:
+                meta[col] = self._strings[col][code]
+        if int(rec["page"]) >= 0:
+            meta["page"] = int(rec["page"])
+        meta["content"] = self.content(i)
+        return meta
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self._records)):
+            yield self[i]
+
+    def iter_content(self) -> Iterator[str]:
+        """Stream chunk texts without materialising the other columns."""
+        for i in range(len(self._records)):
+            yield self.content(i)
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw int32 codes of a fixed-width column ('source', 'type' or 'page')."""
+        return np.asarray(self._records[name])
+
+    def strings(self, column: str) -> List[str]:
+        return list(self._strings[column])
+
+    def count_by_source(self, live: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Chunks per source name; `live` optionally masks out deleted rows."""
+        codes = self.column("source")
+        if live is not None:
+            codes = codes[live[:len(codes)]]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self._strings["source"]))
+        return {name: int(c) for name, c in zip(self._strings["source"], counts) if c}
+
+    def _code_mask(self, records: np.ndarray, column: str, code: int) -> np.ndarray:
+        """Cached `records[column] == code`; `records` is the caller's snapshot of the rows."""
+        masks = self._masks
+        mask = masks.get((column, code))
+        if mask is None or len(mask) != len(records):
+            mask = np.asarray(records[column]) == code
+            masks[(column, code)] = mask
+        return mask
+
+    def filter_mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Boolean row mask for a metadata filter, or None when nothing is filtered.
+
+        Supported keys (all optional, ANDed together):
+          source / type : a name or list of names (OR within the key)
+          page_min / page_max : inclusive page range; rows without a page are excluded
+        """
+        if not filters:
+            return None
+        # One snapshot: a concurrent append remaps the records to a longer array
+        records = self._records
+        mask = np.ones(len(records), dtype=bool)
+        for col in _CODED:
+            wanted = filters.get(col)
+            if wanted is None:
+                continue
+            names: Iterable[str] = [wanted] if isinstance(wanted, str) else wanted
+            col_mask = np.zeros(len(records), dtype=bool)
+            for name in names:
+                code = self._codes[col].get(str(name))
+                if code is not None:
+                    col_mask |= self._code_mask(records, col, code)
+            mask &= col_mask
+        if filters.get("page_min") is not None or filters.get("page_max") is not None:
+            pages = np.asarray(records["page"])
+            mask &= pages >= max(int(filters.get("page_min") or 0), 0)
+            if filters.get("page_max") is not None:
+                mask &= pages <= int(filters["page_max"])
+        return mask
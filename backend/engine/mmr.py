@@ -0,0 +1,38 @@
+"""
+Maximal Marginal Relevance (Carbonell & Goldstein, 1998) over candidate embeddings.
+
+Picks candidates one at a time, each maximizing
+
+    lambda * relevance(d) - (1 - lambda) * max(cos(d, s) for s already picked)
+
+so a chunk that overlaps one already kept (the same PDF page cut into
+neighbouring chunks, a repeated paragraph) loses out to a slightly less
+relevant but different one. The pairwise similarities are one matrix
+product; each pick is a vectorized argmax over the running redundancy.
+"""
+import numpy as np
+
+
+def maximal_marginal_relevance(relevance: np.ndarray, vectors: np.ndarray, top_n: int,
+                               lambda_mult: float = 0.7) -> np.ndarray:
+    """
+    Indices of up to `top_n` candidates in pick order. `relevance` is higher
+    for better candidates; `vectors` are L2-normalized embeddings (a zero row
+    is never considered redundant).
+    """
+    n = len(relevance)
+    top_n = min(top_n, n)
+    if top_n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    similarity = vectors @ vectors.T
+    picked = np.zeros(top_n, dtype=np.int64)
+    available = np.ones(n, dtype=bool)
+    picked[0] = int(np.argmax(relevance))
+    available[picked[0]] = False
+    redundancy = similarity[picked[0]].copy()
+    for i in range(1, top_n):
+        score = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        picked[i] = int(np.argmax(score))
+        available[picked[i]] = False
+        np.maximum(redundancy, similarity[picked[i]], out=redundancy)
+    return picked
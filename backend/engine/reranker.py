@@ -1,16 +1,26 @@
 from sentence_transformers import CrossEncoder
+from collections import OrderedDict
 from typing import List, Dict, Any, Tuple
+import threading
 import time
 import logging
+from backend.core.config import settings
+from backend.engine.embedding_cache import normalize_text
 
 logger = logging.getLogger("rag_reranker")
 
 class Reranker:
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-TinyBERT-L-2-v2"):
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-TinyBERT-L-2-v2",
+                 cache_size: int = settings.RERANK_CACHE_SIZE):
         """
         Initialize the Cross-Encoder model.
         TinyBERT is chosen for valid adherence to free-tier (CPU/RAM) constraints.
+        Scores are cached per (normalized query, chunk_id), so repeated questions
+        skip the model for chunks they have already scored.
         """
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
         logger.info(f"Loading Reranker model: {model_name}")
         try:
             self.model = CrossEncoder(model_name, default_activation_function=None) # Logits or Sigmoid default
@@ -42,13 +52,24 @@ class Reranker:
             logger.warning("No valid content found in documents for reranking.")
             return documents[:top_k]
 
-        pairs = [[query, passage] for passage in valid_passages]
-        
-        start = time.time()
-        # Predict scores
-        scores = self.model.predict(pairs)
-        latency = (time.time() - start) * 1000
-        logger.info(f"Reranked {len(pairs)} documents in {latency:.0f}ms")
+        # Chunk ids are stable and chunk text never changes, so (query, chunk_id) identifies a score
+        query_key = normalize_text(query)
+        keys = [(query_key, documents[i]['chunk_id']) if 'chunk_id' in documents[i] else None
+                for i in valid_indices]
+        scores = [self._cached(key) for key in keys]
+        todo = [j for j, score in enumerate(scores) if score is None]
+
+        if todo:
+            pairs = [[query, valid_passages[j]] for j in todo]
+            start = time.time()
+            # Predict scores
+            predicted = self.model.predict(pairs)
+            latency = (time.time() - start) * 1000
+            logger.info(f"Reranked {len(pairs)} documents in {latency:.0f}ms "
+                        f"({len(scores) - len(todo)} cached)")
+            for j, score in zip(todo, predicted):
+                scores[j] = float(score)
+                self._store(keys[j], scores[j])
         
         # Combine scores with original docs
         ranked_results = []
@@ -62,3 +83,26 @@ class Reranker:
         ranked_results.sort(key=lambda x: x['rerank_score'], reverse=True)
         
         return ranked_results[:top_k]
+
+    def _cached(self, key):
+        if key is None or self.cache_size <= 0:
+            return None
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key, score: float):
+        if key is None or self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        """Forget cached scores (chunk ids restart in a newly published store generation)."""
+        with self._cache_lock:
+            self._cache.clear()
@@ -1,91 +1,297 @@
-from typing import List, Dict, Any
-from rank_bm25 import BM25Okapi
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Tuple
+from backend.engine.analyzer import Analyzer
+from backend.engine.embedding_cache import normalize_text
+from backend.engine.mmr import maximal_marginal_relevance
 from backend.engine.vector_store import VectorStore
 from backend.core.config import settings
 import numpy as np
 
+logger = logging.getLogger("rag_retriever")
+
+_leg_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_leg_pool() -> ThreadPoolExecutor:
+    global _leg_pool
+    if _leg_pool is None:
+        _leg_pool = ThreadPoolExecutor(max_workers=settings.HYBRID_SEARCH_WORKERS,
+                                       thread_name_prefix="hybrid-leg")
+    return _leg_pool
+
+
+def _timed(timings: Dict[str, Any], name: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def distinct_queries(queries: List[str], analyzer: Analyzer,
+                     threshold: float = settings.QUERY_VARIATION_JACCARD) -> Tuple[List[str], List[int]]:
+    """
+    Drop near-identical query variations: a query whose analyzed term set has
+    Jaccard similarity >= threshold with an earlier kept one (or, with no terms,
+    the same normalized text) is served by that query. Returns the kept queries
+    and, for each input query, the position of the kept query that serves it.
+    """
+    kept: List[str] = []
+    kept_terms: List[frozenset] = []
+    owner: List[int] = []
+    for query in queries:
+        terms = frozenset(analyzer(query)) or frozenset([normalize_text(query)])
+        for j, other in enumerate(kept_terms):
+            if len(terms & other) >= threshold * len(terms | other):
+                owner.append(j)
+                break
+        else:
+            owner.append(len(kept))
+            kept.append(query)
+            kept_terms.append(terms)
+    return kept, owner
+
+
+FUSION_METHODS = ("rrf", "minmax", "zscore", "dbsf")
+
+
+def _normalize(scores: np.ndarray, method: str, c: int) -> Tuple[np.ndarray, float]:
+    """One result list's contributions (best first in, higher is better out) and the value an absent id gets."""
+    if method == "rrf":
+        return 1.0 / (np.arange(len(scores)) + 1 + c), 0.0
+    if method == "minmax":
+        span = np.ptp(scores)
+        return ((scores - scores.min()) / span if span > 0 else np.ones_like(scores)), 0.0
+    mean, std = scores.mean(), scores.std()
+    if method == "zscore":
+        z = (scores - mean) / std if std > 0 else np.zeros_like(scores)
+        return z, float(z.min())  # an absent id counts as the list's worst hit
+    # dbsf: mean +/- 3 std of the list mapped onto [0, 1]
+    if std == 0:
+        return np.full_like(scores, 0.5), 0.0
+    return np.clip((scores - (mean - 3 * std)) / (6 * std), 0.0, 1.0), 0.0
+
+
+def fusion_components(id_lists: List[np.ndarray], score_lists: List[np.ndarray], method: str = "rrf",
+                      c: int = settings.HYBRID_RRF_C) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Normalize each ranked list (ids unique within a list, best first) with
+    `method` and spread the contributions over the union of ids. Returns the
+    sorted unique ids, the position where each first appears across the
+    concatenated lists (for tie-breaking) and a (lists x ids) matrix; the
+    fused scores are `weights @ matrix`.
+
+      rrf     1 / (rank + c), rank-based; ignores score scale
+      minmax  (s - min) / (max - min) per list
+      zscore  (s - mean) / std per list
+      dbsf    distribution-based: (s - (mean - 3 std)) / (6 std), clipped to [0, 1]
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}' (expected one of {', '.join(FUSION_METHODS)})")
+    ids = np.concatenate(id_lists) if id_lists else np.zeros(0, dtype=np.int64)
+    unique, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    components = np.zeros((len(id_lists), len(unique)))
+    start = 0
+    for i, scores in enumerate(score_lists):
+        n = len(scores)
+        if n:
+            norm, absent = _normalize(np.asarray(scores, dtype=np.float64), method, c)
+            components[i] = absent
+            components[i, inverse[start:start + n]] = norm
+        start += n
+    return unique, first, components
+
+
 class HybridRetriever:
     def __init__(self, vector_store: VectorStore):
         self.vector_store = vector_store
-        self.bm25 = None
-        self.documents = []  # In-memory docs for BM25. For production, efficient disk-based usage might be needed.
-        
-        # Initialize BM25 if there's data
-        if self.vector_store.metadata:
-            self._rebuild_bm25()
-
-    def _rebuild_bm25(self):
-        self.documents = [m.get('content', '') for m in self.vector_store.metadata]
-        tokenized_corpus = [doc.split(" ") for doc in self.documents]
-        self.bm25 = BM25Okapi(tokenized_corpus)
+
+    @property
+    def bm25(self):
+        # Persisted and updated incrementally by the store alongside the vectors
+        return self.vector_store.keywords
+
+    @property
+    def corpus_size(self) -> int:
+        return self.bm25.n_docs
+
+    def refresh(self) -> bool:
+        """Adopt index writes committed by other worker processes; True if anything changed."""
+        return self.vector_store.refresh()
 
     def reload(self):
-        """Reload FAISS index from disk and rebuild BM25 corpus (call after ingest/rebuild)."""
+        """Reload the vector and keyword indexes from disk (call after ingest/rebuild)."""
         self.vector_store.reload()
-        if self.vector_store.metadata:
-            self._rebuild_bm25()
+
+    def search(self, query: str, k: int = settings.TOP_K_RETRIEVAL, alpha: Optional[float] = None,
+               ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None,
+               timings: Optional[Dict[str, Any]] = None,
+               fusion: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Vector search (query embedding + FAISS) and BM25 run concurrently and are
+        fused with `fusion` (default HYBRID_FUSION; see fusion_components),
+        weighting the vector leg by `alpha` (default HYBRID_ALPHA) and the
+        keyword leg by 1 - alpha. A leg still running after HYBRID_LEG_TIMEOUT_MS
+        is dropped; if both are, the first to finish is used. `timings` receives
+        vector_ms / keyword_ms / fusion_ms and the names of `timed_out` legs
+        (a dropped leg records its time whenever it finishes).
+        """
+        return self.search_many([query], k=k, alpha=alpha, ef_search=ef_search, nprobe=nprobe,
+                                filters=filters, timings=timings, fusion=fusion)[0]
+
+    def search_many(self, queries: List[str], k: int = settings.TOP_K_RETRIEVAL, alpha: Optional[float] = None,
+                    ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None,
+                    timings: Optional[Dict[str, Any]] = None,
+                    fusion: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        search() for several query variations in one pass: near-identical
+        variations are dropped up front (see distinct_queries), the rest are
+        embedded in one batch, searched with one multi-row FAISS call per shard
+        and scored by BM25 together. Returns one fused list per input query;
+        a dropped variation gets the list of the query that covers it.
+        `timings` also receives `distinct_queries`.
+        """
+        alpha = settings.HYBRID_ALPHA if alpha is None else alpha
+        fusion = fusion or settings.HYBRID_FUSION
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method '{fusion}' (expected one of {', '.join(FUSION_METHODS)})")
+        timings = {} if timings is None else timings
+        kept, owner = distinct_queries(queries, self.bm25.analyzer)
+        timings["distinct_queries"] = len(kept)
+        pool = _get_leg_pool()
+        legs = {
+            "vector": pool.submit(_timed, timings, "vector", self.vector_store.search_many, kept, k=k,
+                                  ef_search=ef_search, nprobe=nprobe, filters=filters),
+            "keyword": pool.submit(_timed, timings, "keyword", self.keyword_search_many, kept, k, filters),
+        }
+        timeout = settings.HYBRID_LEG_TIMEOUT_MS / 1000 if settings.HYBRID_LEG_TIMEOUT_MS > 0 else None
+        done, _ = wait(legs.values(), timeout=timeout)
+        if not done:
+            done, _ = wait(legs.values(), return_when=FIRST_COMPLETED)
+        results: Dict[str, List[List[Dict[str, Any]]]] = {}
+        for name, future in legs.items():
+            if future in done:
+                results[name] = future.result()
+            else:
+                results[name] = [[] for _ in kept]
+                timings.setdefault("timed_out", []).append(name)
+                logger.warning(f"Hybrid search: {name} leg exceeded {settings.HYBRID_LEG_TIMEOUT_MS} ms, "
+                               f"fusing without it")
+
+        fused = _timed(timings, "fusion", lambda: [
+            self._fuse(vector, keyword, k=k, alpha=alpha, method=fusion)
+            for vector, keyword in zip(results["vector"], results["keyword"])
+        ])
+        return [fused[j] for j in owner]
+
+    def diversify(self, query: str, docs: List[Dict[str, Any]], top_n: int = settings.MMR_TOP_N,
+                  lambda_mult: float = settings.MMR_LAMBDA) -> List[Dict[str, Any]]:
+        """
+        Trim a candidate pool to `top_n` with Maximal Marginal Relevance before
+        reranking. Relevance is the candidates' fusion score (min-max scaled;
+        cosine to the query embedding when they have none to tell them apart),
+        redundancy the cosine between their stored embeddings.
+        """
+        if len(docs) <= top_n:
+            return docs
+        vectors = self.vector_store.chunk_vectors([d['chunk_id'] for d in docs])
+        relevance = np.array([d.get('fusion_score', 0.0) for d in docs], dtype=np.float64)
+        span = np.ptp(relevance)
+        if span > 0:
+            relevance = (relevance - relevance.min()) / span
         else:
-            self.bm25 = None
-            self.documents = []
-
-    def search(self, query: str, k: int = settings.TOP_K_RETRIEVAL, alpha: float = 0.5) -> List[Dict[str, Any]]:
-        # 1. Vector Search
-        vector_results = self.vector_store.search(query, k=k)
-        
-        # 2. Keyword Search (BM25)
-        keyword_results = []
-        if self.bm25:
-            tokenized_query = query.split(" ")
-            # Get scores
-            doc_scores = self.bm25.get_scores(tokenized_query)
-            # Get top k indices
-            top_n = np.argsort(doc_scores)[::-1][:k]
-            for idx in top_n:
-                if idx < len(self.vector_store.metadata):
-                    item = self.vector_store.metadata[idx].copy()
-                    item['score'] = doc_scores[idx]
-                    keyword_results.append(item)
-
-        # 3. Weighted Reciprocal Rank Fusion
-        return self._weighted_reciprocal_rank_fusion(vector_results, keyword_results, k=k, alpha=alpha)
-
-    def _weighted_reciprocal_rank_fusion(self, 
-                                list1: List[Dict[str, Any]], 
-                                list2: List[Dict[str, Any]], 
-                                k: int = 5, 
-                                c: int = 60,
-                                alpha: float = 0.5) -> List[Dict[str, Any]]:
+            relevance = vectors @ self.vector_store.embed_query(query)
+        return [docs[i] for i in maximal_marginal_relevance(relevance, vectors, top_n, lambda_mult)]
+
+    def expand_context(self, docs: List[Dict[str, Any]], mode: Optional[str] = None,
+                       window: int = settings.CONTEXT_WINDOW,
+                       max_chars: int = settings.CONTEXT_MAX_CHARS) -> List[str]:
+        """
+        Small-to-big: the text to hand the LLM for each ranked hit. "window"
+        widens a hit with up to `window` neighbouring chunks per side, "parent"
+        with the rest of its section, "off" keeps the chunk (default
+        CONTEXT_EXPANSION). Neighbours are added nearest first while the text
+        stays within `max_chars`; a side stops at a chunk an earlier hit
+        already showed. Each doc gets the `context_chunk_ids` it covers.
+        """
+        mode = mode or settings.CONTEXT_EXPANSION
+        if mode not in ("off", "window", "parent"):
+            raise ValueError(f"Unknown context expansion '{mode}' (expected off, window or parent)")
+        if mode == "off":
+            return [d.get('content', '') for d in docs]
+        shown = set()
+        texts = []
+        for d in docs:
+            chunks = self.vector_store.context_chunks(d['chunk_id'], window, window, section=mode == "parent")
+            ids = [c['chunk_id'] for c in chunks]
+            if d['chunk_id'] not in ids:  # deleted since it was retrieved
+                texts.append(d.get('content', ''))
+                continue
+            lo = hi = ids.index(d['chunk_id'])
+            size = len(chunks[lo]['content'])
+            grow = True
+            while grow:
+                grow = False
+                for side in (lo - 1, hi + 1):
+                    if 0 <= side < len(chunks) and ids[side] not in shown \
+                            and size + 1 + len(chunks[side]['content']) <= max_chars:
+                        size += len(chunks[side]['content']) + 1
+                        lo, hi = min(lo, side), max(hi, side)
+                        grow = True
+            d['context_chunk_ids'] = ids[lo:hi + 1]
+            shown.update(ids[lo:hi + 1])
+            texts.append(" ".join(c['content'] for c in chunks[lo:hi + 1]))
+        return texts
+
+    def keyword_search_many(self, queries: List[str], k: int,
+                             filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
         """
-        Combines two lists of results using Weighted RRF.
-        score = (alpha * (1 / (rank_vec + c))) + ((1 - alpha) * (1 / (rank_bm25 + c)))
+        The keyword leg of search_many on its own: BM25 top-k per query (each
+        result's `score` is its BM25 score), best first. Pair with
+        VectorStore.search_many for the vector leg, e.g. to re-fuse offline.
         """
-        rrf_score = {}
-        
-        # Helper to map content/id to object to deduplicate
-        content_map = {}
-
-        # Process Vector Results (list1) -> Tied to Alpha
-        for rank, item in enumerate(list1):
-            doc_id = item.get('id', hash(item.get('content', '')))
-            content_map[doc_id] = item
-            # Contribution from Vector Search
-            rrf_score[doc_id] = rrf_score.get(doc_id, 0) + (alpha * (1 / (rank + 1 + c)))
-
-        # Process Keyword Results (list2) -> Tied to (1 - Alpha)
-        for rank, item in enumerate(list2):
-            doc_id = item.get('id', hash(item.get('content', '')))
-            if doc_id not in content_map:
-                content_map[doc_id] = item
-            # Contribution from Keyword Search
-            rrf_score[doc_id] = rrf_score.get(doc_id, 0) + ((1 - alpha) * (1 / (rank + 1 + c)))
-
-        # Sort by RRF score
-        sorted_ids = sorted(rrf_score.keys(), key=lambda x: rrf_score[x], reverse=True)
-        
+        # Pinned once: a concurrent upload swaps in a new tombstone array
+        bm25, deleted = self.bm25, self.vector_store.deleted
+        canonical = self.vector_store.duplicates.canonical
+        if not bm25.n_docs:
+            return [[] for _ in queries]
+        allowed, matched = self.vector_store.filter_mask(filters, deleted, canonical)
+        if deleted.any():
+            # Deleted rows keep their postings until the next checkpoint
+            allowed = ~deleted if allowed is None else allowed[:len(deleted)] & ~deleted[:len(allowed)]
+        per_query = bm25.top_k_many([bm25.analyzer(q) for q in queries], k, allowed)
+        results = []
+        for rows, doc_scores in per_query:
+            hits = [(int(idx), float(score)) for idx, score in zip(rows, doc_scores)
+                    if idx < min(len(deleted), len(canonical)) and not deleted[idx] and canonical[idx] < 0]
+            results.append(self.vector_store.hit_results(hits, deleted, canonical, matched))
+        return results
+
+    def _fuse(self, list1: List[Dict[str, Any]], list2: List[Dict[str, Any]], k: int = 5,
+              alpha: float = 0.5, method: str = "rrf") -> List[Dict[str, Any]]:
+        """
+        Combines the vector (list1) and keyword (list2) results by chunk id:
+        fusion_score = alpha * norm(vector) + (1 - alpha) * norm(keyword),
+        with norm() chosen by `method` (weighted RRF for "rrf").
+        """
+        items = list1 + list2
+        if not items:
+            return []
+        ids = np.fromiter((item['chunk_id'] for item in items), dtype=np.int64, count=len(items))
+        scores = np.fromiter((item['score'] for item in items), dtype=np.float64, count=len(items))
+        n = len(list1)
+        _, first, components = fusion_components([ids[:n], ids[n:]], [scores[:n], scores[n:]], method)
+        fused = np.array([alpha, 1 - alpha]) @ components
+
+        # Best score first; ties keep first-seen order (vector results before keyword ones)
+        order = np.lexsort((first, -fused))[:k]
         final_results = []
-        for doc_id in sorted_ids[:k]:
-            item = content_map[doc_id]
-            item['rrf_score'] = rrf_score[doc_id]
+        for u in order:
+            item = items[first[u]]
+            item['fusion_score'] = float(fused[u])
             final_results.append(item)
-            
         return final_results
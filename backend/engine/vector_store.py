@@ -1,87 +1,1140 @@
 import os
+import fcntl
+import hashlib
 import json
+import logging
 import pickle
+import shutil
+import threading
 import faiss
 import numpy as np
-from typing import List, Dict, Any
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
 from backend.core.config import settings
+from backend.engine.index_factory import (
+    build_configured_index, build_index, candidate_count, clone_index, describe_index,
+    extract_vectors, index_quantization, needs_rebuild, read_index, search_params,
+    supports_selector, with_ids, write_index,
+)
+from backend.engine.bm25 import open_keyword_index
+from backend.engine.chunk_ids import ID_DTYPE, ChunkIds
+from backend.engine.chunk_links import LINK_DTYPE, ChunkLinks, link_batch
+from backend.engine.dedup import DUP_DTYPE, DuplicateMap, batch_near_duplicates, content_hashes
+from backend.engine.embeddings import get_chunk_cache, get_embeddings, get_query_cache
+from backend.engine.metadata_store import ChunkMetadataStore
+
+logger = logging.getLogger("rag_vector_store")
+
+# VECTOR_STORE_PATH/CURRENT names the live store generation (gen-<n>/); without
+# it the store files sit directly in VECTOR_STORE_PATH. A rebuild fills a fresh
+# generation next to the live one and publishes it by atomically replacing
+# CURRENT, so readers never see a half-built store. VECTOR_STORE_PATH/generation.lock
+# is held by a rebuild until it has published and by every upload/delete, so no
+# write lands in a generation that is about to be replaced.
+#
+# Store layout (one generation):
+#   index-<gen>-<shard>.faiss  checkpointed shard indexes (IndexIDMap keyed by row)
+#                              over rows [0, checkpoint)
+#   vectors.f32                append-only log of every embedding (row i = chunk i)
+#   chunks.rec, content.heap, extra.heap, strings.json
+#                              columnar chunk metadata (see metadata_store.py)
+#   tombstones.bin             packed bitmap of deleted rows
+#   duplicates.rec             content hash + canonical row per chunk (see dedup.py);
+#                              duplicate chunks keep their metadata row but no vector
+#                              in the index, and are reported on their canonical chunk
+#   ids.rec                    stable chunk id + document id per row (see chunk_ids.py);
+#                              results, deletes and caches use these, the index uses rows
+#   links.rec                  previous / next / section-head chunk id per row (see
+#                              chunk_links.py), followed to widen a hit's context
+#   bm25.*, bm25-<gen>.*.npy   incremental BM25 keyword index (see bm25.py); its
+#                              term-major checkpoint covers the same rows as the shards
+#   bm25.sqlite                FTS5 keyword index instead, with KEYWORD_BACKEND=sqlite
+#   manifest.json              committed row count, checkpoint row, current shard
+#                              files and shard hash; anything past the committed count
+#                              is a torn write
+#   write.lock, merge.lock     flock()s serialising writers across worker processes
+# Uploads only append; a background merge folds the delta rows into new shard
+# checkpoints once they exceed VECTOR_DELTA_MERGE_ROWS, and the same merge drops
+# tombstoned vectors once they exceed VECTOR_COMPACT_RATIO of a shard.
+#
+# With VECTOR_SHARDS > 1 chunks are partitioned by a hash of their source file
+# (see shard_of); a search scatters to every shard on a thread pool (FAISS
+# releases the GIL) and merges the per-shard top-k. Merges only rewrite shards
+# that changed.
+#
+# Several worker processes can open the same store: index files and logs are
+# memory-mapped, so the page cache holds one copy. Writers take write.lock and
+# first catch up with the manifest; readers compare the manifest's stat stamp
+# per request (is_stale) and refresh() to adopt other workers' writes.
+
+# Filters matching at most this many rows skip the ANN index for an exact scan
+_EXACT_FILTER_ROWS = 4096
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    if _search_pool is None:
+        _search_pool = ThreadPoolExecutor(max_workers=settings.VECTOR_SHARDS,
+                                          thread_name_prefix="vector-shard")
+    return _search_pool
+
+
+_POINTER = "CURRENT"
+_GENERATION_LOCK = "generation.lock"
+_GENERATION_PREFIX = "gen-"
+
+
+def active_store_path() -> str:
+    """Directory of the currently published store generation."""
+    root = settings.VECTOR_STORE_PATH
+    pointer = os.path.join(root, _POINTER)
+    if os.path.exists(pointer):
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        if name:
+            return os.path.join(root, name)
+    return root
+
+
+def _store_generation(path: str) -> int:
+    name = os.path.basename(os.path.normpath(path))
+    return int(name[len(_GENERATION_PREFIX):]) if name.startswith(_GENERATION_PREFIX) else 0
+
+
+def next_store_path() -> str:
+    """Empty directory for the next store generation (not visible until published)."""
+    root = settings.VECTOR_STORE_PATH
+    os.makedirs(root, exist_ok=True)
+    existing = [_store_generation(os.path.join(root, d)) for d in os.listdir(root)
+                if d.startswith(_GENERATION_PREFIX)]
+    path = os.path.join(root, f"{_GENERATION_PREFIX}{max(existing + [0]) + 1:06d}")
+    os.makedirs(path)
+    return path
+
+
+def publish_store_path(path: str):
+    """
+    Atomically make `path` the live store generation. The generation it replaces
+    is kept (readers that pinned it may still page in its files); anything older,
+    including a pre-generation store in the root directory, is removed.
+    """
+    root = settings.VECTOR_STORE_PATH
+    previous = active_store_path()
+    tmp = os.path.join(root, _POINTER + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(os.path.normpath(path)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, _POINTER))
+
+    keep = {os.path.normpath(path), os.path.normpath(previous)}
+    for name in os.listdir(root):
+        full = os.path.normpath(os.path.join(root, name))
+        if full in keep or name in (_POINTER, _GENERATION_LOCK):
+            continue
+        if name.startswith(_GENERATION_PREFIX) and os.path.isdir(full):
+            if _store_generation(full) < _store_generation(path):
+                shutil.rmtree(full, ignore_errors=True)
+        elif os.path.isfile(full) and os.path.normpath(root) not in keep:
+            os.remove(full)  # root-level files of the pre-generation layout
+    logger.info(f"Published vector store generation {os.path.basename(path)}")
+
+
+@contextmanager
+def _flock(path: str):
+    """Exclusive advisory lock on `path`, held across processes (and threads)."""
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def generation_lock():
+    """
+    Exclusive cross-process lock on the published generation: hold it to write
+    to the live store or to build and publish the next one.
+    """
+    root = settings.VECTOR_STORE_PATH
+    os.makedirs(root, exist_ok=True)
+    return _flock(os.path.join(root, _GENERATION_LOCK))
+
+
+# Recorded in the manifest; shards partitioned by another hash are rebuilt on load
+_SHARD_HASH = "blake2b"
+
+
+def shard_of(source: Optional[str], n_shards: int) -> int:
+    """
+    Stable shard for a source filename. blake2b rather than the builtin hash
+    (salted per process) or crc32 (names differing in one digit cluster in a
+    few shards).
+    """
+    if n_shards <= 1 or not source:
+        return 0
+    digest = hashlib.blake2b(source.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % n_shards
+
 
 class VectorStore:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL_NAME,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        self.index = None
-        self.metadata: List[Dict[str, Any]] = []
-        
-        # Determine dimension from model (384 for all-MiniLM-L6-v2)
-        # We'll initialize lazily or load from disk
-        self._load_or_initialize()
+    def __init__(self, path: Optional[str] = None):
+        self.embeddings = get_embeddings()
+        self.embedding_cache = get_chunk_cache()
+        self.query_cache = get_query_cache()
+        self.path = path or active_store_path()
+        self.shards: List[faiss.Index] = []   # checkpointed shard indexes, rows [0, checkpoint)
+        self.shard_files: List[str] = []
+        self.delta = None                      # flat index over rows [checkpoint, count)
+        self.checkpoint = 0
+        self.generation = 0
+        self.metadata: Optional[ChunkMetadataStore] = None
+        self.duplicates = DuplicateMap(self.path)
+        self.ids = ChunkIds(self.path)
+        self.links = ChunkLinks(self.path)
+        self.keywords = None                   # opened by _load() once the directory exists
+        self.deleted = np.zeros(0, dtype=bool)
+        self.dim = settings.EMBEDDING_DIM
+        self.n_shards = max(1, settings.VECTOR_SHARDS)
+        self._vectors_map: Optional[np.memmap] = None
+
+        self._lock = threading.Lock()        # guards in-memory state + appends
+        self._merge_lock = threading.Lock()  # serialises merges/compactions
+        self._merge_thread: Optional[threading.Thread] = None
+        self._stamp: Optional[Tuple[int, int, int]] = None  # manifest version this state reflects
+        self._load()
+
+    # ── persistence ──────────────────────────────────────────────────────────
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _index_file(generation: int, shard: int) -> str:
+        return f"index-{generation:06d}-{shard:02d}.faiss"
+
+    @property
+    def count(self) -> int:
+        return len(self.metadata)
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+        # Loading may repair or migrate the store, so it excludes other processes' writers
+        with _flock(self._path("merge.lock")), _flock(self._path("write.lock")):
+            self._load_or_initialize()
+            self._stamp = self._manifest_stamp()
 
     def _load_or_initialize(self):
-        os.makedirs(settings.VECTOR_STORE_PATH, exist_ok=True)
+        legacy_index = self._path("index.faiss")
+        manifest_path = self._path("manifest.json")
+        self.metadata = ChunkMetadataStore(self.path)
+        self.duplicates = DuplicateMap(self.path)
+        self.ids = ChunkIds(self.path)
+        self.links = ChunkLinks(self.path)
+        self.keywords = open_keyword_index(self.path)
+        self._vectors_map = None
+
+        if not os.path.exists(manifest_path) and os.path.exists(legacy_index):
+            self._migrate_legacy_store(legacy_index)
+        elif os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            committed = manifest["count"]
+            if "index_files" in manifest:
+                files = manifest["index_files"]
+            elif "index_file" in manifest:
+                files = [manifest["index_file"]]  # single-index checkpoint
+            else:
+                files = None                      # positional index.faiss, no row ids
+
+            if files is not None:
+                self.generation = manifest["generation"]
+                self.checkpoint = manifest["checkpoint"]
+            else:
+                self.generation = 0
+                self.checkpoint = faiss.read_index(legacy_index).ntotal if os.path.exists(legacy_index) else 0
 
-        index_path = os.path.join(settings.VECTOR_STORE_PATH, "index.faiss")
-        meta_json = os.path.join(settings.VECTOR_STORE_PATH, "metadata.json")
-        meta_pkl  = os.path.join(settings.VECTOR_STORE_PATH, "metadata.pkl")
+            self._import_json_metadata(committed)
+            self._truncate_logs(committed)
+            self.deleted = self._read_tombstones()
+            self.duplicates.load(committed, self.metadata.content)
+            self.ids.load(committed, self.metadata.column("source"))
+            self.links.load(committed, self.ids.records, self.metadata.column("page"), persist=True)
+            self.keywords.load(committed, self.indexed_mask(0, committed), manifest.get("bm25_file"),
+                               self.checkpoint, self.metadata.content)
 
-        if os.path.exists(index_path) and (os.path.exists(meta_json) or os.path.exists(meta_pkl)):
-            self.index = faiss.read_index(index_path)
-            if os.path.exists(meta_json):
-                with open(meta_json, "r", encoding="utf-8") as f:
-                    self.metadata = json.load(f)
+            partitioned = self.n_shards == 1 or manifest.get("shard_hash") == _SHARD_HASH
+            if files is not None and len(files) == self.n_shards and partitioned:
+                # A shard that has never received rows has no file yet
+                self.shards = [self._read_index(f) if f else with_ids(build_index("flat", self.dim))
+                               for f in files]
+                self.shard_files = list(files)
+                stale = [s for s in range(self.n_shards) if needs_rebuild(self.shards[s])]
             else:
-                # One-time migration from legacy pickle format
-                with open(meta_pkl, "rb") as f:
-                    self.metadata = pickle.load(f)
-                self.save()          # write JSON
-                os.remove(meta_pkl)  # drop the pickle file
+                # No row-keyed checkpoint yet, or VECTOR_SHARDS / the shard hash changed: re-partition
+                self.shards = [None] * self.n_shards
+                self.shard_files = [""] * self.n_shards
+                stale = list(range(self.n_shards))
+            self.delta = self._build_delta(self.checkpoint, self.count)
+            if stale or self.keywords.base_rows != self.checkpoint:
+                self._publish_checkpoint({s: self._build_shard(s, self.checkpoint) for s in stale},
+                                         self.checkpoint)
+            if os.path.exists(legacy_index):
+                os.remove(legacy_index)
         else:
-            self.index = faiss.IndexFlatIP(384)
-            self.metadata = []
-
-    def add_documents(self, texts: List[str], metadatas: List[Dict[str, Any]]):
-        embeddings = self.embeddings.embed_documents(texts)
-        embeddings_np = np.array(embeddings).astype("float32")
-        
-        if self.index is None:
-             self.index = faiss.IndexFlatIP(len(embeddings[0]))
-             
-        self.index.add(embeddings_np)
-        self.metadata.extend(metadatas)
-        self.save()
-
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        if self.index is None or self.index.ntotal == 0:
-            return []
-            
-        query_embedding = self.embeddings.embed_query(query)
-        query_np = np.array([query_embedding]).astype("float32")
-        
-        # D: distances, I: indices
-        D, I = self.index.search(query_np, k)
-        
+            self.shards = [with_ids(build_index("flat", self.dim)) for _ in range(self.n_shards)]
+            self.shard_files = [""] * self.n_shards
+            self.delta = with_ids(build_index("flat", self.dim))
+            self.checkpoint = 0
+            self.generation = 0
+            self.deleted = np.zeros(0, dtype=bool)
+            self.duplicates.load(0)
+            self.ids.load(0)
+            self.links.load(0)
+            self.keywords.load(0, self.deleted, None, 0)
+
+    def _migrate_legacy_store(self, index_path: str):
+        """One-time conversion of a pre-log store (index.faiss + metadata.json/.pkl)."""
+        legacy = faiss.read_index(index_path)
+        vectors = extract_vectors(legacy)
+        with open(self._path("vectors.f32"), "wb") as f:
+            f.write(np.ascontiguousarray(vectors, dtype="float32").tobytes())
+        self.checkpoint = legacy.ntotal
+        self.generation = 0
+
+        meta_pkl = self._path("metadata.pkl")
+        if os.path.exists(meta_pkl):
+            with open(meta_pkl, "rb") as f:
+                self.metadata.append(pickle.load(f))
+            os.remove(meta_pkl)
+        self._import_json_metadata(self.checkpoint)
+
+        self.deleted = np.zeros(self.count, dtype=bool)
+        self.duplicates.load(self.count, self.metadata.content)
+        self.ids.load(self.count, self.metadata.column("source"))
+        self.links.load(self.count, self.ids.records, self.metadata.column("page"), persist=True)
+        self.keywords.load(self.count, self.indexed_mask(0, self.count), None, 0, self.metadata.content)
+        self.shards = [None] * self.n_shards
+        self.shard_files = [""] * self.n_shards
+        self.delta = with_ids(build_index("flat", self.dim))
+        self._publish_checkpoint({s: self._build_shard(s, self.checkpoint) for s in range(self.n_shards)},
+                                 self.checkpoint)
+        os.remove(index_path)
+
+    def _import_json_metadata(self, committed: int):
+        """
+        One-time import of metadata.json (checkpointed rows) and metadata.jsonl
+        (logged delta rows) written by earlier versions into the columnar store.
+        """
+        meta_json = self._path("metadata.json")
+        meta_log = self._path("metadata.jsonl")
+        if len(self.metadata) or not (os.path.exists(meta_json) or os.path.exists(meta_log)):
+            return
+
+        rows: List[Dict[str, Any]] = []
+        if os.path.exists(meta_json):
+            with open(meta_json, "r", encoding="utf-8") as f:
+                rows = json.load(f)[:self.checkpoint]
+        if os.path.exists(meta_log):
+            with open(meta_log, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn final line
+                    if len(rows) <= entry["row"] < committed:
+                        rows.append(entry["meta"])
+        logger.info(f"Importing {len(rows)} metadata rows into the columnar store")
+        self.metadata.append(rows)
+        for path in (meta_json, meta_log):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _read_vectors(self, start: int, stop: int) -> np.ndarray:
+        """Read rows [start, stop) from the vector log."""
+        if stop <= start:
+            return np.zeros((0, self.dim), dtype="float32")
+        row_bytes = self.dim * 4
+        with open(self._path("vectors.f32"), "rb") as f:
+            f.seek(start * row_bytes)
+            buf = f.read((stop - start) * row_bytes)
+        return np.frombuffer(buf, dtype="float32").reshape(-1, self.dim).copy()
+
+    def _vector_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Gather float32 vectors for arbitrary rows via a memory map of the vector log."""
+        vectors = self._vectors_map
+        if vectors is None or (len(rows) and int(np.max(rows)) >= len(vectors)):
+            n = os.path.getsize(self._path("vectors.f32")) // (self.dim * 4)
+            vectors = np.memmap(self._path("vectors.f32"), dtype="float32", mode="r", shape=(n, self.dim))
+            self._vectors_map = vectors  # re-mapped only when the log has grown
+        return np.asarray(vectors[rows])
+
+    def _read_index(self, name: str) -> faiss.Index:
+        """
+        Load a shard checkpoint. With VECTOR_INDEX_MMAP the vector codes stay in
+        the file and are paged in on demand, so a large store is query-ready
+        without reading it into RAM first. Such an index is read-only.
+        """
+        flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if settings.VECTOR_INDEX_MMAP else 0
+        return read_index(self._path(name), flags)
+
+    def _row_shards(self, stop: int) -> np.ndarray:
+        """Shard number of every row in [0, stop), derived from its source column."""
+        if self.n_shards == 1:
+            return np.zeros(stop, dtype=np.int32)
+        per_code = np.array([shard_of(name, self.n_shards) for name in self.metadata.strings("source")]
+                            + [0], dtype=np.int32)  # trailing 0 catches code -1 (no source)
+        return per_code[self.metadata.column("source")[:stop]]
+
+    def indexed_mask(self, start: int, stop: int) -> np.ndarray:
+        """Mask of rows in [start, stop) that belong in the index: live and not a duplicate."""
+        keep = ~self.deleted[start:stop]
+        canonical = self.duplicates.canonical[start:stop]
+        keep[:len(canonical)] &= canonical < 0
+        return keep
+
+    def indexed_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and float32 vectors of every chunk the index serves (live, not a collapsed duplicate)."""
+        rows = self._live_rows(0, self.count)
+        return rows, self._vector_rows(rows)
+
+    def _live_rows(self, start: int, stop: int, shard: Optional[int] = None) -> np.ndarray:
+        rows = np.arange(start, stop, dtype="int64")
+        keep = self.indexed_mask(start, stop)
+        if shard is not None and self.n_shards > 1:
+            keep &= self._row_shards(stop)[start:stop] == shard
+        return rows[keep]
+
+    def _build_shard(self, shard: int, upto: int) -> faiss.Index:
+        """Build the configured index over the live rows of one shard in [0, upto)."""
+        rows = self._live_rows(0, upto, shard)
+        if not len(rows):
+            return with_ids(build_index("flat", self.dim))
+        vectors = self._vector_rows(rows)
+        index = build_configured_index(self.dim, vectors)
+        index.add_with_ids(vectors, rows)
+        return index
+
+    def _build_delta(self, start: int, stop: int) -> faiss.Index:
+        delta = with_ids(build_index("flat", self.dim))
+        rows = self._live_rows(start, stop)
+        if len(rows):
+            delta.add_with_ids(self._vector_rows(rows), rows)
+        return delta
+
+    def _truncate_logs(self, committed: int):
+        """Drop rows past the committed count (left by a crash mid-append)."""
+        self.metadata.truncate(committed)
+        vec_path = self._path("vectors.f32")
+        if os.path.exists(vec_path) and os.path.getsize(vec_path) > committed * self.dim * 4:
+            os.truncate(vec_path, committed * self.dim * 4)
+        dup_path = self._path("duplicates.rec")
+        if os.path.exists(dup_path) and os.path.getsize(dup_path) > committed * DUP_DTYPE.itemsize:
+            os.truncate(dup_path, committed * DUP_DTYPE.itemsize)
+        ids_path = self._path("ids.rec")
+        if os.path.exists(ids_path) and os.path.getsize(ids_path) > committed * ID_DTYPE.itemsize:
+            os.truncate(ids_path, committed * ID_DTYPE.itemsize)
+        links_path = self._path("links.rec")
+        if os.path.exists(links_path) and os.path.getsize(links_path) > committed * LINK_DTYPE.itemsize:
+            os.truncate(links_path, committed * LINK_DTYPE.itemsize)
+        self.keywords.truncate(committed)
+
+    def _read_tombstones(self, count: Optional[int] = None) -> np.ndarray:
+        count = self.count if count is None else count
+        deleted = np.zeros(count, dtype=bool)
+        path = self._path("tombstones.bin")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                bits = np.unpackbits(np.frombuffer(f.read(), dtype=np.uint8), bitorder="little")
+            n = min(len(bits), count)
+            deleted[:n] = bits[:n].astype(bool)
+        return deleted
+
+    def _write_tombstones(self):
+        tmp = self._path("tombstones.bin.tmp")
+        with open(tmp, "wb") as f:
+            f.write(np.packbits(self.deleted, bitorder="little").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path("tombstones.bin"))
+
+    def _write_manifest(self):
+        tmp = self._path("manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "count": self.count,
+                "dim": self.dim,
+                "checkpoint": self.checkpoint,
+                "generation": self.generation,
+                "shards": self.n_shards,
+                "shard_hash": _SHARD_HASH,
+                "index_files": self.shard_files,
+                "bm25_file": self.keywords.base_name,
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path("manifest.json"))
+        self._stamp = self._manifest_stamp()
+
+    def _write_shard_files(self, rebuilt: Dict[int, faiss.Index], generation: int) -> Dict[int, str]:
+        files = {}
+        for s, index in rebuilt.items():
+            files[s] = self._index_file(generation, s)
+            write_index(index, self._path(files[s]))
+        return files
+
+    def _swap_checkpoint(self, rebuilt: Dict[int, faiss.Index], files: Dict[int, str],
+                         keyword_base: str, checkpoint: int, generation: int):
+        """
+        Point the manifest at already-written shard and keyword checkpoint files
+        and drop the replaced ones. A crash before the manifest swap leaves the
+        previous checkpoint live.
+        """
+        shards, shard_files = list(self.shards), list(self.shard_files)
+        for s, index in rebuilt.items():
+            shards[s] = index
+            shard_files[s] = files[s]
+        self.keywords.set_base(keyword_base, checkpoint)
+        self.shards, self.shard_files = shards, shard_files
+        self.checkpoint = checkpoint
+        self.generation = generation
+        self._write_manifest()
+        # Replaced shard files (and those of a previous VECTOR_SHARDS layout)
+        for name in os.listdir(self.path):
+            if name.startswith("index-") and name.endswith(".faiss") and name not in shard_files:
+                os.remove(self._path(name))
+            elif name.startswith("bm25-") and name.endswith(".npy") and not name.startswith(keyword_base + "."):
+                os.remove(self._path(name))
+
+    def _publish_checkpoint(self, rebuilt: Dict[int, faiss.Index], checkpoint: int):
+        generation = self.generation + 1
+        files = self._write_shard_files(rebuilt, generation)
+        keyword_base = self.keywords.write_base(generation, checkpoint, self.indexed_mask(0, checkpoint))
+        self._swap_checkpoint(rebuilt, files, keyword_base, checkpoint, generation)
+        for s, index in rebuilt.items():
+            logger.info(f"Vector shard {s}: {describe_index(index)}")
+
+    # ── multi-process coordination ───────────────────────────────────────────
+
+    def _manifest_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self._path("manifest.json"))
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)  # replaced atomically on every commit
+
+    def is_stale(self) -> bool:
+        """True when another process has committed writes this store hasn't loaded (one stat call)."""
+        return self._manifest_stamp() != self._stamp
+
+    def refresh(self) -> bool:
+        """Adopt writes committed by other processes; returns True if anything changed."""
+        if not self.is_stale():
+            return False
+        with self._lock:
+            return self._catch_up()
+
+    def _catch_up(self) -> bool:
+        """Load the committed on-disk state (rows, tombstones, checkpoints). Caller holds self._lock."""
+        for _ in range(3):
+            stamp = self._manifest_stamp()
+            if stamp is None or stamp == self._stamp:
+                return False
+            with open(self._path("manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            files = manifest["index_files"]
+            committed = manifest["count"]
+            try:
+                shards = [
+                    self.shards[self.shard_files.index(f)] if f in self.shard_files and f
+                    else self._read_index(f) if f
+                    else with_ids(build_index("flat", self.dim))
+                    for f in files
+                ]
+                self.metadata.refresh()
+                self.deleted = self._read_tombstones(committed)
+                self.duplicates.load(committed)
+                self.ids.load(committed)
+                self.links.load(committed)
+                self.keywords.load(committed, self.indexed_mask(0, committed), manifest.get("bm25_file"),
+                                   manifest["checkpoint"])
+            except (RuntimeError, FileNotFoundError):
+                continue  # a merge replaced those files after we read the manifest; re-read it
+            break
+        else:
+            return False
+
+        self.shards, self.shard_files = shards, list(files)
+        self.checkpoint, self.generation = manifest["checkpoint"], manifest["generation"]
+        self.delta = self._build_delta(self.checkpoint, committed)
+        self._stamp = stamp
+        logger.info(f"Refreshed vector store from disk: {committed} rows, generation {self.generation}")
+        return True
+
+    def _prepare_write(self):
+        """Under write.lock: catch up with other writers and drop any torn tail they left."""
+        self._catch_up()
+        self._truncate_logs(len(self.deleted))
+
+    # ── compaction bookkeeping ───────────────────────────────────────────────
+
+    def _dead_per_shard(self) -> List[int]:
+        """Tombstoned vectors still physically present in each checkpointed shard."""
+        live = self.indexed_mask(0, self.checkpoint)
+        live_counts = np.bincount(self._row_shards(self.checkpoint)[live], minlength=self.n_shards)
+        return [max(int(self.shards[s].ntotal) - int(live_counts[s]), 0) for s in range(self.n_shards)]
+
+    def _shards_to_compact(self) -> List[int]:
+        return [s for s, dead in enumerate(self._dead_per_shard())
+                if self.shards[s].ntotal and dead / self.shards[s].ntotal >= settings.VECTOR_COMPACT_RATIO]
+
+    # ── writes ───────────────────────────────────────────────────────────────
+
+    def add_documents(self, texts: List[str], metadatas: List[Dict[str, Any]],
+                      dedup: Optional[bool] = None):
+        """
+        Embed and append chunks. With `dedup` (default DEDUP_ENABLED) a chunk that
+        duplicates a live one, exactly or above DEDUP_NEAR_THRESHOLD cosine, is
+        stored without an index entry and reported on the chunk it collapses into.
+        """
+        if self.embedding_cache is not None:
+            embeddings_np = self.embedding_cache.embed_documents(texts, self.embeddings.embed_documents)
+        else:
+            embeddings_np = np.ascontiguousarray(np.array(self.embeddings.embed_documents(texts)), dtype="float32")
+        hashes = content_hashes(texts)
+        dedup = settings.DEDUP_ENABLED if dedup is None else dedup
+
+        with _flock(self._path("write.lock")), self._lock:
+            self._prepare_write()
+            if dedup:
+                canonical = self._find_duplicates(embeddings_np, hashes, self.count)
+            else:
+                canonical = np.full(len(texts), -1, dtype=np.int64)
+            self._append_rows(embeddings_np, metadatas, hashes, canonical)
+            self._write_manifest()
+        if dedup and (canonical >= 0).any():
+            logger.info(f"Collapsed {int((canonical >= 0).sum())} of {len(texts)} new chunks into existing ones")
+
+        if self.delta.ntotal >= settings.VECTOR_DELTA_MERGE_ROWS:
+            self._schedule_merge()
+
+    def _append_rows(self, vectors: np.ndarray, metadatas: List[Dict[str, Any]],
+                     hashes: np.ndarray, canonical: np.ndarray, ids: Optional[np.ndarray] = None,
+                     links: Optional[np.ndarray] = None):
+        """
+        Append rows to the logs and the delta; new chunks (in document order)
+        get fresh ids and links unless `ids` / `links` carry existing ones.
+        Caller holds the write locks and writes the manifest.
+        """
+        start = self.count
+        if ids is None:
+            ids = self.ids.assign(start, metadatas)
+            sections = [m.get("section", m.get("page")) for m in metadatas]
+            links = link_batch(ids["chunk"], ids["doc"],
+                               np.array([-1 if v is None else int(v) for v in sections], dtype=np.int64))
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.metadata.append(metadatas)
+        self.duplicates.append(hashes, canonical)
+        self.ids.append(ids)
+        self.links.append(links)
+        self.keywords.append([str(m.get("content", "")) for m in metadatas], canonical < 0)
+        # Copy-on-write: in-flight searches keep using the delta/tombstones they pinned
+        delta = faiss.clone_index(self.delta)
+        indexed = np.flatnonzero(canonical < 0)
+        if len(indexed):
+            delta.add_with_ids(vectors[indexed], (start + indexed).astype("int64"))
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(metadatas), dtype=bool)])
+        self.delta = delta
+
+    def _find_duplicates(self, vectors: np.ndarray, hashes: np.ndarray, start: int) -> np.ndarray:
+        """
+        Canonical row for each new chunk (new rows are numbered from `start`), or
+        -1 if it is new content: exact hash matches first, then the nearest
+        indexed chunk, then earlier chunks of the same batch.
+        """
+        canonical = self.duplicates.exact_matches(hashes, ~self.deleted)
+        first: Dict[int, int] = {}
+        for i, h in enumerate(hashes.tolist()):
+            if canonical[i] < 0:
+                j = first.setdefault(h, i)
+                if j != i:
+                    canonical[i] = start + j
+
+        threshold = settings.DEDUP_NEAR_THRESHOLD
+        if threshold <= 1.0:
+            todo = np.flatnonzero(canonical < 0)
+            if len(todo):
+                scores, rows = self._nearest_indexed(vectors[todo])
+                hit = scores >= threshold
+                canonical[todo[hit]] = rows[hit]
+            in_batch = batch_near_duplicates(vectors, threshold, np.where(canonical >= 0, canonical, -1))
+            newly = (canonical < 0) & (in_batch >= 0)
+            canonical[newly] = start + in_batch[newly]
+
+        # A batch row may itself have collapsed into something later in the pass
+        for i in range(len(canonical)):
+            target = canonical[i]
+            if target >= start and canonical[target - start] >= 0:
+                canonical[i] = canonical[target - start]
+        return canonical
+
+    def _nearest_indexed(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact cosine and row of the closest live indexed chunk for each vector (-inf/-1 if none)."""
+        live = ~self.deleted if self.deleted.any() else None
+        selector = self._selector(live)
+        candidates = []
+        for index in [*self.shards, self.delta]:
+            if index is None or not index.ntotal:
+                continue
+            k = min(candidate_count(index, 1), index.ntotal)
+            _, I = self._index_search(index, vectors, k, selector, live)
+            candidates.append(I)
+        if not candidates:
+            return np.full(len(vectors), -np.inf, dtype="float32"), np.full(len(vectors), -1, dtype=np.int64)
+        rows = np.hstack(candidates)
+        # Approximate indexes only shortlist; the threshold is applied to exact scores
+        cand_vectors = self._vector_rows(np.maximum(rows, 0).ravel()).reshape(*rows.shape, self.dim)
+        scores = np.einsum("nd,nkd->nk", vectors, cand_vectors)
+        scores[rows < 0] = -np.inf
+        best = scores.argmax(axis=1)
+        picked = np.arange(len(vectors))
+        return scores[picked, best], rows[picked, best].astype(np.int64)
+
+    def delete_by_source(self, source: str) -> int:
+        """
+        Tombstone every chunk of `source`. Searches exclude them immediately;
+        the vectors themselves are dropped by the next compaction. A deleted
+        chunk that live duplicates from other sources collapse into is re-added
+        as one of them, so their content stays searchable.
+        """
+        def rows_of_source():
+            names = self.metadata.strings("source")
+            if source not in names:
+                return np.zeros(0, dtype=np.int64)
+            return np.flatnonzero(self.metadata.column("source") == names.index(source))
+
+        removed = self._delete_rows(rows_of_source)
+        if removed:
+            logger.info(f"Tombstoned {removed} chunks from '{source}'")
+        return removed
+
+    def delete_chunks(self, chunk_ids: List[int]) -> int:
+        """Tombstone chunks by their stable chunk id (see delete_by_source)."""
+        wanted = np.asarray(chunk_ids, dtype=np.int64)
+        return self._delete_rows(lambda: self.ids.rows_of(wanted, ~self.deleted))
+
+    def delete_document(self, doc_id: int) -> int:
+        """Tombstone every chunk of one ingested document (see delete_by_source)."""
+        return self._delete_rows(lambda: np.flatnonzero(self.ids.doc == doc_id))
+
+    def _delete_rows(self, select_rows) -> int:
+        """Tombstone the live rows returned by `select_rows()`, evaluated under the write locks."""
+        with _flock(self._path("write.lock")), self._lock:
+            self._prepare_write()
+            rows = select_rows()
+            rows = rows[~self.deleted[rows]]
+            if not len(rows):
+                return 0
+            deleted = self.deleted.copy()
+            deleted[rows] = True
+            self.keywords.remove(rows[self.duplicates.canonical[rows] < 0])
+            self._promote_duplicates(rows, deleted)
+            self._write_tombstones()
+            self._write_manifest()  # bumps the version other workers poll
+            # The flat delta supports removal, so its rows can go right away
+            in_delta = rows[rows >= self.checkpoint].astype("int64")
+            if len(in_delta):
+                delta = faiss.clone_index(self.delta)
+                delta.remove_ids(in_delta)
+                self.delta = delta
+
+        if self._shards_to_compact():
+            self._schedule_merge()
+        return int(len(rows))
+
+    def _promote_duplicates(self, rows: np.ndarray, deleted: np.ndarray):
+        """
+        For each deleted canonical row in `rows` with live duplicates, append the
+        first duplicate again as a new canonical row (a fresh row lands in the
+        delta), tombstone the old copy and re-point the others at it. Publishes
+        `deleted` (grown by the appended rows) as self.deleted.
+        """
+        canonical = self.duplicates.canonical
+        orphans = np.flatnonzero(np.isin(canonical, rows) & ~deleted[:len(canonical)])
+        if not len(orphans):
+            self.deleted = deleted
+            return
+        orphans = orphans[np.argsort(canonical[orphans], kind="stable")]
+        groups = np.split(orphans, np.flatnonzero(np.diff(canonical[orphans])) + 1)
+        heirs = np.array([group[0] for group in groups], dtype=np.int64)
+        start = self.count
+        self._append_rows(self._vector_rows(heirs), [self.metadata[int(r)] for r in heirs],
+                          self.duplicates.hashes[heirs], np.full(len(heirs), -1, dtype=np.int64),
+                          self.ids.records[heirs], self.links.records[heirs])
+        deleted = np.concatenate([deleted, np.zeros(len(heirs), dtype=bool)])
+        deleted[heirs] = True
+        self.deleted = deleted
+        rest = np.concatenate([group[1:] for group in groups])
+        if len(rest):
+            new_rows = np.concatenate([np.full(len(g) - 1, start + i) for i, g in enumerate(groups)])
+            self.duplicates.repoint(rest, new_rows)
+        logger.info(f"Re-indexed {len(heirs)} deleted chunks still referenced by live duplicates")
+
+    def _schedule_merge(self):
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self.merge, name="vector-store-merge", daemon=True)
+        self._merge_thread.start()
+
+    def merge(self):
+        """
+        Fold the delta into new shard checkpoints, compacting tombstoned vectors
+        out of shards when due. Only shards that received rows or need compaction
+        are rewritten. The expensive part (index build + write) runs without the
+        state lock; rows appended or deleted meanwhile are reconciled at the swap.
+        """
+        with self._merge_lock, _flock(self._path("merge.lock")):
+            with _flock(self._path("write.lock")), self._lock:
+                self._prepare_write()  # another worker may have merged or appended
+                upto = self.count
+                base = self.checkpoint
+                shards = list(self.shards)
+                shard_files = list(self.shard_files)
+                generation = self.generation + 1
+                compact = set(self._shards_to_compact())
+                indexed = self.indexed_mask(0, upto)
+            if upto == base and not compact:
+                return
+
+            new_rows = self._live_rows(base, upto)
+            new_shards = self._row_shards(upto)[new_rows]
+            rebuilt: Dict[int, faiss.Index] = {}
+            for s in range(self.n_shards):
+                if s in compact:
+                    rebuilt[s] = self._build_shard(s, upto)
+                    continue
+                rows = new_rows[new_shards == s]
+                if not len(rows):
+                    continue
+                # Memory-mapped checkpoints are read-only: grow a private in-RAM copy
+                index = read_index(self._path(shard_files[s])) if shard_files[s] else clone_index(shards[s])
+                index.add_with_ids(self._vector_rows(rows), rows)
+                rebuilt[s] = self._build_shard(s, upto) if needs_rebuild(index) else index
+            files = self._write_shard_files(rebuilt, generation)
+            keyword_base = self.keywords.write_base(generation, upto, indexed)
+
+            with _flock(self._path("write.lock")), self._lock:
+                self._prepare_write()
+                self._swap_checkpoint(rebuilt, files, keyword_base, upto, generation)
+                self.delta = self._build_delta(upto, self.count)
+            logger.info(f"Merged vector delta: checkpoint now {upto} rows, rewrote shards "
+                        f"{sorted(rebuilt)} ({sum(int(i.ntotal) for i in self.shards)} live vectors)")
+
+    def save(self):
+        """Synchronously checkpoint everything (merge the whole delta)."""
+        self.merge()
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _selector(allowed: Optional[np.ndarray]) -> Optional[faiss.IDSelector]:
+        """IDSelectorBitmap over the allowed rows (rows past it are never selected), or None for all."""
+        if allowed is None:
+            return None
+        bits = np.packbits(allowed, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits))
+        selector.referenced_bits = bits  # keep the buffer alive as long as the selector
+        return selector
+
+    @staticmethod
+    def _index_search(index: faiss.Index, query_np: np.ndarray, k: int,
+                      selector: Optional[faiss.IDSelector], allowed: Optional[np.ndarray],
+                      ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        index.search restricted to the `allowed` rows (`selector` is the same
+        mask as an IDSelectorBitmap). An index that rejects selectors (see
+        supports_selector) is over-fetched by the inverse of the allowed
+        fraction and filtered afterwards; rows it can't fill are -1.
+        """
+        if selector is None or supports_selector(index):
+            params = search_params(index, ef_search=ef_search, nprobe=nprobe, selector=selector)
+            return index.search(query_np, k, params=params)
+        fetch = min(index.ntotal, -(-k * len(allowed) // max(int(allowed.sum()), 1)))
+        D, I = index.search(query_np, fetch, params=search_params(index, ef_search=ef_search, nprobe=nprobe))
+        keep = (I >= 0) & (I < len(allowed)) & allowed[np.clip(I, 0, len(allowed) - 1)]
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :k]  # allowed hits first, best first
+        D, I = np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+        I[~np.take_along_axis(keep, order, axis=1)] = -1
+        return D, I
+
+    def _search_shard(self, index: faiss.Index, query_np: np.ndarray, k: int,
+                      selector: Optional[faiss.IDSelector], allowed: Optional[np.ndarray],
+                      ef_search: Optional[int], nprobe: Optional[int]) -> List[List[Tuple[int, float]]]:
+        """(row, score) candidates per query row of `query_np`, from one batched index search."""
+        if index is None or not index.ntotal:
+            return [[] for _ in range(len(query_np))]
+        quantized = index_quantization(index) != "none"
+        fetch_k = candidate_count(index, k)
+        D, I = self._index_search(index, query_np, fetch_k, selector, allowed, ef_search, nprobe)
+        if quantized and (I != -1).any():
+            # Codes only approximate the vectors — re-score candidates exactly.
+            # Each candidate is read once for all queries, in row order, so the
+            # memory-mapped log is read front to back.
+            ids = np.unique(I[I != -1])
+            exact = self._vector_rows(ids) @ query_np.T  # (candidate, query)
+            D = exact[np.searchsorted(ids, np.maximum(I, 0)), np.arange(len(I))[:, None]]
+        return [[(int(i), float(d)) for d, i in zip(D[q], I[q]) if i != -1] for q in range(len(I))]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """float32 query embedding, served from the query cache when enabled."""
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        float32 embeddings of several queries in one model call (cache misses
+        only). The supported models embed queries and documents identically,
+        so the batch goes through embed_documents.
+        """
+        cache = self.query_cache
+        vectors = [cache.get(q) if cache is not None else None for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            embedded = np.asarray(self.embeddings.embed_documents([queries[i] for i in missing]), dtype="float32")
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                if cache is not None:
+                    cache.put(queries[i], vector)
+        if not vectors:
+            return np.zeros((0, self.dim), dtype="float32")
+        return np.vstack(vectors).astype("float32", copy=False)
+
+    def search(self, query: str, k: int = 5,
+               ef_search: Optional[int] = None,
+               nprobe: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k inner-product search over the checkpointed shards plus the delta.
+        `ef_search` (HNSW) and `nprobe` (IVF) trade latency for recall per
+        request; they are ignored by other index types. Tombstoned rows and rows
+        outside `filters` (see ChunkMetadataStore.filter_mask) are excluded inside
+        the index search via an id selector; a filter matching few rows is
+        answered by an exact scan of just those rows instead.
+        """
+        return self.search_many([query], k=k, ef_search=ef_search, nprobe=nprobe, filters=filters)[0]
+
+    def search_many(self, queries: List[str], k: int = 5,
+                    ef_search: Optional[int] = None,
+                    nprobe: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        search() for several queries at once: one batched embedding call and one
+        multi-row search per shard. Returns one result list per query.
+        """
+        # Pin the published state once; appends/merges replace these objects
+        # rather than mutating them, so the rest of the query sees one version
+        shards, delta, deleted = self.shards, self.delta, self.deleted
+        canonical = self.duplicates.canonical
+        if not len(deleted) or not queries:
+            return [[] for _ in queries]
+
+        query_np = self.embed_queries(queries)
+        allowed, matched = self.filter_mask(filters, deleted, canonical)
+        if allowed is not None:
+            n = min(len(allowed), len(deleted))
+            allowed = allowed[:n] & ~deleted[:n]
+            n_allowed = int(allowed.sum())
+            if n_allowed == 0:
+                return [[] for _ in queries]
+            if n_allowed <= _EXACT_FILTER_ROWS:
+                rows = np.flatnonzero(allowed)
+                scores = self._vector_rows(rows) @ query_np.T
+                results = []
+                for q in range(len(queries)):
+                    top = np.argsort(-scores[:, q])[:k]
+                    hits = {int(rows[i]): float(scores[i, q]) for i in top}
+                    results.append(self._rows_to_results(hits, k, deleted, canonical, matched))
+                return results
+            if filters.get("source") is not None and self.n_shards > 1 and not (canonical >= 0).any():
+                # Sources are sharded by name, so only their shards can match
+                names = [filters["source"]] if isinstance(filters["source"], str) else filters["source"]
+                wanted = {shard_of(name, self.n_shards) for name in names}
+                shards = [index for s, index in enumerate(shards) if s in wanted]
+        mask = allowed if allowed is not None else (~deleted if deleted.any() else None)
+        selector = self._selector(mask)
+
+        live_shards = [index for index in shards if index is not None and index.ntotal]
+        if len(live_shards) > 1:
+            pool = _get_search_pool()
+            futures = [pool.submit(self._search_shard, index, query_np, k, selector, mask, ef_search, nprobe)
+                       for index in live_shards]
+            per_shard = [f.result() for f in futures]
+        else:
+            per_shard = [self._search_shard(index, query_np, k, selector, mask, ef_search, nprobe)
+                         for index in live_shards]
+
+        hits: List[Dict[int, float]] = [{} for _ in queries]  # per query: row -> score
+        for shard_hits in per_shard:
+            for q, candidates in enumerate(shard_hits):
+                hits[q].update(candidates)
+        if delta is not None and delta.ntotal:
+            # Tombstones are already removed from the delta; only a filter needs a selector
+            params = faiss.SearchParameters(sel=selector) if allowed is not None else None
+            D, I = delta.search(query_np, min(k, delta.ntotal), params=params)
+            for q in range(len(queries)):
+                hits[q].update((int(i), float(d)) for d, i in zip(D[q], I[q]) if i != -1)
+
+        return [self._rows_to_results(h, k, deleted, canonical, matched) for h in hits]
+
+    def _rows_to_results(self, hits: Dict[int, float], k: int, deleted: np.ndarray,
+                         canonical: np.ndarray, matched: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        top = [(idx, score) for idx, score in sorted(hits.items(), key=lambda h: h[1], reverse=True)[:k]
+               if idx < len(deleted) and not deleted[idx]]
+        return self.hit_results(top, deleted, canonical, matched)
+
+    def hit_results(self, hits: List[Tuple[int, float]], deleted: np.ndarray, canonical: np.ndarray,
+                    matched: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Result dicts for indexed rows with their scores, listing collapsed
+        duplicates under `duplicates`. `matched` is the filter's own row mask
+        (see filter_mask): a hit that matched only through a duplicate is
+        reported as that duplicate, so its source and page are the ones the
+        caller filtered on, and the indexed chunk moves into `duplicates`.
+        """
+        refs = self.duplicate_refs([idx for idx, _ in hits], deleted, canonical)
         results = []
-        for i, idx in enumerate(I[0]):
-            if idx != -1 and idx < len(self.metadata):
-                item = self.metadata[idx].copy()
-                item['score'] = float(D[0][i])
-                results.append(item)
-        
+        for idx, score in hits:
+            shown, duplicates = idx, refs.get(idx)
+            if matched is not None and not (idx < len(matched) and matched[idx]):
+                n = min(len(matched), len(canonical), len(deleted))
+                aliases = np.flatnonzero((canonical[:n] == idx) & matched[:n] & ~deleted[:n])
+                if len(aliases):
+                    shown = int(aliases[0])
+                    shown_id = int(self.ids.chunk[shown])
+                    duplicates = [self._duplicate_ref(idx)] + [r for r in duplicates if r["chunk_id"] != shown_id]
+            item = self.chunk(shown)
+            item['score'] = score
+            if duplicates:
+                item['duplicates'] = duplicates
+            results.append(item)
         return results
 
-    def reload(self):
-        """Reload the FAISS index and metadata from disk (called after external writes)."""
-        self._load_or_initialize()
+    def chunk_vectors(self, chunk_ids: List[int]) -> np.ndarray:
+        """float32 embeddings of chunks by id, gathered from the vector log (zeros for deleted chunks)."""
+        rows = self.ids.live_rows(np.asarray(chunk_ids, dtype=np.int64), ~self.deleted)
+        vectors = np.zeros((len(rows), self.dim), dtype="float32")
+        found = rows >= 0
+        if found.any():
+            vectors[found] = self._vector_rows(rows[found])
+        return vectors
 
-    def save(self):
-        os.makedirs(settings.VECTOR_STORE_PATH, exist_ok=True)
+    def context_chunks(self, chunk_id: int, before: int = 1, after: int = 1,
+                       section: bool = False) -> List[Dict[str, Any]]:
+        """
+        A chunk and its live neighbours in document order: up to `before` /
+        `after` adjacent chunks, or with `section` every chunk of its parent
+        section. Each step is one links.rec lookup; a deleted neighbour ends
+        the walk on that side.
+        """
+        links, live = self.links.records, ~self.deleted
+        row = int(self.ids.live_rows(np.array([chunk_id]), live)[0])
+        if row < 0 or row >= len(links):
+            return []
+        parent = links["parent"][row]
+
+        def walk(field: str, steps: int) -> List[int]:
+            rows, current = [], row
+            while steps > 0:
+                target = links[field][current]
+                nxt = int(self.ids.live_rows(np.array([target]), live)[0]) if target >= 0 else -1
+                if nxt < 0 or nxt >= len(links) or (section and links["parent"][nxt] != parent):
+                    break
+                rows.append(nxt)
+                current = nxt
+                steps -= 1
+            return rows
+
+        endless = len(links) if section else 0
+        rows = walk("prev", endless or before)[::-1] + [row] + walk("next", endless or after)
+        return [self.chunk(r) for r in rows]
 
-        if self.index:
-            faiss.write_index(self.index, os.path.join(settings.VECTOR_STORE_PATH, "index.faiss"))
+    def chunk(self, row: int) -> Dict[str, Any]:
+        """Metadata of a stored row plus its stable `chunk_id` and `doc_id`."""
+        item = self.metadata[row]
+        record = self.ids.records[row]
+        item['chunk_id'] = int(record['chunk'])
+        item['doc_id'] = int(record['doc'])
+        return item
 
-        with open(os.path.join(settings.VECTOR_STORE_PATH, "metadata.json"), "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f)
+    def filter_mask(self, filters: Optional[Dict[str, Any]], deleted: np.ndarray,
+                    canonical: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        ChunkMetadataStore.filter_mask, widened so an indexed chunk also matches
+        when one of its live duplicates does (e.g. filtering on the source of a
+        collapsed copy). Returns the widened mask to search and the rows the
+        filter itself matched (for hit_results); (None, None) without filters.
+        """
+        matched = self.metadata.filter_mask(filters)
+        if matched is None:
+            return None, None
+        allowed = matched.copy()
+        n = min(len(allowed), len(canonical), len(deleted))
+        is_alias = canonical[:n] >= 0
+        aliases = canonical[:n][allowed[:n] & ~deleted[:n] & is_alias]
+        if len(aliases):
+            allowed[aliases] = True
+            allowed[:n] &= ~is_alias  # duplicates have no vector of their own
+        return allowed, matched
+
+    def duplicate_refs(self, rows: List[int], deleted: np.ndarray,
+                       canonical: np.ndarray) -> Dict[int, List[Dict[str, Any]]]:
+        """Source/page of the live duplicates collapsed into each of `rows` (rows without any are omitted)."""
+        if not rows or not (canonical >= 0).any():
+            return {}
+        n = min(len(canonical), len(deleted))
+        aliases = np.flatnonzero(np.isin(canonical[:n], rows) & ~deleted[:n])
+        refs: Dict[int, List[Dict[str, Any]]] = {}
+        sources = self.metadata.strings("source")
+        for a in aliases:
+            refs.setdefault(int(canonical[a]), []).append(self._duplicate_ref(int(a), sources))
+        return refs
+
+    def _duplicate_ref(self, row: int, sources: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Chunk id, source and page of a row, as listed under a result's `duplicates`."""
+        sources = self.metadata.strings("source") if sources is None else sources
+        code, page = self.metadata.column("source")[row], self.metadata.column("page")[row]
+        ref: Dict[str, Any] = {"chunk_id": int(self.ids.chunk[row]),
+                               "source": sources[code] if code >= 0 else None}
+        if page >= 0:
+            ref["page"] = int(page)
+        return ref
+
+    def index_stats(self) -> Dict[str, Any]:
+        """Memory vs. accuracy summary of the current index (type, quantization, size)."""
+        shard_stats = [describe_index(index) for index in self.shards]
+        dead = self._dead_per_shard()
+        return {
+            "shards": shard_stats,
+            "vectors": sum(s["vectors"] for s in shard_stats),
+            "approx_index_mb": round(sum(s["approx_index_mb"] for s in shard_stats), 2),
+            "delta_vectors": int(self.delta.ntotal) if self.delta is not None else 0,
+            "deleted_chunks": int(self.deleted.sum()),
+            "duplicate_chunks": int((~self.deleted & ~self.indexed_mask(0, len(self.deleted))).sum()),
+            "deleted_in_index": sum(dead),
+        }
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the query and chunk embedding caches."""
+        return {
+            "query_embeddings": self.query_cache.stats() if self.query_cache is not None else None,
+            "chunk_embeddings": self.embedding_cache.stats() if self.embedding_cache is not None else None,
+        }
+
+    def reload(self):
+        """Reload the FAISS index and metadata from disk (called after external writes)."""
+        self._load()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
@@ -31,9 +32,22 @@ async def lifespan(app: FastAPI):
     await init_db()
     async with AsyncSessionLocal() as db:
         await init_default_admin(db)
+    if settings.PRELOAD_ON_STARTUP:
+        # Don't block startup (health checks) on model/index loading; the first
+        # query then finds the retriever ready instead of building it inline
+        from backend.api.endpoints.rag import get_retriever
+        preload = asyncio.get_running_loop().run_in_executor(None, get_retriever)
+        preload.add_done_callback(_log_preload_failure)
     yield
 
 
+def _log_preload_failure(future: asyncio.Future):
+    """A failed preload is retried by the first query; log it instead of leaving it unretrieved."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Retriever preload failed; the first query will retry it",
+                     exc_info=future.exception())
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
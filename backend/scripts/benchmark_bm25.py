@@ -0,0 +1,117 @@
+"""
+KeywordIndex (the retriever's BM25) vs. rank_bm25.BM25Okapi: build time, query latency and ranking parity.
+
+Uses the chunk texts in the active vector store (or a synthetic Zipf corpus with
+--synthetic N) and the rag_benchmark_questions.json questions, tokenized with
+the configured BM25 analyzer as HybridRetriever does. The KeywordIndex is built
+in a temporary directory and checkpointed like a store merge. For each query it
+compares BM25Okapi.get_scores + a full argsort with KeywordIndex.top_k, times
+the batched KeywordIndex.top_k_many the retriever uses for query variations,
+and checks that both engines return the same top-k.
+
+Usage:
+  python backend/scripts/benchmark_bm25.py [--k 10] [--limit 150] [--synthetic 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from backend.core.config import settings
+from backend.engine.analyzer import get_analyzer
+from backend.engine.bm25 import KeywordIndex
+from backend.engine.metadata_store import ChunkMetadataStore
+from backend.engine.vector_store import active_store_path
+
+QUESTIONS_FILE = os.path.join(settings.BASE_DIR, "rag_benchmark_questions.json")
+
+
+def synthetic_texts(n: int, vocab: int = 30_000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab + 1)
+    p /= p.sum()
+    return [" ".join(f"term{i}" for i in rng.choice(vocab, rng.integers(40, 120), p=p)) for _ in range(n)]
+
+
+def build_index(directory: str, texts):
+    index = KeywordIndex(directory)
+    indexed = np.ones(len(texts), dtype=bool)
+    index.load(0, np.zeros(0, dtype=bool), None, 0, content=lambda row: "")
+    index.append(texts, indexed)
+    index.set_base(index.write_base(1, len(texts), indexed), len(texts))
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=150)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic documents instead of the store")
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)][: args.limit]
+    analyze = get_analyzer()
+    if args.synthetic:
+        texts = synthetic_texts(args.synthetic)
+        rng = np.random.default_rng(1)
+        queries = [[f"term{t}" for t in rng.integers(0, 2000, rng.integers(3, 12))] for _ in questions]
+    else:
+        texts = list(ChunkMetadataStore(active_store_path()).iter_content())
+        queries = [analyze(q) for q in questions]
+    if not texts:
+        sys.exit("Vector store is empty — ingest documents first or pass --synthetic N.")
+    corpus = [analyze(text) for text in texts]
+
+    start = time.perf_counter()
+    okapi = BM25Okapi(corpus)
+    okapi_build = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        index = build_index(directory, texts)
+        index_build = time.perf_counter() - start
+
+        okapi_ms, index_ms, same, max_diff = [], [], 0, 0.0
+        for query in queries:
+            start = time.perf_counter()
+            scores = okapi.get_scores(query)
+            expected = np.argsort(scores)[::-1][: args.k]
+            okapi_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            rows, _ = index.top_k(query, args.k)
+            index_ms.append((time.perf_counter() - start) * 1000)
+
+            max_diff = max(max_diff, float(np.abs(index.get_scores(query) - scores).max()))
+            # rank_bm25 also returns zero-score documents; top_k only returns matches
+            expected = [r for r in expected if scores[r] != 0]
+            # Equal scores may be ordered either way; compare as score-rounded lists
+            same += [round(float(scores[r]), 4) for r in expected] == [round(float(scores[r]), 4) for r in rows]
+
+        start = time.perf_counter()
+        batched = index.top_k_many(queries, args.k)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        same_batched = sum(np.array_equal(rows, index.top_k(q, args.k)[0]) for q, (rows, _) in zip(queries, batched))
+        postings = len(index.state.base.rows) + len(index.state.delta.rows)
+
+    print(f"Corpus: {len(corpus):,} documents  postings={postings:,}  queries={len(queries)}  k={args.k}  "
+          f"analyzer={analyze.signature}\n")
+    print(f"{'engine':<14}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, build, ms in (("rank_bm25", okapi_build, okapi_ms), ("KeywordIndex", index_build, index_ms)):
+        print(f"{name:<14}{build:>9.2f}{np.percentile(ms, 50):>9.2f}{np.percentile(ms, 95):>9.2f}")
+    print(f"{'  top_k_many':<14}{'':>9}{batch_ms:>9.2f}{'':>9}   (mean per query, one batch)")
+    print(f"\nSpeed-up (p50): {np.percentile(okapi_ms, 50) / np.percentile(index_ms, 50):.0f}x")
+    print(f"Identical top-{args.k}: {same}/{len(queries)}   max |score diff|: {max_diff:.2e}   "
+          f"top_k_many == top_k: {same_batched}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Keyword backends: in-memory KeywordIndex vs. SQLite FTS5 (KEYWORD_BACKEND).
+
+Indexes the chunk texts of the active vector store (or a synthetic Zipf corpus
+with --synthetic N) into both backends in a temporary directory, then runs the
+rag_benchmark_questions.json questions through each and reports build time,
+query latency, resident memory (the in-memory index's arrays and vocabulary
+vs. SQLite's page-cache cap) and top-k agreement with the in-memory ranking.
+The two rank with slightly different BM25 variants (k1 1.5 vs 1.2, idf floor),
+so agreement is reported as overlap@k and top-1 match, not exact equality.
+
+Usage:
+  python backend/scripts/benchmark_keyword_backends.py [--k 10] [--limit 150] [--synthetic 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.engine.analyzer import get_analyzer
+from backend.engine.bm25 import KeywordIndex
+from backend.engine.fts_index import FtsKeywordIndex
+from backend.engine.metadata_store import ChunkMetadataStore
+from backend.engine.vector_store import active_store_path
+
+QUESTIONS_FILE = os.path.join(settings.BASE_DIR, "rag_benchmark_questions.json")
+
+
+def synthetic_texts(n: int, vocab: int = 30_000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, vocab + 1)
+    p /= p.sum()
+    return [" ".join(f"term{i}" for i in rng.choice(vocab, rng.integers(40, 120), p=p)) for _ in range(n)]
+
+
+def build(index, texts):
+    empty = np.zeros(0, dtype=bool)
+    index.load(0, empty, None, 0, content=lambda row: "")
+    step = settings.VECTOR_DELTA_MERGE_ROWS
+    for generation, start in enumerate(range(0, len(texts), step), 1):
+        batch = texts[start:start + step]
+        index.append(batch, np.ones(len(batch), dtype=bool))
+        # Checkpoint like the store's merges do, so the in-memory delta stays bounded
+        upto = start + len(batch)
+        index.set_base(index.write_base(generation, upto, np.ones(upto, dtype=bool)), upto)
+        for name in os.listdir(index.directory):
+            if name.startswith("bm25-") and not name.startswith(index.base_name + "."):
+                os.remove(os.path.join(index.directory, name))
+
+
+def resident_mb(index) -> float:
+    """In-memory backend: its arrays (memory-mapped postings are paged in by queries) and vocabulary."""
+    if not isinstance(index, KeywordIndex):
+        return settings.KEYWORD_SQLITE_CACHE_MB  # SQLite's page cache cap
+    state = index.state
+    arrays = [*state.base, *state.delta, state.doc_len, state.df, state.idf, index._offsets]
+    vocab = sum(sys.getsizeof(term) + 100 for term in index.vocab)  # str + dict entry overhead, roughly
+    return (sum(np.asarray(a).nbytes for a in arrays) + vocab) / 2**20
+
+
+def dir_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=150)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic documents instead of the store")
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)][: args.limit]
+    if args.synthetic:
+        texts = synthetic_texts(args.synthetic)
+        rng = np.random.default_rng(1)
+        questions = [" ".join(f"term{t}" for t in rng.integers(0, 2000, rng.integers(3, 12))) for _ in questions]
+    else:
+        texts = list(ChunkMetadataStore(active_store_path()).iter_content())
+    if not texts:
+        sys.exit("Vector store is empty — ingest documents first or pass --synthetic N.")
+    analyze = get_analyzer()
+    queries = [analyze(q) for q in questions]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as mem_dir, tempfile.TemporaryDirectory() as fts_dir:
+        for name, index, path in (("memory", KeywordIndex(mem_dir), mem_dir),
+                                  ("sqlite", FtsKeywordIndex(fts_dir), fts_dir)):
+            start = time.perf_counter()
+            build(index, texts)
+            build_s = time.perf_counter() - start
+            ms, ranked = [], []
+            for query in queries:
+                start = time.perf_counter()
+                rows, _ = index.top_k(query, args.k)
+                ms.append((time.perf_counter() - start) * 1000)
+                ranked.append(rows.tolist())
+            results[name] = (build_s, ms, ranked, resident_mb(index), dir_mb(path))
+
+    print(f"Corpus: {len(texts):,} documents  queries={len(queries)}  k={args.k}  "
+          f"analyzer={analyze.signature}  sqlite cache cap={settings.KEYWORD_SQLITE_CACHE_MB} MB\n")
+    print(f"{'backend':<9}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'RAM MB':>9}{'disk MB':>9}")
+    for name, (build_s, ms, _, ram, disk) in results.items():
+        print(f"{name:<9}{build_s:>9.2f}{np.percentile(ms, 50):>9.2f}{np.percentile(ms, 95):>9.2f}"
+              f"{ram:>9.1f}{disk:>9.1f}")
+
+    expected, got = results["memory"][2], results["sqlite"][2]
+    overlap = [len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(expected, got) if a]
+    top1 = [a[0] == b[0] for a, b in zip(expected, got) if a and b]
+    print(f"\nsqlite vs memory: overlap@{args.k} {np.mean(overlap):.3f}   top-1 match {np.mean(top1):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Memory vs. recall report for the vector quantization modes.
+
+Builds every VECTOR_QUANTIZATION variant (with the configured index type) over
+the vectors the store in VECTOR_STORE_PATH serves (tombstoned and collapsed
+duplicate chunks excluded), runs the rag_benchmark_questions.json
+questions against each, and compares the top-k with an exact flat scan —
+both raw and after the exact re-scoring VectorStore applies. The binary
+(sign-bit, Hamming scan) first pass is also swept over candidate-list sizes.
+
+Usage:
+  python backend/scripts/benchmark_quantization.py [--k 10] [--limit 150] [--binary-candidates 50,100,200,400]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.engine.index_factory import (
+    QUANTIZATIONS, build_index, bytes_per_vector, candidate_count, resolve_index_type,
+)
+from backend.engine.vector_store import VectorStore
+
+QUESTIONS_FILE = os.path.join(settings.BASE_DIR, "rag_benchmark_questions.json")
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f != -1]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def rescore(index, queries: np.ndarray, vectors: np.ndarray, k: int, fetch_k: int) -> np.ndarray:
+    _, cand = index.search(queries, fetch_k)
+    rescored = np.full((len(queries), k), -1, dtype="int64")
+    for qi, row in enumerate(cand):
+        row = row[row != -1]
+        order = np.argsort(-(vectors[row] @ queries[qi]))[:k]
+        rescored[qi, : len(order)] = row[order]
+    return rescored
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=150)
+    parser.add_argument("--binary-candidates", default="50,100,200,400",
+                        help="comma-separated candidate counts to sweep for the binary first pass")
+    args = parser.parse_args()
+
+    vs = VectorStore()
+    _, vectors = vs.indexed_vectors()
+    n = len(vectors)
+    if n == 0:
+        sys.exit("Vector store is empty — ingest documents first.")
+
+    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)][: args.limit]
+    queries = np.array([vs.embeddings.embed_query(q) for q in questions], dtype="float32")
+
+    exact = build_index("flat", vs.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    kind = resolve_index_type(n)
+    print(f"Corpus: {n:,} vectors  dim={vs.dim}  index={kind}  queries={len(queries)}  k={args.k}\n")
+    print(f"{'quantization':<13}{'bytes/vec':>10}{'index MB':>10}{'recall raw':>12}{'recall rescored':>17}{'ms/query':>10}")
+
+    binary = None
+    for quant in QUANTIZATIONS:
+        try:
+            index = build_index(kind, vs.dim, vectors, quant)
+        except (RuntimeError, ValueError) as e:
+            print(f"{quant:<13}  skipped: {e}")
+            continue
+        index.add(vectors)
+        if quant == "binary":
+            binary = index
+
+        start = time.perf_counter()
+        _, raw = index.search(queries, args.k)
+        latency = (time.perf_counter() - start) * 1000 / len(queries)
+        rescored = rescore(index, queries, vectors, args.k, candidate_count(index, args.k))
+
+        size = bytes_per_vector(quant, vs.dim)
+        print(f"{quant:<13}{size:>10}{n * size / 1024 / 1024:>10.1f}"
+              f"{recall(raw, truth):>12.3f}{recall(rescored, truth):>17.3f}{latency:>10.2f}")
+
+    if binary is not None:
+        print(f"\nBinary first pass + exact re-scoring (index is {4 * vs.dim // bytes_per_vector('binary', vs.dim)}x "
+              f"smaller than float32; VECTOR_BINARY_CANDIDATES={settings.VECTOR_BINARY_CANDIDATES})")
+        print(f"{'candidates':<13}{'recall@k':>10}{'ms/query':>10}")
+        for candidates in (int(c) for c in args.binary_candidates.split(",")):
+            start = time.perf_counter()
+            rescored = rescore(binary, queries, vectors, args.k, max(candidates, args.k))
+            latency = (time.perf_counter() - start) * 1000 / len(queries)
+            print(f"{candidates:<13}{recall(rescored, truth):>10.3f}{latency:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
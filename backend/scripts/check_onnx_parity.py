@@ -0,0 +1,89 @@
+"""
+Parity and speed check: ONNX Runtime embedding backend vs. the PyTorch one.
+
+Encodes the rag_benchmark_questions.json questions (and, if the vector store has
+chunks, a sample of them) with both backends and reports the per-vector cosine
+similarity, top-k retrieval agreement over the sample, and encoding throughput.
+Exits non-zero if the mean cosine falls below --min-cosine.
+
+Usage (after pip install -r requirements-onnx.txt):
+  python backend/scripts/check_onnx_parity.py [--k 5] [--limit 200] [--no-quantize] [--min-cosine 0.99]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.engine.embeddings import OnnxEmbeddings
+from backend.engine.metadata_store import ChunkMetadataStore
+from backend.engine.vector_store import active_store_path
+
+QUESTIONS_FILE = os.path.join(settings.BASE_DIR, "rag_benchmark_questions.json")
+
+
+def timed_encode(model, texts):
+    start = time.perf_counter()
+    vectors = np.asarray(model.embed_documents(texts), dtype="float32")
+    return vectors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    torch_model = HuggingFaceEmbeddings(
+        model_name=settings.EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    onnx_model = OnnxEmbeddings(settings.EMBEDDING_MODEL_NAME, quantize=not args.no_quantize)
+
+    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)][: args.limit]
+    chunks = list(ChunkMetadataStore(active_store_path()).iter_content())[: args.limit]
+
+    # Warm both models up so one-off graph/session setup is not timed
+    torch_model.embed_documents(questions[:2])
+    onnx_model.embed_documents(questions[:2])
+
+    print(f"Model: {settings.EMBEDDING_MODEL_NAME}  onnx={'fp32' if args.no_quantize else 'int8'}")
+    print(f"{'set':<11}{'n':>6}{'cos mean':>10}{'cos min':>10}{'torch/s':>10}{'onnx/s':>10}{'speedup':>9}")
+    worst = 1.0
+    encoded = {}
+    for name, texts in (("questions", questions), ("chunks", chunks)):
+        if not texts:
+            continue
+        t_vec, t_sec = timed_encode(torch_model, texts)
+        o_vec, o_sec = timed_encode(onnx_model, texts)
+        cos = np.sum(t_vec * o_vec, axis=1)
+        worst = min(worst, float(cos.mean()))
+        encoded[name] = (t_vec, o_vec)
+        print(f"{name:<11}{len(texts):>6}{cos.mean():>10.4f}{cos.min():>10.4f}"
+              f"{len(texts) / t_sec:>10.1f}{len(texts) / o_sec:>10.1f}{t_sec / o_sec:>8.1f}x")
+
+    if "chunks" in encoded:
+        (tq, oq), (tc, oc) = encoded["questions"], encoded["chunks"]
+        k = min(args.k, len(tc))
+        t_top = np.argsort(-(tq @ tc.T), axis=1)[:, :k]
+        o_top = np.argsort(-(oq @ oc.T), axis=1)[:, :k]
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(t_top, o_top)])
+        print(f"\nTop-{k} retrieval agreement over {len(tc)} chunks: {overlap:.3f}")
+
+    if worst < args.min_cosine:
+        sys.exit(f"FAIL: mean cosine {worst:.4f} < {args.min_cosine}")
+    print("PASS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Fit the hybrid fusion method and alpha (HYBRID_FUSION / HYBRID_ALPHA) for the active corpus.
+
+Runs the rag_benchmark_questions.json questions through both legs of
+HybridRetriever once (--pool candidates each), then re-fuses the cached legs
+with every fusion method over a grid of alphas and reports nDCG@k. The
+questions carry no relevance labels, so the cross-encoder reranker serves as
+the judge: for each question the --relevant highest-scoring chunks of the
+pooled candidates count as relevant. The best setting is the one whose fused
+top-k feeds the reranker the most of what it would have picked anyway.
+
+Usage:
+  python backend/scripts/fit_fusion.py [--k 10] [--pool 50] [--relevant 3] [--step 0.05] [--limit 150]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.engine.reranker import Reranker
+from backend.engine.retriever import FUSION_METHODS, HybridRetriever, fusion_components
+from backend.engine.vector_store import VectorStore
+
+QUESTIONS_FILE = os.path.join(settings.BASE_DIR, "rag_benchmark_questions.json")
+
+
+def ndcg_at_k(fused: np.ndarray, first: np.ndarray, relevant: np.ndarray, k: int) -> np.ndarray:
+    """nDCG@k of each row of `fused` (alphas x ids); ties rank by first appearance like HybridRetriever."""
+    by_first = np.argsort(first)
+    top = by_first[np.argsort(-fused[:, by_first], axis=1, kind="stable")[:, :k]]
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (relevant[top] * discounts[: top.shape[1]]).sum(axis=1)
+    ideal = discounts[: min(int(relevant.sum()), k)].sum()
+    return dcg / ideal if ideal > 0 else np.zeros(len(fused))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10, help="fused list length that is scored")
+    parser.add_argument("--pool", type=int, default=50, help="candidates fetched per leg")
+    parser.add_argument("--relevant", type=int, default=3, help="reranker top-n counted as relevant")
+    parser.add_argument("--step", type=float, default=0.05, help="alpha grid step")
+    parser.add_argument("--limit", type=int, default=150)
+    args = parser.parse_args()
+
+    vs = VectorStore()
+    if vs.count == 0:
+        sys.exit("Vector store is empty — ingest documents first.")
+    retriever = HybridRetriever(vs)
+    reranker = Reranker(cache_size=0)
+    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)][: args.limit]
+
+    start = time.perf_counter()
+    vector_legs = vs.search_many(questions, k=args.pool)
+    keyword_legs = retriever.keyword_search_many(questions, args.pool)
+    print(f"Retrieved {len(questions)} questions x 2 legs x {args.pool} in {time.perf_counter() - start:.1f}s")
+
+    alphas = np.round(np.arange(0.0, 1.0 + args.step / 2, args.step), 4)
+    weights = np.stack([alphas, 1 - alphas], axis=1)
+    totals = {method: np.zeros(len(alphas)) for method in FUSION_METHODS}
+    judged = 0
+    start = time.perf_counter()
+    for question, vector, keyword in zip(questions, vector_legs, keyword_legs):
+        pooled = {d["chunk_id"]: d for d in vector + keyword}
+        if not pooled:
+            continue
+        ranked = reranker.rerank(question, list(pooled.values()), top_k=args.relevant)
+        wanted = np.array([d["chunk_id"] for d in ranked], dtype=np.int64)
+        judged += 1
+        id_lists = [np.array([d["chunk_id"] for d in leg], dtype=np.int64) for leg in (vector, keyword)]
+        score_lists = [np.array([d["score"] for d in leg], dtype=np.float64) for leg in (vector, keyword)]
+        for method in FUSION_METHODS:
+            unique, first, components = fusion_components(id_lists, score_lists, method)
+            relevant = np.isin(unique, wanted).astype(np.float64)
+            totals[method] += ndcg_at_k(weights @ components, first, relevant, args.k)
+    if not judged:
+        sys.exit("No question retrieved any chunk.")
+    print(f"Judged with the reranker in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"Corpus: {vs.count:,} chunks  questions={judged}  k={args.k}  pool={args.pool}  "
+          f"relevant=top-{args.relevant} by {settings.RERANKER_MODEL_NAME}\n")
+    print(f"{'fusion':<8}{'best alpha':>11}{'nDCG@k':>9}{'alpha=0.5':>11}{'BM25 only':>11}{'vector only':>13}")
+    best = None
+    mid = int(np.argmin(np.abs(alphas - 0.5)))
+    for method, total in totals.items():
+        mean = total / judged
+        i = int(np.argmax(mean))
+        print(f"{method:<8}{alphas[i]:>11.2f}{mean[i]:>9.3f}{mean[mid]:>11.3f}{mean[0]:>11.3f}{mean[-1]:>13.3f}")
+        if best is None or mean[i] > best[2]:
+            best = (method, alphas[i], mean[i])
+
+    current = totals[settings.HYBRID_FUSION][int(np.argmin(np.abs(alphas - settings.HYBRID_ALPHA)))] / judged
+    print(f"\nCurrent HYBRID_FUSION={settings.HYBRID_FUSION} HYBRID_ALPHA={settings.HYBRID_ALPHA}: nDCG@k {current:.3f}")
+    print(f"Best for this corpus (add to .env):\n  HYBRID_FUSION={best[0]}\n  HYBRID_ALPHA={best[1]:g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Cold-start timing for the retrieval stack, with and without memory-mapped index loading.
+
+Builds a synthetic store of --chunks random normalized vectors (configured index
+type, checkpointed), then starts a fresh Python process per mode and times each
+stage until the first query returns:
+
+  model   : embedding model load
+  store   : VectorStore load (index checkpoints, metadata, tombstones, delta)
+  bm25    : HybridRetriever construction (the keyword index loads with the store)
+  query   : first hybrid search
+
+Page-cache state matters: run `sync; echo 3 > /proc/sys/vm/drop_caches` (root)
+between runs to measure a truly cold disk.
+
+Usage:
+  python backend/scripts/measure_cold_start.py [--chunks 100000] [--keep]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+
+
+def build_store(path: str, n: int):
+    import numpy as np
+    from backend.core.config import settings
+    from backend.engine.metadata_store import ChunkMetadataStore
+    from backend.engine.vector_store import VectorStore
+
+    rng = np.random.default_rng(0)
+    words = [f"term{i}" for i in range(5000)]
+    store = ChunkMetadataStore(path)
+    with open(os.path.join(path, "vectors.f32"), "wb") as f:
+        for start in range(0, n, 10_000):
+            m = min(10_000, n - start)
+            vectors = rng.standard_normal((m, settings.EMBEDDING_DIM)).astype("float32")
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            f.write(vectors.tobytes())
+            store.append([
+                {"content": " ".join(rng.choice(words, 60)), "source": f"doc{(start + i) // 200}.pdf", "page": i % 30}
+                for i in range(m)
+            ])
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": n, "dim": settings.EMBEDDING_DIM}, f)
+    VectorStore(path).save()  # index every row into a checkpoint
+
+
+def child(path: str):
+    """Runs in a fresh interpreter; prints stage timings as JSON."""
+    import resource
+    timings = {}
+    t = time.perf_counter()
+    from backend.engine.embeddings import get_embeddings
+    from backend.engine.retriever import HybridRetriever
+    from backend.engine.vector_store import VectorStore
+    timings["import"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    get_embeddings()
+    timings["model"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    store = VectorStore(path)
+    timings["store"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    retriever = HybridRetriever(store)
+    timings["bm25"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    retriever.search("term1 term2 term3", k=5)
+    timings["query"] = time.perf_counter() - t
+
+    timings["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic store")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    path = tempfile.mkdtemp(prefix="cold_start_")
+    try:
+        print(f"Building synthetic store with {args.chunks:,} chunks in {path} ...")
+        build_store(path, args.chunks)
+        print(f"\n{'mode':<8}{'import':>8}{'model':>8}{'store':>8}{'bm25':>8}{'query':>8}{'total':>8}{'RSS MB':>9}")
+        for mode in ("read", "mmap"):
+            env = dict(os.environ, VECTOR_INDEX_MMAP="true" if mode == "mmap" else "false",
+                       PRELOAD_ON_STARTUP="false")
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", path],
+                                 env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+            t = json.loads(out.stdout.strip().splitlines()[-1])
+            total = sum(t[k] for k in ("import", "model", "store", "bm25", "query"))
+            print(f"{mode:<8}{t['import']:>8.2f}{t['model']:>8.2f}{t['store']:>8.2f}{t['bm25']:>8.2f}"
+                  f"{t['query']:>8.2f}{total:>8.2f}{t['max_rss_mb']:>9.0f}")
+        per_100k = 100_000 / args.chunks
+        print(f"\n(seconds; store/bm25 scale roughly linearly — multiply by {per_100k:.2f} for per-100k figures)")
+    finally:
+        if args.keep:
+            print(f"Store kept at {path}")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -229,13 +229,6 @@ def ingest_ragas_docs() -> None:
 
     print(f"  Total chunks ingested: {total_chunks}")
 
-    # rebuild BM25 index
-    try:
-        from backend.engine.retriever import HybridRetriever
-        HybridRetriever(vs)._rebuild_bm25()
-    except Exception:
-        pass
-
 
 # ── run one RAG query ────────────────────────────────────────────────────────
 def run_rag_query(
@@ -244,17 +237,18 @@ def run_rag_query(
     reranker,
     llm,
     top_k: int = 5,
-    alpha: float = 0.5,
+    alpha: Optional[float] = None,
+    fusion: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Run the full retrieval + reranking + generation pipeline for one question."""
     # 1. Retrieve
-    docs = retriever.search(question, k=top_k, alpha=alpha)
+    docs = retriever.search(question, k=top_k, alpha=alpha, fusion=fusion)
 
     # 2. Rerank → top 3
     ranked = reranker.rerank(question, docs, top_k=3) if docs else []
 
     # 3. Build context
-    contexts = [d.get("content", "") for d in ranked]
+    contexts = retriever.expand_context(ranked)
     context_text = "\n\n".join(
         f"[Source {i+1}]: {c}" for i, c in enumerate(contexts)
     ) or "No relevant documents found."
@@ -453,8 +447,10 @@ def main() -> None:
                         help="Ingest sample docs before benchmarking")
     parser.add_argument("--samples", type=int, default=len(QA_PAIRS),
                         help=f"Number of Q&A pairs to evaluate (max {len(QA_PAIRS)})")
-    parser.add_argument("--alpha", type=float, default=0.5,
-                        help="Hybrid search alpha (0=BM25, 1=semantic)")
+    parser.add_argument("--alpha", type=float, default=None,
+                        help="Hybrid search alpha (0=BM25, 1=semantic; default HYBRID_ALPHA)")
+    parser.add_argument("--fusion", choices=("rrf", "minmax", "zscore", "dbsf"), default=None,
+                        help="Hybrid search fusion method (default HYBRID_FUSION)")
     parser.add_argument("--out", type=str, default="ragas_results.json",
                         help="Path to write JSON results")
     args = parser.parse_args()
@@ -477,11 +473,13 @@ def main() -> None:
     from backend.engine.llm import get_llm
     from backend.core.config import settings
 
+    args.alpha = settings.HYBRID_ALPHA if args.alpha is None else args.alpha
+    args.fusion = args.fusion or settings.HYBRID_FUSION
     vs       = VectorStore()
     retriever = HybridRetriever(vs)
     reranker  = Reranker()
     llm       = get_llm()
-    print(f"  Vector store: {vs.index.ntotal if vs.index else 0} vectors")
+    print(f"  Vector store: {vs.count} chunks")
     print(f"  LLM provider: {settings.LLM_PROVIDER}")
 
     # ── build RAGAS evaluator ───────────────────────────────────────────
@@ -501,7 +499,7 @@ def main() -> None:
         q  = pair["question"]
         gt = pair["ground_truth"]
         print(f"  [{i:>2}/{args.samples}] {q[:60]}", end=" … ", flush=True)
-        out = run_rag_query(q, retriever, reranker, llm, alpha=args.alpha)
+        out = run_rag_query(q, retriever, reranker, llm, alpha=args.alpha, fusion=args.fusion)
         questions.append(q)
         answers.append(out["answer"])
         contexts.append(out["contexts"])
@@ -532,6 +530,7 @@ def main() -> None:
         "samples_evaluated": len(pairs),
         "pipeline_runtime_s": round(elapsed, 2),
         "alpha": args.alpha,
+        "fusion": args.fusion,
         "per_sample": [
             {
                 "question":     s["question"],
@@ -0,0 +1,44 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.engine.metadata_store import ChunkMetadataStore
+
+
+def rows(n, start=0):
+    return [{"content": f"chunk {i}", "source": f"s{i % 3}.pdf", "page": i % 5} for i in range(start, start + n)]
+
+
+def test_filter_mask(tmp_path):
+    store = ChunkMetadataStore(str(tmp_path))
+    store.append(rows(30))
+
+    mask = store.filter_mask({"source": ["s0.pdf", "s2.pdf"], "page_min": 1, "page_max": 2})
+    expected = [i for i in range(30) if i % 3 != 1 and 1 <= i % 5 <= 2]
+    assert mask.nonzero()[0].tolist() == expected
+    assert not store.filter_mask({"source": "missing.pdf"}).any()
+    assert store.filter_mask({}) is None
+
+
+def test_filter_mask_during_concurrent_append(tmp_path):
+    store = ChunkMetadataStore(str(tmp_path))
+    store.append(rows(30))
+    store.filter_mask({"source": "s0.pdf"})  # cache the s0 mask at 30 rows
+
+    class AppendingCodes(dict):
+        """Code table whose first lookup runs an upload in between, like a writer thread would."""
+        def get(self, key, default=None):
+            store._codes["source"] = dict(self)
+            store.append(rows(10, start=len(store)))
+            return super().get(key, default)
+
+    store._codes["source"] = AppendingCodes(store._codes["source"])
+    mask = store.filter_mask({"source": ["s0.pdf", "s1.pdf"], "page_min": 0})
+    assert len(mask) == 30
+    assert mask.nonzero()[0].tolist() == [i for i in range(30) if i % 3 != 2]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
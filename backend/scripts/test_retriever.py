@@ -0,0 +1,152 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pytest
+
+from backend.core.config import settings
+from backend.engine.chunk_links import link_batch
+from backend.engine.mmr import maximal_marginal_relevance
+from backend.engine.retriever import FUSION_METHODS, HybridRetriever, fusion_components
+from test_vector_store import RandomEmbeddings, add_corpus, open_store
+
+
+def test_fusion_components():
+    ids = [np.array([1, 2, 3]), np.array([3, 4])]
+    scores = [np.array([0.9, 0.5, 0.1]), np.array([12.0, 4.0])]
+
+    unique, first, rrf = fusion_components(ids, scores, "rrf", c=60)
+    assert unique.tolist() == [1, 2, 3, 4] and first.tolist() == [0, 1, 2, 4]
+    assert np.allclose(rrf, [[1 / 61, 1 / 62, 1 / 63, 0], [0, 0, 1 / 61, 1 / 62]])
+
+    _, _, minmax = fusion_components(ids, scores, "minmax")
+    assert np.allclose(minmax, [[1, 0.5, 0, 0], [0, 0, 1, 0]])
+
+    _, _, zscore = fusion_components(ids, scores, "zscore")
+    z = (scores[0] - scores[0].mean()) / scores[0].std()
+    assert np.allclose(zscore[0], [*z, z.min()])  # absent from a list = that list's worst hit
+    assert np.allclose(zscore[1], [-1, -1, 1, -1])
+
+    _, _, dbsf = fusion_components(ids, scores, "dbsf")
+    assert np.all((dbsf >= 0) & (dbsf <= 1)) and np.allclose(dbsf[1], [0, 0, 4 / 6, 2 / 6])
+
+    with pytest.raises(ValueError):
+        fusion_components(ids, scores, "max")
+
+
+@pytest.mark.parametrize("method", FUSION_METHODS)
+def test_fuse_weights_the_legs(method):
+    vector = [{"chunk_id": i, "score": s} for i, s in ((1, 0.9), (2, 0.8), (3, 0.2))]
+    keyword = [{"chunk_id": i, "score": s} for i, s in ((3, 9.0), (4, 5.0), (2, 1.0))]
+    retriever = HybridRetriever(None)
+
+    only_vector = retriever._fuse([dict(d) for d in vector], [dict(d) for d in keyword], k=3, alpha=1.0, method=method)
+    assert [d["chunk_id"] for d in only_vector] == [1, 2, 3]
+    # k=2: under minmax/zscore the keyword leg's worst hit scores the same as an absent id
+    only_keyword = retriever._fuse([dict(d) for d in vector], [dict(d) for d in keyword], k=2, alpha=0.0, method=method)
+    assert [d["chunk_id"] for d in only_keyword] == [3, 4]
+    both = retriever._fuse([dict(d) for d in vector], [dict(d) for d in keyword], k=4, alpha=0.5, method=method)
+    assert sorted(d["chunk_id"] for d in both) == [1, 2, 3, 4]
+    assert [d["fusion_score"] for d in both] == sorted((d["fusion_score"] for d in both), reverse=True)
+
+
+@pytest.mark.parametrize("method", FUSION_METHODS)
+def test_hybrid_search_with_each_fusion_method(tmp_path, monkeypatch, method):
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings)
+    texts = add_corpus(store, 200)
+    retriever = HybridRetriever(store)
+
+    results = retriever.search(texts[31], k=5, fusion=method)
+    assert results[0]["chunk_id"] == 31  # first in both legs
+    assert len(results) == 5 and len({r["chunk_id"] for r in results}) == 5
+    with pytest.raises(ValueError):
+        retriever.search(texts[31], fusion="max")
+
+
+def test_maximal_marginal_relevance():
+    vectors = np.eye(4, dtype=np.float32)[[0, 0, 1, 2]]  # candidate 1 repeats candidate 0
+    relevance = np.array([1.0, 0.9, 0.6, 0.5])
+
+    assert maximal_marginal_relevance(relevance, vectors, 3, lambda_mult=0.5).tolist() == [0, 2, 3]
+    assert maximal_marginal_relevance(relevance, vectors, 3, lambda_mult=1.0).tolist() == [0, 1, 2]
+    assert maximal_marginal_relevance(relevance, vectors, 10).tolist() == [0, 2, 3, 1]
+    assert len(maximal_marginal_relevance(relevance, vectors, 0)) == 0
+
+
+def test_diversify_drops_repeated_chunk(tmp_path, monkeypatch):
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings)
+    texts = add_corpus(store, 20)
+    store.add_documents([texts[5]], [{"content": texts[5], "source": "copy.txt"}], dedup=False)  # chunk 20
+    retriever = HybridRetriever(store)
+    pool = [{"chunk_id": i, "fusion_score": s} for i, s in ((5, 1.0), (20, 0.95), (6, 0.9), (7, 0.85), (8, 0.0))]
+
+    assert [d["chunk_id"] for d in retriever.diversify(texts[5], pool, top_n=3, lambda_mult=0.5)] == [5, 6, 7]
+    assert [d["chunk_id"] for d in retriever.diversify(texts[5], pool, top_n=3, lambda_mult=1.0)] == [5, 20, 6]
+    assert retriever.diversify(texts[5], pool, top_n=5) is pool
+
+
+def test_link_batch():
+    links = link_batch(np.array([10, 11, 12, 13]), np.array([0, 0, 0, 1]), np.array([1, 1, 2, 1]))
+    assert links["prev"].tolist() == [-1, 10, 11, -1]
+    assert links["next"].tolist() == [11, 12, -1, -1]
+    assert links["parent"].tolist() == [10, 10, 12, 13]
+
+
+def paged_store(tmp_path, monkeypatch):
+    """a.pdf: chunks 0-7 over pages 1,1,1,2,2,2,2,3; b.pdf: chunks 8-10 on page 1. Every text is 7 chars."""
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings)
+    pages = [("a.pdf", p) for p in (1, 1, 1, 2, 2, 2, 2, 3)] + [("b.pdf", 1)] * 3
+    texts = [f"chunk{i:02d}" for i in range(len(pages))]
+    store.add_documents(texts, [{"content": t, "source": s, "page": p} for t, (s, p) in zip(texts, pages)])
+    return store, HybridRetriever(store)
+
+
+def hits(*chunk_ids):
+    return [{"chunk_id": i, "content": f"chunk{i:02d}"} for i in chunk_ids]
+
+
+def test_expand_context_window_and_parent(tmp_path, monkeypatch):
+    store, retriever = paged_store(tmp_path, monkeypatch)
+
+    docs = hits(4)
+    assert retriever.expand_context(docs, "window", window=1) == ["chunk03 chunk04 chunk05"]
+    assert docs[0]["context_chunk_ids"] == [3, 4, 5]
+    docs = hits(4)
+    assert retriever.expand_context(docs, "parent", max_chars=1000) == ["chunk03 chunk04 chunk05 chunk06"]
+    assert docs[0]["context_chunk_ids"] == [3, 4, 5, 6]
+
+    docs = hits(7, 8)  # the window stops at the document boundary
+    retriever.expand_context(docs, "window", window=2)
+    assert [d["context_chunk_ids"] for d in docs] == [[5, 6, 7], [8, 9, 10]]
+
+    docs = hits(4)
+    assert retriever.expand_context(docs, "off") == ["chunk04"] and "context_chunk_ids" not in docs[0]
+    monkeypatch.setattr(settings, "CONTEXT_EXPANSION", "off")
+    assert retriever.expand_context(hits(4)) == ["chunk04"]
+    with pytest.raises(ValueError):
+        retriever.expand_context(hits(4), "page")
+
+
+def test_expand_context_limits(tmp_path, monkeypatch):
+    store, retriever = paged_store(tmp_path, monkeypatch)
+
+    docs = hits(4)  # nearest first, both sides, while the text fits
+    assert retriever.expand_context(docs, "window", window=3, max_chars=23) == ["chunk03 chunk04 chunk05"]
+    docs = hits(4)
+    retriever.expand_context(docs, "parent", max_chars=31)
+    assert docs[0]["context_chunk_ids"] == [3, 4, 5, 6]
+
+    docs = hits(4, 5)  # a later hit does not repeat what an earlier one showed
+    assert retriever.expand_context(docs, "window", window=1) == ["chunk03 chunk04 chunk05", "chunk05 chunk06"]
+
+    store.delete_chunks([3, 9])
+    docs = hits(4, 9, 10)  # a deleted neighbour ends the walk; a deleted hit keeps its own text
+    assert retriever.expand_context(docs, "window", window=2) == ["chunk04 chunk05 chunk06", "chunk09", "chunk10"]
+    assert docs[0]["context_chunk_ids"] == [4, 5, 6] and "context_chunk_ids" not in docs[1]
+    assert docs[2]["context_chunk_ids"] == [10]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,353 @@
+import sys
+import os
+import hashlib
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import faiss
+import numpy as np
+import pytest
+
+from backend.core.config import settings
+from backend.engine import vector_store as vector_store_module
+
+
+class HashEmbeddings:
+    """Deterministic bag-of-words vectors, so the store can be exercised without a model."""
+
+    def _vector(self, text):
+        v = np.zeros(settings.EMBEDDING_DIM, dtype="float32")
+        for word in text.lower().split():
+            v[int(hashlib.md5(word.encode()).hexdigest(), 16) % len(v)] += 1.0
+        return (v / max(np.linalg.norm(v), 1e-9)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class RandomEmbeddings(HashEmbeddings):
+    """Gaussian unit vectors seeded by the text: no score ties, so rankings are well defined."""
+
+    def _vector(self, text):
+        seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+        v = np.random.default_rng(seed).standard_normal(settings.EMBEDDING_DIM).astype("float32")
+        return (v / np.linalg.norm(v)).tolist()
+
+
+def open_store(tmp_path, monkeypatch, embeddings=HashEmbeddings, **config):
+    """A store in tmp_path with fake embeddings and the given settings overridden."""
+    for name, value in config.items():
+        monkeypatch.setattr(settings, name, value)
+    monkeypatch.setattr(vector_store_module, "get_embeddings", embeddings)
+    monkeypatch.setattr(vector_store_module, "get_chunk_cache", lambda: None)
+    return vector_store_module.VectorStore(str(tmp_path / "store"))
+
+
+def add_corpus(store, n, n_sources=10, start=0):
+    """n chunks, each with a unique word `doc<i>`, from sources s<i % n_sources>.txt."""
+    numbers = range(start, start + n)
+    texts = [f"doc{i} topic{i % 7} shared words about subject{i % 13}" for i in numbers]
+    store.add_documents(texts, [{"content": t, "source": f"s{i % n_sources}.txt"} for i, t in zip(numbers, texts)])
+    return texts
+
+
+def exact_top_k(store, query, k):
+    """Chunk ids and scores of a brute-force scan over the vectors the index serves."""
+    rows, vectors = store.indexed_vectors()
+    scores = vectors @ store.embed_query(query)
+    top = np.argsort(-scores)[:k]
+    return store.ids.chunk[rows[top]].tolist(), scores[top]
+
+
+def test_sqlite_keyword_store_in_new_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "KEYWORD_BACKEND", "sqlite")
+    monkeypatch.setattr(vector_store_module, "get_embeddings", HashEmbeddings)
+    monkeypatch.setattr(vector_store_module, "get_chunk_cache", lambda: None)
+    path = str(tmp_path / "store" / "gen-1")  # does not exist yet
+
+    store = vector_store_module.VectorStore(path)
+    texts = ["postgres replication lag", "faiss index shards", "sqlite full text search"]
+    store.add_documents(texts, [{"content": t, "source": "a.txt"} for t in texts])
+
+    assert os.path.exists(os.path.join(path, "bm25.sqlite"))
+    rows, _ = store.keywords.top_k(store.keywords.analyzer("sqlite search"), 1)
+    assert rows.tolist() == [2]
+    assert vector_store_module.VectorStore(path).keywords.n_docs == 3
+
+
+def test_filtered_duplicate_reported_under_matching_source(tmp_path, monkeypatch):
+    from backend.engine.retriever import HybridRetriever
+
+    monkeypatch.setattr(settings, "DEDUP_ENABLED", True)
+    monkeypatch.setattr(vector_store_module, "get_embeddings", HashEmbeddings)
+    monkeypatch.setattr(vector_store_module, "get_chunk_cache", lambda: None)
+    store = vector_store_module.VectorStore(str(tmp_path / "store"))
+    for source in ("a.pdf", "b.pdf"):
+        texts = ["shared confidentiality footer", f"{source} specific body text"]
+        store.add_documents(texts, [{"content": t, "source": source, "page": 3} for t in texts])
+
+    retriever = HybridRetriever(store)
+    for leg in (store.search("confidentiality footer", k=1, filters={"source": ["b.pdf"]}),
+                retriever.keyword_search_many(["confidentiality footer"], 1, {"source": ["b.pdf"]})[0],
+                retriever.search("confidentiality footer", k=1, filters={"source": ["b.pdf"]})):
+        assert leg[0]["source"] == "b.pdf"
+        assert [d["source"] for d in leg[0]["duplicates"]] == ["a.pdf"]
+    assert store.search("confidentiality footer", k=1)[0]["source"] == "a.pdf"
+
+
+def test_publish_keeps_generation_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_PATH", str(tmp_path))
+
+    with vector_store_module.generation_lock():
+        for _ in range(2):  # the second publish clears out the root-level layout
+            path = vector_store_module.next_store_path()
+            vector_store_module.publish_store_path(path)
+        assert os.path.exists(tmp_path / "generation.lock")
+    assert vector_store_module.active_store_path() == path
+
+
+
+def test_pq_flat_index_search_after_delete(tmp_path, monkeypatch):
+    from backend.engine import index_factory
+
+    monkeypatch.setattr(index_factory, "_PQ_MIN_TRAIN", 256)
+    store = open_store(tmp_path, monkeypatch, VECTOR_INDEX_TYPE="flat", VECTOR_QUANTIZATION="pq",
+                       PQ_M=8, DEDUP_ENABLED=True, DEDUP_NEAR_THRESHOLD=2.0)
+    add_corpus(store, 600)
+    store.save()
+    assert index_factory.index_quantization(store.shards[0]) == "pq"
+
+    assert store.delete_by_source("s3.txt") == 60
+    results = store.search("doc13 topic6 subject0", k=5)
+    assert results and all(r["source"] != "s3.txt" for r in results)
+    assert store.search("doc14 topic0 subject1", k=1)[0]["content"].startswith("doc14 ")
+    store.add_documents(["doc600 a new chunk"], [{"content": "doc600 a new chunk", "source": "new.txt"}])
+    assert store.search("doc600 new chunk", k=1)[0]["source"] == "new.txt"
+
+
+def test_shard_of_balance_and_stability():
+    import subprocess
+    from collections import Counter
+
+    for pattern in ("doc{}.pdf", "{}.txt", "report_{:03d}.docx"):
+        counts = Counter(vector_store_module.shard_of(pattern.format(i), 8) for i in range(200))
+        assert len(counts) == 8 and 0.5 * 25 <= min(counts.values()) <= max(counts.values()) <= 1.5 * 25
+
+    names = [f"doc{i}.pdf" for i in range(20)]
+    here = [vector_store_module.shard_of(name, 4) for name in names]
+    code = ("import sys; from backend.engine.vector_store import shard_of; "
+            f"print([shard_of(n, 4) for n in {names!r}])")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for seed in ("1", "2"):
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+                             env={**os.environ, "PYTHONHASHSEED": seed}, check=True).stdout
+        assert out.strip() == str(here)
+
+
+def test_shards_partitioned_by_another_hash_are_rebuilt(tmp_path, monkeypatch):
+    import zlib
+
+    shard_of = vector_store_module.shard_of
+    monkeypatch.setattr(vector_store_module, "shard_of", lambda name, n: zlib.crc32(name.encode()) % n)
+    store = open_store(tmp_path, monkeypatch, VECTOR_SHARDS=4)
+    add_corpus(store, 200)
+    store.save()
+    monkeypatch.setattr(vector_store_module, "shard_of", shard_of)
+    manifest_path = os.path.join(store.path, "manifest.json")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    del manifest["shard_hash"]  # written before the hash was recorded
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+    reopened = vector_store_module.VectorStore(store.path)
+    sources = reopened.metadata.strings("source")
+    for s, index in enumerate(reopened.shards):
+        rows = faiss.vector_to_array(index.id_map)
+        codes = reopened.metadata.column("source")[rows]
+        assert {vector_store_module.shard_of(sources[c], 4) for c in codes} <= {s}
+    results = reopened.search("doc42 topic0", k=3, filters={"source": "s2.txt"})
+    assert results[0]["content"].startswith("doc42 ")
+
+
+def test_indexed_vectors_skip_deleted_and_collapsed_rows(tmp_path, monkeypatch):
+    store = open_store(tmp_path, monkeypatch, DEDUP_ENABLED=True)
+    add_corpus(store, 20, n_sources=4)
+    store.add_documents(["doc3 topic3 shared words about subject3"],
+                        [{"content": "doc3 topic3 shared words about subject3", "source": "copy.txt"}])
+    store.delete_by_source("s1.txt")
+
+    rows, vectors = store.indexed_vectors()
+    assert rows.tolist() == [i for i in range(20) if i % 4 != 1]
+    assert np.allclose(vectors, HashEmbeddings().embed_documents([f"doc{i} topic{i % 7} shared words about "
+                                                                 f"subject{i % 13}" for i in rows]))
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+def test_index_types_return_exact_neighbours(tmp_path, monkeypatch, kind):
+    from backend.engine.index_factory import index_kind
+
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings, VECTOR_INDEX_TYPE=kind)
+    add_corpus(store, 1000)
+    store.save()
+    assert index_kind(store.shards[0]) == kind
+
+    for q in range(10):
+        query = f"question {q}"
+        expected, scores = exact_top_k(store, query, 5)
+        results = store.search(query, k=5, ef_search=512, nprobe=64)  # exhaustive settings
+        assert [r["chunk_id"] for r in results] == expected
+        assert np.allclose([r["score"] for r in results], scores, atol=1e-5)
+
+
+def test_auto_index_type_follows_corpus_size(tmp_path, monkeypatch):
+    from backend.engine.index_factory import index_kind
+
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings, VECTOR_INDEX_TYPE="auto",
+                       VECTOR_INDEX_AUTO_TYPE="hnsw", VECTOR_INDEX_AUTO_THRESHOLD=300)
+    add_corpus(store, 200)
+    store.save()
+    assert index_kind(store.shards[0]) == "flat"
+    add_corpus(store, 200, start=200)
+    store.save()
+    assert index_kind(store.shards[0]) == "hnsw"
+    assert store.search("doc7 topic0 shared words about subject7", k=1)[0]["chunk_id"] == 7
+
+
+@pytest.mark.parametrize("quantization", ["fp16", "sq8", "pq"])
+@pytest.mark.parametrize("kind", ["flat", "ivf"])  # exhaustive here; random vectors give HNSW no locality
+def test_quantized_indexes_rescore_exactly(tmp_path, monkeypatch, kind, quantization):
+    from backend.engine import index_factory
+
+    monkeypatch.setattr(index_factory, "_PQ_MIN_TRAIN", 256)
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings, VECTOR_INDEX_TYPE=kind,
+                       VECTOR_QUANTIZATION=quantization, PQ_M=48)
+    texts = add_corpus(store, 600)
+    store.save()
+    assert index_factory.index_quantization(store.shards[0]) == quantization
+
+    for i in range(0, 600, 60):
+        results = store.search(texts[i], k=5, nprobe=64)
+        assert results[0]["chunk_id"] == i
+        # Scores come from the float32 log, not the codes
+        vectors = store.chunk_vectors([r["chunk_id"] for r in results])
+        assert np.allclose([r["score"] for r in results], vectors @ store.embed_query(texts[i]), atol=1e-5)
+    if quantization != "pq":  # PQ codes are too coarse to promise the exact top-5
+        for q in range(5):
+            expected, _ = exact_top_k(store, f"question {q}", 5)
+            assert [r["chunk_id"] for r in store.search(f"question {q}", k=5, nprobe=64)] == expected
+
+
+def test_binary_first_pass_rescores_and_skips_deleted(tmp_path, monkeypatch):
+    from backend.engine.index_factory import index_quantization
+
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings, VECTOR_QUANTIZATION="binary",
+                       VECTOR_BINARY_CANDIDATES=50)
+    texts = add_corpus(store, 600)
+    store.save()
+    assert index_quantization(store.shards[0]) == "binary"
+
+    results = store.search(texts[42], k=5)
+    assert results[0]["chunk_id"] == 42 and abs(results[0]["score"] - 1.0) < 1e-5
+    vectors = store.chunk_vectors([r["chunk_id"] for r in results])
+    assert np.allclose([r["score"] for r in results], vectors @ store.embed_query(texts[42]), atol=1e-5)
+
+    store.delete_by_source("s2.txt")  # row 42 is in s2.txt
+    assert all(r["source"] != "s2.txt" for r in store.search(texts[42], k=5))
+    assert store.search(texts[43], k=1)[0]["chunk_id"] == 43
+
+
+def wait_for_merge(store):
+    if store._merge_thread is not None:
+        store._merge_thread.join()
+
+
+def test_deletes_tombstone_then_compact(tmp_path, monkeypatch):
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings, VECTOR_COMPACT_RATIO=0.25)
+    texts = add_corpus(store, 300)
+    store.save()
+    texts += add_corpus(store, 50, start=300)  # rows 300.. stay in the delta
+
+    assert store.delete_by_source("s3.txt") == 35
+    assert store.delete_chunks([4, 304]) == 2
+    assert store.delete_by_source("s3.txt") == 0
+    gone = {i for i in range(350) if i % 10 == 3} | {4, 304}
+    for i in (3, 4, 303, 304):
+        assert store.search(texts[i], k=1)[0]["chunk_id"] != i
+    assert store.search(texts[5], k=1)[0]["chunk_id"] == 5
+    wait_for_merge(store)
+    assert store.shards[0].ntotal == 300  # below VECTOR_COMPACT_RATIO: vectors still in the shard
+
+    store.delete_by_source("s5.txt")
+    store.delete_by_source("s7.txt")
+    wait_for_merge(store)
+    gone |= {i for i in range(350) if i % 10 in (5, 7)}
+    assert store.shards[0].ntotal == 350 - len(gone)  # rebuilt live rows only, the delta folded in
+    assert store.checkpoint == 350 and store.delta.ntotal == 0
+
+    reopened = vector_store_module.VectorStore(store.path)
+    assert set(np.flatnonzero(reopened.deleted).tolist()) == gone
+    hits = {r["chunk_id"] for i in range(0, 350, 7) for r in reopened.search(texts[i], k=3)}
+    assert not hits & gone
+    assert reopened.search(texts[306], k=1)[0]["chunk_id"] == 306
+
+
+def test_sharded_search_matches_one_shard_and_survives_resharding(tmp_path, monkeypatch):
+    single = open_store(tmp_path / "one", monkeypatch, RandomEmbeddings, VECTOR_SHARDS=1)
+    add_corpus(single, 400, n_sources=25)
+    single.save()
+    monkeypatch.setattr(settings, "VECTOR_SHARDS", 4)
+    sharded = vector_store_module.VectorStore(str(tmp_path / "four"))
+    add_corpus(sharded, 400, n_sources=25)
+    sharded.save()
+
+    sources = sharded.metadata.strings("source")
+    assert all(index.ntotal for index in sharded.shards)
+    for s, index in enumerate(sharded.shards):
+        rows = faiss.vector_to_array(index.id_map)
+        assert {vector_store_module.shard_of(sources[c], 4) for c in sharded.metadata.column("source")[rows]} == {s}
+
+    queries = [f"question {q}" for q in range(8)]
+    expected = [[r["chunk_id"] for r in hits] for hits in single.search_many(queries, k=5)]
+    assert [[r["chunk_id"] for r in hits] for hits in sharded.search_many(queries, k=5)] == expected
+
+    monkeypatch.setattr(settings, "VECTOR_SHARDS", 2)
+    resharded = vector_store_module.VectorStore(sharded.path)
+    assert len(resharded.shards) == 2 and sum(index.ntotal for index in resharded.shards) == 400
+    assert [[r["chunk_id"] for r in hits] for hits in resharded.search_many(queries, k=5)] == expected
+
+    # A source filter only searches the shards that source hashes to
+    monkeypatch.setattr(vector_store_module, "_EXACT_FILTER_ROWS", 0)
+    filtered = resharded.search("question 0", k=3, filters={"source": "s7.txt"})
+    in_source = [i for i in range(400) if i % 25 == 7]
+    scores = single.chunk_vectors(in_source) @ single.embed_query("question 0")
+    assert [r["chunk_id"] for r in filtered] == [in_source[i] for i in np.argsort(-scores)[:3]]
+
+
+def test_appends_persist_and_merge_past_the_delta_limit(tmp_path, monkeypatch):
+    store = open_store(tmp_path, monkeypatch, RandomEmbeddings, VECTOR_DELTA_MERGE_ROWS=100)
+    texts = add_corpus(store, 60)
+    assert (store.checkpoint, store.delta.ntotal) == (0, 60)
+
+    reopened = vector_store_module.VectorStore(store.path)  # no save(): rows come back from the logs
+    assert reopened.count == 60 and reopened.search(texts[17], k=1)[0]["chunk_id"] == 17
+
+    texts += add_corpus(reopened, 60, start=60)
+    wait_for_merge(reopened)
+    assert (reopened.checkpoint, reopened.delta.ntotal, reopened.shards[0].ntotal) == (120, 0, 120)
+
+    with open(os.path.join(store.path, "vectors.f32"), "ab") as f:
+        f.write(b"\0" * 4 * settings.EMBEDDING_DIM * 3)  # a torn append the manifest never committed
+    recovered = vector_store_module.VectorStore(store.path)
+    assert recovered.count == 120
+    assert os.path.getsize(os.path.join(store.path, "vectors.f32")) == 120 * 4 * settings.EMBEDDING_DIM
+    assert recovered.search(texts[99], k=1)[0]["chunk_id"] == 99
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
+
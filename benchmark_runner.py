@@ -438,7 +438,7 @@ def main() -> None:
     print("\nBuilding pipeline (retriever + reranker) ...", flush=True)
     retriever = HybridRetriever(vs)
     reranker  = Reranker()
-    print(f"  BM25 corpus : {len(retriever.documents):,} docs")
+    print(f"  BM25 corpus : {retriever.corpus_size:,} docs")
 
     # Run benchmark
     print(f"\n-- Running {len(questions)} questions " + "-" * 35)
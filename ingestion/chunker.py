@@ -36,12 +36,20 @@ class SemanticChunker:
         """
         Splits documents into smaller chunks while preserving metadata.
         Uses spaCy sentence segmentation.
+        Chunks come out in reading order, and each records `section`: the
+        position of its loader document (PDF page, DOCX section, text file)
+        within its source. The vector store links consecutive chunks and
+        their section from these for small-to-big retrieval.
         """
         chunked_docs = []
+        sections: Dict[Any, int] = {}
 
         for doc in documents:
             text = doc.get('content', '')
             base_metadata = doc.get('metadata', {})
+            source = base_metadata.get('source')
+            sections[source] = sections.get(source, -1) + 1
+            base_metadata = {**base_metadata, 'section': sections[source]}
             
             sentences = self._sentences_from_text(text)
             
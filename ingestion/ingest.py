@@ -1,7 +1,7 @@
 import os
 import sys
 import glob
-from typing import List
+from typing import List, Optional
 
 # Ensure project root in path to allow imports from backend and ingestion
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -20,7 +20,7 @@ LOADERS = {
     '.txt': TXTLoader
 }
 
-def ingest_data_directory(data_dir: str = "data"):
+def ingest_data_directory(data_dir: str = "data", store_path: Optional[str] = None):
     print(f"Starting ingestion from: {data_dir}")
     
     # 1. Gather files
@@ -59,7 +59,7 @@ def ingest_data_directory(data_dir: str = "data"):
 
     # 4. Embed and Store
     print("Embedding and Storing in Vector Store...")
-    vector_store = VectorStore()
+    vector_store = VectorStore(store_path)
     
     texts = [d['content'] for d in chunked_docs]
     metadatas = []
@@ -75,6 +75,7 @@ def ingest_data_directory(data_dir: str = "data"):
         
     vector_store.add_documents(texts, metadatas)
     print("Ingestion Complete!")
+    return vector_store
 
 if __name__ == "__main__":
     # Ensure project root in path if run directly
@@ -232,8 +232,8 @@ def main() -> None:
     vs        = VectorStore()
     retriever = HybridRetriever(vs)
     reranker  = Reranker()
-    print(f"  Vector store : {vs.index.ntotal if vs.index else 0:,} vectors")
-    print(f"  BM25 corpus  : {len(retriever.documents):,} docs")
+    print(f"  Vector store : {vs.count:,} chunks")
+    print(f"  BM25 corpus  : {retriever.corpus_size:,} docs")
 
     # -- Re-run retrieval to get contexts ------------------------------------
     print(f"\n[3/4] Retrieving contexts for {len(rows)} questions ...")